@@ -1,7 +1,20 @@
+"""
+Pins the readings of a few demo properties to values that suit one customer profile each.
+Rewrites the realtime partitions and the latest historical averages, then rebuilds what is
+derived from them in the database (10-minute buckets and annual match counters).
+A running server keeps its latest values, comfort scores and ETags in memory and does not see
+these writes: restart it afterwards (it rebuilds them from the database on startup).
+"""
 from datetime import date
 
+from sqlalchemy import update
+
+from comfort_evaluator import ComfortEvaluator
 from database import SessionLocal
-from models import RealtimeReading, HistoricalReading, SensorType
+from match_counters import rebuild_profile_sensor
+from models import HistoricalReading, SensorType
+from realtime_partitions import partition_days, partition_table
+from rollups import rebuild_day_buckets
 
 # Desired comfort alignment per property
 TARGET_VALUES = {
@@ -41,17 +54,17 @@ def apply_values():
     try:
         for property_id, sensors in TARGET_VALUES.items():
             for sensor_type, target_value in sensors.items():
-                # Update realtime readings
-                realtime_rows = (
-                    session.query(RealtimeReading)
-                    .filter(
-                        RealtimeReading.property_id == property_id,
-                        RealtimeReading.sensor_type == sensor_type,
+                # Update realtime readings in every day partition
+                for day in partition_days(session):
+                    partition = partition_table(day)
+                    session.execute(
+                        update(partition)
+                        .where(
+                            partition.c.property_id == property_id,
+                            partition.c.sensor_type == sensor_type,
+                        )
+                        .values(value=target_value)
                     )
-                    .all()
-                )
-                for row in realtime_rows:
-                    row.value = target_value
 
                 # Update recent historical readings (latest 7 entries)
                 historical_rows = (
@@ -67,8 +80,20 @@ def apply_values():
                 for row in historical_rows:
                     row.avg_value = target_value
 
+        # Derived data would otherwise keep the old values: the 10-minute buckets behind the
+        # 24-hour history and the in-range counters of the annual match
+        for day in partition_days(session):
+            rebuild_day_buckets(session, day)
+        session.flush()
+        adjusted_sensors = {sensor_type for sensors in TARGET_VALUES.values() for sensor_type in sensors}
+        for profile, profile_data in ComfortEvaluator.PROFILES.items():
+            for sensor_type, pref in profile_data["sensors"].items():
+                if sensor_type in adjusted_sensors:
+                    rebuild_profile_sensor(session, profile, sensor_type, pref)
+
         session.commit()
         print("Comfort data adjusted successfully.")
+        print("Restart the server so it reloads latest values and comfort scores from the database.")
     finally:
         session.close()
 
@@ -0,0 +1,322 @@
+"""
+Benchmark suite for the API hot paths and ComfortEvaluator at fleet scale.
+Builds a throwaway database of --properties properties with --days days of historical daily
+averages and --readings-per-day realtime readings per property (today and yesterday, with
+yesterday migrated so the rollup tiers are filled), then times the API routes through the
+FastAPI TestClient and ComfortEvaluator.evaluate_property_comfort directly. The overhead of the
+metrics instrumentation is measured by timing a no-op ASGI app with and without
+RequestMetricsMiddleware.
+
+Results are written as JSON; with --baseline each benchmark's median is compared against a
+previous run and the exit status is 1 if any regressed by more than --tolerance.
+
+Usage:
+    python benchmark.py --properties 200 --days 365 --readings-per-day 2000 --json results.json
+    python benchmark.py --json new.json --baseline results.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--properties", type=int, default=100)
+parser.add_argument("--days", type=int, default=365, help="days of historical daily averages per property")
+parser.add_argument("--readings-per-day", type=int, default=1000, help="realtime readings per property per day")
+parser.add_argument("--iterations", type=int, default=50, help="timed calls per benchmark")
+parser.add_argument("--warmup", type=int, default=5, help="untimed calls per benchmark")
+parser.add_argument("--only", action="append", help="run only benchmarks whose name contains this (repeatable)")
+parser.add_argument("--json", help="write results to this file")
+parser.add_argument("--baseline", help="compare medians against this results file")
+parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown of the median")
+parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+args = parser.parse_args()
+
+# Point the app at a temporary database before anything opens the real one
+_tmp_dir = tempfile.mkdtemp(prefix="benchmark_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'benchmark.db')}"
+
+import numpy as np  # noqa: E402
+import sqlalchemy  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert, text  # noqa: E402
+
+from database import engine, SessionLocal  # noqa: E402
+from models import Property, HistoricalReading, SensorType  # noqa: E402
+import main  # noqa: E402  (creates the tables and runs migrations)
+from comfort_cache import comfort_cache  # noqa: E402
+from comfort_evaluator import ComfortEvaluator  # noqa: E402
+from data_aggregator import aggregator  # noqa: E402
+from ingest import write_readings  # noqa: E402
+from match_counters import sync_match_counters  # noqa: E402
+from metrics import RequestMetricsMiddleware  # noqa: E402
+from rollups import GMT_PLUS_8, day_bounds  # noqa: E402
+
+SENSORS = list(SensorType)
+INSERT_CHUNK = 50000
+# Requests per timed call of the middleware overhead benchmarks
+ASGI_CALLS = 1000
+BARE_ASGI = f"ASGI no-op app x{ASGI_CALLS}"
+INSTRUMENTED_ASGI = f"ASGI no-op app x{ASGI_CALLS} + RequestMetricsMiddleware"
+
+
+class Benchmark(NamedTuple):
+    name: str
+    call: Callable[[int], None]
+    setup: Optional[Callable[[int], None]] = None  # Runs untimed before every call, warm-ups included
+
+
+def seed():
+    """Bulk-load properties, historical averages and two days of realtime readings"""
+    rng = np.random.default_rng(42)
+    today = datetime.now(GMT_PLUS_8).date()
+    property_ids = list(range(1, args.properties + 1))
+    db = SessionLocal()
+    try:
+        db.execute(insert(Property), [
+            {"id": property_id, "name": f"Property {property_id}", "address": "", "description": "", "image_url": ""}
+            for property_id in property_ids
+        ])
+        db.commit()
+
+        rows = []
+        for property_id in property_ids:
+            values = rng.normal(loc=[22, 50, 500, 45, 8], scale=[2, 5, 150, 5, 3], size=(args.days, len(SENSORS)))
+            for day in range(args.days):
+                for sensor_index, sensor_type in enumerate(SENSORS):
+                    rows.append({
+                        "property_id": property_id,
+                        "date": today - timedelta(days=day + 1),
+                        "sensor_type": sensor_type,
+                        "avg_value": round(float(values[day, sensor_index]), 2),
+                    })
+            if len(rows) >= INSERT_CHUNK:
+                db.execute(insert(HistoricalReading), rows)
+                rows = []
+        if rows:
+            db.execute(insert(HistoricalReading), rows)
+        db.commit()
+
+        # Readings spread over yesterday and over today up to now
+        now = datetime.now(GMT_PLUS_8)
+        for day_start, span in (
+            (day_bounds(today - timedelta(days=1))[0], 86400.0),
+            (day_bounds(today)[0], max((now - day_bounds(today)[0]).total_seconds(), 1.0)),
+        ):
+            for offset in range(0, len(property_ids), 50):
+                chunk = property_ids[offset:offset + 50]
+                count = len(chunk) * args.readings_per_day
+                seconds = rng.uniform(0, span, size=count)
+                sensors = rng.integers(0, len(SENSORS), size=count)
+                values = rng.normal(40, 10, size=count).round(2)
+                owners = np.repeat(chunk, args.readings_per_day)
+                write_readings(db, [
+                    (property_id, SENSORS[sensor_index], value, day_start + timedelta(seconds=second))
+                    for property_id, sensor_index, value, second in zip(
+                        owners.tolist(), sensors.tolist(), values.tolist(), seconds.tolist()
+                    )
+                ])
+
+        sync_match_counters(db, ComfortEvaluator.PROFILES)
+        db.commit()
+    finally:
+        db.close()
+
+    # Migrate yesterday so the historical day and the rollup tiers are filled as in production
+    asyncio.run(aggregator.migrate_previous_day_to_historical(today - timedelta(days=1)))
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "iterations": len(samples),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def run_benchmark(benchmark: Benchmark):
+    """Time `call(iteration)` after the warm-up calls"""
+    for iteration in range(args.warmup):
+        if benchmark.setup is not None:
+            benchmark.setup(iteration)
+        benchmark.call(iteration)
+    samples = []
+    for iteration in range(args.iterations):
+        if benchmark.setup is not None:
+            benchmark.setup(iteration)
+        started = time.perf_counter()
+        benchmark.call(iteration)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def asgi_calls(app):
+    """Benchmark call driving ASGI_CALLS requests straight through an ASGI app, without HTTP or a client"""
+    loop = asyncio.new_event_loop()
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    async def run():
+        for _ in range(ASGI_CALLS):
+            await app(dict(scope), receive, send)
+
+    return lambda iteration: loop.run_until_complete(run())
+
+
+def benchmarks():
+    """
+    Calls rotate over properties and profiles so no single key is hot. Routes served from the
+    comfort cache are measured twice: cold (the cache is cleared before every call) and warm (the
+    same call is made untimed just before, so the timed one is a cache hit). The client never
+    sends If-None-Match, so no call is answered with a 304.
+    """
+    client = TestClient(main.app)
+    profiles = list(ComfortEvaluator.PROFILES.keys())
+    range_start = f"{datetime.now(GMT_PLUS_8).date() - timedelta(days=7)}T00:00:00"
+
+    def property_id(iteration):
+        return iteration % args.properties + 1
+
+    def get(path, **params):
+        response = client.get(path, params=params)
+        response.raise_for_status()
+
+    def evaluate(iteration):
+        db = SessionLocal()
+        try:
+            ComfortEvaluator.evaluate_property_comfort(db, property_id(iteration), profiles[iteration % len(profiles)])
+        finally:
+            db.close()
+
+    def properties(iteration):
+        get("/properties", customer_type=profiles[iteration % len(profiles)])
+
+    def comfort(iteration):
+        get(f"/properties/{property_id(iteration)}/comfort", customer_type=profiles[iteration % len(profiles)])
+
+    def clear_comfort_cache(iteration):
+        comfort_cache.clear()
+
+    return [
+        Benchmark("GET /properties (cold cache)", properties, clear_comfort_cache),
+        Benchmark("GET /properties (warm cache)", properties, properties),
+        Benchmark("GET /properties/{id}/comfort (cold cache)", comfort, clear_comfort_cache),
+        Benchmark("GET /properties/{id}/comfort (warm cache)", comfort, comfort),
+        Benchmark("GET /properties/{id}/latest", lambda i: get(f"/properties/{property_id(i)}/latest")),
+        Benchmark("GET /properties/{id}/history/24hour", lambda i: get(f"/properties/{property_id(i)}/history/24hour")),
+        Benchmark("GET /properties/{id}/history/24hour?format=columnar", lambda i: get(
+            f"/properties/{property_id(i)}/history/24hour", format="columnar"
+        )),
+        Benchmark("GET /properties/{id}/history/monthly", lambda i: get(f"/properties/{property_id(i)}/history/monthly")),
+        Benchmark("GET /properties/{id}/history/yearly", lambda i: get(f"/properties/{property_id(i)}/history/yearly")),
+        Benchmark("GET /properties/{id}/history/yearly?format=columnar", lambda i: get(
+            f"/properties/{property_id(i)}/history/yearly", format="columnar"
+        )),
+        Benchmark("GET /properties/{id}/history/range (7 days, hourly)", lambda i: get(
+            f"/properties/{property_id(i)}/history/range", start=range_start, resolution=60
+        )),
+        Benchmark("ComfortEvaluator.evaluate_property_comfort", evaluate),
+        Benchmark("GET /metrics", lambda i: get("/metrics")),
+        Benchmark(BARE_ASGI, asgi_calls(noop_app)),
+        Benchmark(INSTRUMENTED_ASGI, asgi_calls(RequestMetricsMiddleware(noop_app))),
+    ]
+
+
+def compare(results, baseline_path):
+    """Print median changes against a baseline file and return the names that regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\nCompared with {baseline_path} (tolerance {args.tolerance:.0%}, noise floor {args.min_delta_ms} ms):")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"  new   {name}")
+            continue
+        delta = result["median_ms"] - before["median_ms"]
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        regressed = ratio > 1 + args.tolerance and delta > args.min_delta_ms
+        if regressed:
+            regressions.append(name)
+        status = "SLOWER" if regressed else "ok"
+        print(f"  {status:6s}{name}: {before['median_ms']:.3f} -> {result['median_ms']:.3f} ms ({ratio - 1:+.0%})")
+    return regressions
+
+
+def main_benchmark() -> int:
+    started = time.perf_counter()
+    seed()
+    print(
+        f"Seeded {args.properties} properties x {args.days} days of history x "
+        f"{args.readings_per_day} readings/day in {time.perf_counter() - started:.1f}s"
+    )
+
+    results = {}
+    for benchmark in benchmarks():
+        name = benchmark.name
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+        results[name] = run_benchmark(benchmark)
+        result = results[name]
+        print(f"{name:55s} median {result['median_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms")
+
+    overhead_us = None
+    if BARE_ASGI in results and INSTRUMENTED_ASGI in results:
+        overhead_us = round(
+            (results[INSTRUMENTED_ASGI]["median_ms"] - results[BARE_ASGI]["median_ms"]) * 1000 / ASGI_CALLS, 3
+        )
+        print(f"\nMetrics middleware overhead: {overhead_us} us per request")
+
+    output = {
+        "meta": {
+            "properties": args.properties,
+            "days": args.days,
+            "readings_per_day": args.readings_per_day,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+            "timestamp": datetime.now(GMT_PLUS_8).isoformat(),
+        },
+        "results": results,
+        "metrics_overhead_us_per_request": overhead_us,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
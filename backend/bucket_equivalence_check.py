@@ -0,0 +1,129 @@
+"""
+Equivalence check for the 10-minute bucket rollup behind /history/24hour.
+Writes random readings for a few properties into a throwaway database in several ingest
+batches (so buckets are merged by upsert_buckets), including readings on interval boundaries
+and just before midnight, and compares `day_bucket_averages` with the original implementation:
+one AVG query over the raw readings per sensor and 10-minute interval. The comparison is
+repeated after `rebuild_day_buckets` recomputes the buckets from the raw partition. Exits
+non-zero if any interval differs.
+
+Usage:
+    python bucket_equivalence_check.py [--properties 3] [--readings 5000] [--seed 7]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--properties", type=int, default=3)
+parser.add_argument("--readings", type=int, default=5000, help="random readings per property")
+parser.add_argument("--batches", type=int, default=7, help="ingest batches the readings are split into")
+parser.add_argument("--seed", type=int, default=7)
+args = parser.parse_args()
+
+# Point the app at a temporary database before anything opens the real one
+_tmp_dir = tempfile.mkdtemp(prefix="bucket_equivalence_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bucket_check.db')}"
+
+from sqlalchemy import func  # noqa: E402
+
+from database import Base, engine, SessionLocal  # noqa: E402
+from models import SensorType  # noqa: E402
+from ingest import write_readings  # noqa: E402
+from realtime_partitions import partition_table  # noqa: E402
+from rollups import BUCKETS_PER_DAY, BUCKET_MINUTES, GMT_PLUS_8, day_bounds, day_bucket_averages, rebuild_day_buckets  # noqa: E402
+
+# Rounded averages may differ by one step of the last digit: the buckets sum each batch
+# separately, so the floating point additions happen in a different order than in AVG
+TOLERANCE = 0.01 + 1e-9
+
+
+def per_interval_averages(db, property_id, target_date):
+    """The original implementation: one AVG query over the raw readings per sensor and interval"""
+    readings = partition_table(target_date)
+    start_of_day, _ = day_bounds(target_date)
+    grouped_data = {}
+    for sensor_type in SensorType:
+        interval_data = []
+        for interval_index in range(BUCKETS_PER_DAY):
+            start_time = start_of_day + timedelta(minutes=interval_index * BUCKET_MINUTES)
+            end_time = start_time + timedelta(minutes=BUCKET_MINUTES)
+            avg_value = db.query(func.avg(readings.c.value)).filter(
+                readings.c.property_id == property_id,
+                readings.c.sensor_type == sensor_type,
+                readings.c.timestamp >= start_time,
+                readings.c.timestamp < end_time
+            ).scalar()
+            interval_data.append({
+                "time": interval_index / 6.0,
+                "value": round(avg_value, 2) if avg_value is not None else None,
+            })
+        grouped_data[sensor_type.value] = interval_data
+    return grouped_data
+
+
+def seed(db, target_date):
+    rng = random.Random(args.seed)
+    start_of_day, end_of_day = day_bounds(target_date)
+    readings = []
+    for property_id in range(1, args.properties + 1):
+        for _ in range(args.readings):
+            offset = timedelta(seconds=rng.uniform(0, 86400 - 1e-3))
+            readings.append((property_id, rng.choice(list(SensorType)), round(rng.uniform(0, 1000), 2), start_of_day + offset))
+        # Interval boundaries belong to the interval they start
+        for interval_index in range(0, BUCKETS_PER_DAY, 7):
+            boundary = start_of_day + timedelta(minutes=interval_index * BUCKET_MINUTES)
+            readings.append((property_id, SensorType.SOUND, 50.0 + interval_index, boundary))
+            readings.append((property_id, SensorType.SOUND, 10.0, boundary - timedelta(microseconds=1)))
+        readings.append((property_id, SensorType.LIGHT, 123.45, end_of_day - timedelta(microseconds=1)))
+
+    rng.shuffle(readings)
+    # Readings before the day's start land in the previous day's partition, not in this check
+    readings = [reading for reading in readings if reading[3] >= start_of_day]
+    size = len(readings) // args.batches + 1
+    for offset in range(0, len(readings), size):
+        write_readings(db, readings[offset:offset + size])
+    return len(readings)
+
+
+def compare(db, target_date, label):
+    mismatches = 0
+    for property_id in range(1, args.properties + 1):
+        expected = per_interval_averages(db, property_id, target_date)
+        actual = day_bucket_averages(db, property_id, target_date)
+        for sensor_type, points in expected.items():
+            for want, got in zip(points, actual[sensor_type]):
+                same = (
+                    want["time"] == got["time"]
+                    and (want["value"] is None) == (got["value"] is None)
+                    and (want["value"] is None or abs(want["value"] - got["value"]) <= TOLERANCE)
+                )
+                if not same:
+                    mismatches += 1
+                    print(f"DIFF  {label}: property {property_id} {sensor_type} at {want['time']:.3f}h: "
+                          f"per-interval {want['value']}, buckets {got['value']}")
+    print(f"{label}: {mismatches} mismatched intervals")
+    return mismatches
+
+
+def main() -> int:
+    Base.metadata.create_all(bind=engine)
+    target_date = datetime.now(GMT_PLUS_8).date()
+    db = SessionLocal()
+    try:
+        written = seed(db, target_date)
+        print(f"Wrote {written} readings for {args.properties} properties in {args.batches} batches")
+        mismatches = compare(db, target_date, "ingest buckets")
+        rebuild_day_buckets(db, target_date)
+        db.commit()
+        mismatches += compare(db, target_date, "rebuilt buckets")
+    finally:
+        db.close()
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from models import Property
+from comfort_evaluator import ComfortEvaluator
+
+COMFORT_CACHE_SIZE = int(os.environ.get("COMFORT_CACHE_SIZE", "50000"))
+# Full results include the latest realtime values, so they are only reused for a short time
+COMFORT_CACHE_TTL = float(os.environ.get("COMFORT_CACHE_TTL", "5.0"))
+
+CacheKey = Tuple[int, str]
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with optional per-entry expiry"""
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, Tuple[float, object]]" = OrderedDict()
+
+    def get(self, key: CacheKey, now: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: CacheKey, value, now: float):
+        expires_at = now + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: CacheKey):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ComfortCache:
+    """
+    Cache of comfort evaluations keyed by (property_id, normalized profile), in two layers:
+    - history: latest daily average and annual match per sensor, kept until a day is migrated
+    - results: the full evaluation including insights, kept for a short TTL and dropped as
+      soon as new readings land for the property
+    Both layers are bounded LRUs. Cached results are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_entries: int = COMFORT_CACHE_SIZE, ttl: float = COMFORT_CACHE_TTL):
+        self.history = LRUCache(max_entries)
+        self.results = LRUCache(max_entries, ttl)
+        self._lock = threading.Lock()
+        # Bumped on invalidation so evaluations that started earlier are not stored
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, db: Session, property_ids: Iterable[int], customer_type: str) -> Dict[int, Dict]:
+        """Comfort evaluations for many properties; missing entries are evaluated in one batch."""
+        profile_key = ComfortEvaluator.normalize_profile(customer_type)
+        now = time.monotonic()
+        results: Dict[int, Dict] = {}
+        missing: List[int] = []
+
+        for property_id in property_ids:
+            cached = self.results.get((property_id, profile_key), now)
+            if cached is not None:
+                results[property_id] = cached
+            else:
+                missing.append(property_id)
+
+        with self._lock:
+            self.hits += len(results)
+            self.misses += len(missing)
+            epoch = self._epoch
+            generations = {property_id: self._generations[property_id] for property_id in missing}
+
+        if not missing:
+            return results
+
+        summaries = self._history_summaries(db, missing, profile_key, epoch, now)
+        evaluated = ComfortEvaluator.evaluate_properties_comfort(db, missing, profile_key, summaries)
+        results.update(evaluated)
+
+        now = time.monotonic()
+        with self._lock:
+            if epoch == self._epoch:
+                for property_id, comfort_data in evaluated.items():
+                    if self._generations[property_id] == generations[property_id]:
+                        self.results.put((property_id, profile_key), comfort_data, now)
+
+        return results
+
+    def _history_summaries(
+        self, db: Session, property_ids: List[int], profile_key: str, epoch: int, now: float
+    ) -> Dict[int, Dict]:
+        summaries: Dict[int, Dict] = {}
+        missing: List[int] = []
+        for property_id in property_ids:
+            cached = self.history.get((property_id, profile_key), now)
+            if cached is not None:
+                summaries[property_id] = cached
+            else:
+                missing.append(property_id)
+
+        if missing:
+            fetched = ComfortEvaluator.summarize_histories(db, missing, profile_key)
+            summaries.update(fetched)
+            with self._lock:
+                if epoch == self._epoch:
+                    for property_id, summary in fetched.items():
+                        self.history.put((property_id, profile_key), summary, now)
+        return summaries
+
+    def get(self, db: Session, property_id: int, customer_type: str) -> Dict:
+        return self.get_many(db, [property_id], customer_type)[property_id]
+
+    def get_scores(self, db: Session, property_ids: Iterable[int], customer_type: str) -> Dict[int, float]:
+        evaluations = self.get_many(db, property_ids, customer_type)
+        return {property_id: comfort_data["overall_score"] for property_id, comfort_data in evaluations.items()}
+
+    def invalidate_properties(self, property_ids: Iterable[int]):
+        """Drop the realtime-sensitive results of properties that received new readings"""
+        with self._lock:
+            for property_id in set(property_ids):
+                self._generations[property_id] += 1
+                for profile_key in ComfortEvaluator.PROFILES:
+                    self.results.pop((property_id, profile_key))
+
+    def clear(self):
+        """Drop everything, e.g. after a day has been migrated into the historical table"""
+        with self._lock:
+            self._epoch += 1
+            self.history.clear()
+            self.results.clear()
+
+    def warm(self, db: Session) -> int:
+        """Evaluate every property for every supported profile"""
+        property_ids = [row.id for row in db.query(Property.id).all()]
+        for profile_key in ComfortEvaluator.PROFILES:
+            self.get_many(db, property_ids, profile_key)
+        return len(property_ids) * len(ComfortEvaluator.PROFILES)
+
+    def stats(self) -> Dict:
+        return {
+            "history_entries": len(self.history),
+            "result_entries": len(self.results),
+            "capacity": self.results.max_entries,
+            "ttl_seconds": self.results.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global comfort result cache
+comfort_cache = ComfortCache()
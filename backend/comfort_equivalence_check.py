@@ -0,0 +1,243 @@
+"""
+Equivalence check for the vectorized comfort scoring in comfort_matrix.py.
+Draws random sensor values, preferred ranges (including open-ended, zero and inverted ones) and
+weights, and compares per-sensor scores, statuses, overall scores and comfort levels with the
+original scalar ComfortEvaluator code, copied below. Covers the scalar wrappers
+(calculate_scaled_score, score_to_status, score_property), weighted_overall on whole batches
+and ScoreMatrixEngine on a portfolio matrix. Exits non-zero on any difference.
+
+Usage:
+    python comfort_equivalence_check.py [--samples 300000] [--seed 3]
+"""
+import argparse
+import random
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from comfort_evaluator import ComfortEvaluator
+from comfort_matrix import ScoreMatrixEngine, weighted_overall
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--samples", type=int, default=300000, help="random per-sensor scores and overall scores")
+parser.add_argument("--properties", type=int, default=20000, help="rows of the portfolio matrix")
+parser.add_argument("--seed", type=int, default=3)
+args = parser.parse_args()
+
+WEIGHTS = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.5]
+
+
+# --- Original scalar implementation ----------------------------------------------------------
+
+def scalar_scaled_score(value: Optional[float], pref: Dict[str, float]) -> Optional[float]:
+    if value is None:
+        return None
+
+    preferred_min = pref.get("min")
+    preferred_max = pref.get("max")
+    if preferred_min is None and preferred_max is None:
+        return None
+
+    # Within preferred range scores 100.
+    if (preferred_min is None or value >= preferred_min) and (preferred_max is None or value <= preferred_max):
+        return 100.0
+
+    if preferred_min is not None and value < preferred_min:
+        distance = preferred_min - value
+    elif preferred_max is not None and value > preferred_max:
+        distance = value - preferred_max
+    else:
+        distance = 0.0
+
+    if preferred_min is not None and preferred_max is not None and preferred_max > preferred_min:
+        scale = preferred_max - preferred_min
+    else:
+        reference = preferred_max if preferred_max not in (None, 0) else preferred_min
+        scale = max(reference * 0.2 if reference else 5.0, 1.0)
+
+    penalty = min(distance / scale, 1.0)
+    score = max(0.0, 100.0 * (1 - penalty))
+    return round(score, 1)
+
+
+def scalar_status(score: Optional[float]) -> str:
+    if score is None:
+        return "No Data"
+    if score >= 90:
+        return "Ideal"
+    if score >= 75:
+        return "Comfortable"
+    if score >= 60:
+        return "Monitor"
+    return "Attention"
+
+
+def scalar_overall(scores: List[Optional[float]], weights: List[float]):
+    total_weighted_score = 0.0
+    total_weight = 0.0
+    for score, weight in zip(scores, weights):
+        if score is not None:
+            total_weighted_score += score * weight
+            total_weight += weight
+    if total_weight == 0:
+        overall_score = 0.0
+    else:
+        overall_score = round(total_weighted_score / total_weight, 1)
+
+    if overall_score >= 85:
+        comfort_level = "Excellent"
+    elif overall_score >= 70:
+        comfort_level = "Good"
+    elif overall_score >= 55:
+        comfort_level = "Fair"
+    elif total_weight == 0:
+        comfort_level = "No Data"
+    else:
+        comfort_level = "Poor"
+    return overall_score, comfort_level
+
+
+# --- Random inputs ---------------------------------------------------------------------------
+
+def random_pref(rng: random.Random) -> Dict[str, float]:
+    kind = rng.random()
+    if kind < 0.5:
+        # A real profile's range
+        profile = rng.choice(list(ComfortEvaluator.PROFILES.values()))
+        return dict(rng.choice(list(profile["sensors"].values())))
+    low = round(rng.uniform(-10, 500), rng.choice((0, 1, 2)))
+    high = round(low + rng.uniform(0, 100), rng.choice((0, 1, 2)))
+    pref = {"weight": rng.choice(WEIGHTS)}
+    if kind < 0.75:
+        pref.update(min=low, max=high)
+    elif kind < 0.82:
+        pref["min"] = low
+    elif kind < 0.89:
+        pref["max"] = high
+    elif kind < 0.93:
+        pref.update(min=0.0, max=0.0)
+    elif kind < 0.97:
+        pref.update(min=high, max=low)  # Inverted
+    return pref
+
+
+def random_value(rng: random.Random, pref: Dict[str, float]) -> Optional[float]:
+    if rng.random() < 0.05:
+        return None
+    centre = pref.get("min", pref.get("max", 0.0))
+    if centre is None:
+        centre = 0.0
+    return round(centre + rng.uniform(-60, 60), rng.choice((1, 2)))
+
+
+def random_scores(rng: random.Random, count: int) -> List[Optional[float]]:
+    # One-decimal scores like the per-sensor scores, with some sensors missing
+    return [None if rng.random() < 0.15 else round(rng.uniform(0, 100), 1) for _ in range(count)]
+
+
+# --- Comparisons -----------------------------------------------------------------------------
+
+def check_sensor_scores(rng: random.Random) -> int:
+    mismatches = 0
+    for _ in range(args.samples):
+        pref = random_pref(rng)
+        value = random_value(rng, pref)
+        expected = scalar_scaled_score(value, pref)
+        actual = ComfortEvaluator.calculate_scaled_score(value, pref)
+        if expected != actual or scalar_status(expected) != ComfortEvaluator.score_to_status(actual):
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"DIFF  score of {value} against {pref}: scalar {expected}, vectorized {actual}")
+    print(f"per-sensor scores: {mismatches} mismatches in {args.samples}")
+    return mismatches
+
+
+def check_overall_scores(rng: random.Random) -> int:
+    sensors = len(ComfortEvaluator.SUPPORTED_SENSORS)
+    rows = [random_scores(rng, sensors) for _ in range(args.samples)]
+    weights = [[rng.choice(WEIGHTS) for _ in range(sensors)] for _ in range(args.samples)]
+    matrix = np.array([[np.nan if score is None else score for score in row] for row in rows])
+    overall, _ = weighted_overall(matrix, np.array(weights))
+
+    mismatches = 0
+    for row, row_weights, actual in zip(rows, weights, overall.tolist()):
+        expected, _ = scalar_overall(row, row_weights)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"DIFF  overall of {row} weighted {row_weights}: scalar {expected}, vectorized {actual}")
+    print(f"overall scores: {mismatches} mismatches in {args.samples}")
+    return mismatches
+
+
+def check_score_property(rng: random.Random) -> int:
+    """End to end through ComfortEvaluator.score_property, including the comfort level"""
+    samples = min(args.samples, 5000)
+    mismatches = 0
+    for _ in range(samples):
+        profile_key = rng.choice(list(ComfortEvaluator.PROFILES.keys()))
+        sensors_config = ComfortEvaluator.get_profile_sensors(profile_key)
+        readings = {}
+        for sensor_type, pref in sensors_config.items():
+            value = random_value(rng, pref)
+            if value is not None:
+                readings[sensor_type] = {"value": value, "timestamp": None}
+        result = ComfortEvaluator.score_property(sensors_config, profile_key, readings, {})
+
+        scores = [scalar_scaled_score(readings.get(sensor_type, {}).get("value"), pref) for sensor_type, pref in sensors_config.items()]
+        expected = scalar_overall(scores, [pref.get("weight", 1.0) for pref in sensors_config.values()])
+        actual = (result["overall_score"], result["comfort_level"])
+        if expected != actual or scores != [sensor["score"] for sensor in result["sensors"]]:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"DIFF  {profile_key} with {readings}: scalar {expected}, vectorized {actual}")
+    print(f"score_property results: {mismatches} mismatches in {samples}")
+    return mismatches
+
+
+def check_portfolio(rng: random.Random) -> int:
+    """ScoreMatrixEngine against every profile at once, cell by cell"""
+    engine = ScoreMatrixEngine(ComfortEvaluator.PROFILES, ComfortEvaluator.SUPPORTED_SENSORS)
+    values = np.array([
+        [np.nan if rng.random() < 0.1 else round(rng.uniform(-20, 1200), rng.choice((1, 2))) for _ in engine.sensors]
+        for _ in range(args.properties)
+    ])
+    result = engine.score(values)
+
+    mismatches = 0
+    for profile_index, profile_name in enumerate(engine.profile_names):
+        prefs = ComfortEvaluator.PROFILES[profile_name]["sensors"]
+        for row in range(args.properties):
+            scores, weights = [], []
+            for column, sensor_type in enumerate(engine.sensors):
+                pref = prefs.get(sensor_type)
+                if pref is None:
+                    continue
+                value = None if np.isnan(values[row, column]) else float(values[row, column])
+                score = scalar_scaled_score(value, pref)
+                actual = result["scores"][row, profile_index, column]
+                if (score is None) != bool(np.isnan(actual)) or (score is not None and score != actual):
+                    mismatches += 1
+                scores.append(score)
+                weights.append(pref.get("weight", 1.0))
+            expected, _ = scalar_overall(scores, weights)
+            if expected != result["overall"][row, profile_index]:
+                mismatches += 1
+    print(f"portfolio matrix: {mismatches} mismatches over {args.properties} properties x {len(engine.profile_names)} profiles")
+    return mismatches
+
+
+def main() -> int:
+    rng = random.Random(args.seed)
+    mismatches = (
+        check_sensor_scores(rng)
+        + check_overall_scores(rng)
+        + check_score_property(rng)
+        + check_portfolio(rng)
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
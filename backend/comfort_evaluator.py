@@ -1,8 +1,13 @@
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta, date
 from collections import defaultdict
+import numpy as np
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from models import RealtimeReading, HistoricalReading, SensorType
+from models import HistoricalReading, SensorType
+from latest_store import latest_store
+from comfort_matrix import ScoreMatrixEngine, as_bound, scaled_scores, status_labels, weighted_overall
+from match_counters import match_rates
 
 
 class ComfortEvaluator:
@@ -42,6 +47,9 @@ class ComfortEvaluator:
         SensorType.SOUND: "Sound",
     }
 
+    # SQLite caps bound parameters per statement; property id lists are fetched in chunks
+    PROPERTY_ID_CHUNK = 900
+
     PROFILES = {
         "Young Professionals (Working from Home)": {
             "description": "Bright, focused environment for long working hours at home.",
@@ -103,46 +111,48 @@ class ComfortEvaluator:
 
     @staticmethod
     def get_latest_readings(db: Session, property_id: int) -> Dict[SensorType, Dict[str, Optional[float]]]:
-        """Get the most recent realtime reading for each supported sensor."""
-        readings: Dict[SensorType, Dict[str, Optional[float]]] = {}
-        for sensor_type in ComfortEvaluator.SUPPORTED_SENSORS:
-            latest = (
-                db.query(RealtimeReading)
-                .filter(
-                    RealtimeReading.property_id == property_id,
-                    RealtimeReading.sensor_type == sensor_type,
-                )
-                .order_by(RealtimeReading.timestamp.desc())
-                .first()
-            )
-
-            if latest:
-                readings[sensor_type] = {
-                    "value": latest.value,
-                    "timestamp": latest.timestamp,
-                }
-        return readings
+        """Get the most recent realtime reading for each supported sensor from the latest store."""
+        latest = latest_store.get_property(db, property_id)
+        return {
+            sensor_type: latest[sensor_type]
+            for sensor_type in ComfortEvaluator.SUPPORTED_SENSORS
+            if sensor_type in latest
+        }
 
-    @staticmethod
+    @classmethod
     def get_historical_map(
-        db: Session, property_id: int, sensor_types: List[SensorType], days: int = 365
-    ) -> Dict[SensorType, List[HistoricalReading]]:
+        cls, db: Session, property_id: int, sensor_types: List[SensorType], days: int = 365
+    ) -> Dict[SensorType, List]:
         """Fetch up to `days` historical daily averages for the selected sensors."""
+        return cls.get_historical_maps(db, [property_id], sensor_types, days).get(property_id, {})
+
+    @classmethod
+    def get_historical_maps(
+        cls, db: Session, property_ids: List[int], sensor_types: List[SensorType], days: int = 365
+    ) -> Dict[int, Dict[SensorType, List]]:
+        """Fetch up to `days` historical daily averages for many properties at once."""
         since_date = datetime.utcnow().date() - timedelta(days=days)
-        rows = (
-            db.query(HistoricalReading)
-            .filter(
-                HistoricalReading.property_id == property_id,
-                HistoricalReading.sensor_type.in_(sensor_types),
-                HistoricalReading.date >= since_date,
+        grouped: Dict[int, Dict[SensorType, List]] = defaultdict(lambda: defaultdict(list))
+
+        for offset in range(0, len(property_ids), cls.PROPERTY_ID_CHUNK):
+            chunk = property_ids[offset:offset + cls.PROPERTY_ID_CHUNK]
+            rows = (
+                db.query(
+                    HistoricalReading.property_id,
+                    HistoricalReading.sensor_type,
+                    HistoricalReading.date,
+                    HistoricalReading.avg_value,
+                )
+                .filter(
+                    HistoricalReading.property_id.in_(chunk),
+                    HistoricalReading.sensor_type.in_(sensor_types),
+                    HistoricalReading.date >= since_date,
+                )
+                .order_by(HistoricalReading.property_id, HistoricalReading.date.asc())
+                .all()
             )
-            .order_by(HistoricalReading.date.asc())
-            .all()
-        )
-
-        grouped: Dict[SensorType, List[HistoricalReading]] = defaultdict(list)
-        for row in rows:
-            grouped[row.sensor_type].append(row)
+            for row in rows:
+                grouped[row.property_id][row.sensor_type].append(row)
         return grouped
 
     @staticmethod
@@ -176,44 +186,12 @@ class ComfortEvaluator:
     def calculate_scaled_score(value: Optional[float], pref: Dict[str, float]) -> Optional[float]:
         if value is None:
             return None
-
-        preferred_min = pref.get("min")
-        preferred_max = pref.get("max")
-        if preferred_min is None and preferred_max is None:
-            return None
-
-        # Within preferred range scores 100.
-        if (preferred_min is None or value >= preferred_min) and (preferred_max is None or value <= preferred_max):
-            return 100.0
-
-        if preferred_min is not None and value < preferred_min:
-            distance = preferred_min - value
-        elif preferred_max is not None and value > preferred_max:
-            distance = value - preferred_max
-        else:
-            distance = 0.0
-
-        if preferred_min is not None and preferred_max is not None and preferred_max > preferred_min:
-            scale = preferred_max - preferred_min
-        else:
-            reference = preferred_max if preferred_max not in (None, 0) else preferred_min
-            scale = max(reference * 0.2 if reference else 5.0, 1.0)
-
-        penalty = min(distance / scale, 1.0)
-        score = max(0.0, 100.0 * (1 - penalty))
-        return round(score, 1)
+        score = scaled_scores(value, as_bound(pref.get("min")), as_bound(pref.get("max")))
+        return None if np.isnan(score) else float(score)
 
     @staticmethod
     def score_to_status(score: Optional[float]) -> str:
-        if score is None:
-            return "No Data"
-        if score >= 90:
-            return "Ideal"
-        if score >= 75:
-            return "Comfortable"
-        if score >= 60:
-            return "Monitor"
-        return "Attention"
+        return str(status_labels(np.nan if score is None else score))
 
     @staticmethod
     def format_range(preferred_min: Optional[float], preferred_max: Optional[float], unit: str = "") -> str:
@@ -293,23 +271,87 @@ class ComfortEvaluator:
         return insights[:4]
 
     @classmethod
-    def evaluate_property_comfort(cls, db: Session, property_id: int, customer_type: str) -> Dict:
-        sensors_config = cls.get_profile_sensors(customer_type)
+    def get_latest_daily_averages(
+        cls, db: Session, property_ids: List[int], sensor_types: List[SensorType], days: int = 365
+    ) -> Dict[Tuple[int, SensorType], Tuple[Optional[float], date]]:
+        """Most recent daily average per (property, sensor) within the last `days` days."""
+        since_date = datetime.utcnow().date() - timedelta(days=days)
+        latest: Dict[Tuple[int, SensorType], Tuple[Optional[float], date]] = {}
+
+        for offset in range(0, len(property_ids), cls.PROPERTY_ID_CHUNK):
+            chunk = property_ids[offset:offset + cls.PROPERTY_ID_CHUNK]
+            # SQLite returns avg_value from the row holding MAX(date)
+            rows = (
+                db.query(
+                    HistoricalReading.property_id,
+                    HistoricalReading.sensor_type,
+                    func.max(HistoricalReading.date).label("date"),
+                    HistoricalReading.avg_value,
+                )
+                .filter(
+                    HistoricalReading.property_id.in_(chunk),
+                    HistoricalReading.sensor_type.in_(sensor_types),
+                    HistoricalReading.date >= since_date,
+                )
+                .group_by(HistoricalReading.property_id, HistoricalReading.sensor_type)
+                .all()
+            )
+            for row in rows:
+                latest[(row.property_id, row.sensor_type)] = (row.avg_value, row.date)
+        return latest
 
-        realtime_readings = cls.get_latest_readings(db, property_id)
-        historical_map = cls.get_historical_map(db, property_id, list(sensors_config.keys()))
+    @classmethod
+    def summarize_histories(
+        cls, db: Session, property_ids: List[int], customer_type: str, days: int = 365
+    ) -> Dict[int, Dict[SensorType, Dict]]:
+        """
+        Historical part of the evaluation for many properties: latest daily average and
+        annual percentage match per sensor. Match rates come from the precomputed
+        in-range counters, so no historical rows are loaded.
+        """
+        profile_key = cls.normalize_profile(customer_type)
+        sensors_config = cls.PROFILES[profile_key]["sensors"]
+        property_ids = list(property_ids)
+        since_date = datetime.utcnow().date() - timedelta(days=days)
+
+        latest_averages = cls.get_latest_daily_averages(db, property_ids, list(sensors_config.keys()), days)
+        rates = match_rates(db, profile_key, property_ids, since_date)
+
+        summaries: Dict[int, Dict[SensorType, Dict]] = {}
+        for property_id in property_ids:
+            summary: Dict[SensorType, Dict] = {}
+            for sensor_type in sensors_config:
+                daily_average, average_date = latest_averages.get((property_id, sensor_type), (None, None))
+                percentage_match, days_tracked = rates.get((property_id, sensor_type), (None, 0))
+                summary[sensor_type] = {
+                    "daily_average": daily_average,
+                    "average_date": average_date,
+                    "percentage_match": percentage_match,
+                    "days_tracked": days_tracked,
+                }
+            summaries[property_id] = summary
+        return summaries
 
+    @classmethod
+    def score_property(
+        cls,
+        sensors_config: Dict[SensorType, Dict[str, float]],
+        profile_key: str,
+        realtime_readings: Dict[SensorType, Dict],
+        history_summary: Dict[SensorType, Dict],
+    ) -> Dict:
+        """Score one property from its latest readings and its summarized history."""
         sensor_evaluations: List[Dict] = []
-        total_weighted_score = 0.0
-        total_weight = 0.0
+        scores: List[float] = []
+        weights: List[float] = []
 
         for sensor_type, pref in sensors_config.items():
             realtime = realtime_readings.get(sensor_type, {})
-            hist_rows = historical_map.get(sensor_type, [])
-            daily_average, average_date = cls.latest_daily_average(hist_rows)
-            percentage_match, days_tracked = cls.compute_percentage_match(
-                hist_rows, pref.get("min"), pref.get("max")
-            )
+            history = history_summary.get(sensor_type, {})
+            daily_average = history.get("daily_average")
+            average_date = history.get("average_date")
+            percentage_match = history.get("percentage_match")
+            days_tracked = history.get("days_tracked", 0)
 
             # Prefer realtime value for current score, fallback to daily average
             value_for_score = realtime.get("value") if realtime.get("value") is not None else daily_average
@@ -318,10 +360,8 @@ class ComfortEvaluator:
             status = cls.score_to_status(score)
             insight = cls.build_sensor_insight(sensor_type, score, value_for_score, pref, percentage_match)
 
-            if score is not None:
-                weight = pref.get("weight", 1.0)
-                total_weighted_score += score * weight
-                total_weight += weight
+            scores.append(np.nan if score is None else score)
+            weights.append(pref.get("weight", 1.0))
 
             sensor_evaluations.append(
                 {
@@ -343,10 +383,8 @@ class ComfortEvaluator:
                 }
             )
 
-        if total_weight == 0:
-            overall_score = 0.0
-        else:
-            overall_score = round(total_weighted_score / total_weight, 1)
+        overall, total_weight = weighted_overall(np.array(scores), np.array(weights))
+        overall_score = float(overall)
 
         if overall_score >= 85:
             comfort_level = "Excellent"
@@ -359,7 +397,6 @@ class ComfortEvaluator:
         else:
             comfort_level = "Poor"
 
-        profile_key = cls.normalize_profile(customer_type)
         insights = cls.build_property_insights(sensor_evaluations, profile_key)
 
         return {
@@ -369,8 +406,81 @@ class ComfortEvaluator:
             "insights": insights,
         }
 
+    @classmethod
+    def evaluate_properties_comfort(
+        cls,
+        db: Session,
+        property_ids: List[int],
+        customer_type: str,
+        history_summaries: Optional[Dict[int, Dict[SensorType, Dict]]] = None,
+    ) -> Dict[int, Dict]:
+        """
+        Evaluate many properties together: latest values come from the in-memory latest store
+        and the historical averages of every property are fetched in one query, unless
+        already-summarized histories are passed in.
+        """
+        profile_key = cls.normalize_profile(customer_type)
+        sensors_config = cls.PROFILES[profile_key]["sensors"]
+        property_ids = list(property_ids)
+
+        if history_summaries is None:
+            history_summaries = cls.summarize_histories(db, property_ids, profile_key)
+
+        return {
+            property_id: cls.score_property(
+                sensors_config,
+                profile_key,
+                cls.get_latest_readings(db, property_id),
+                history_summaries.get(property_id, {}),
+            )
+            for property_id in property_ids
+        }
+
+    @classmethod
+    def evaluate_property_comfort(cls, db: Session, property_id: int, customer_type: str) -> Dict:
+        return cls.evaluate_properties_comfort(db, [property_id], customer_type)[property_id]
+
     @classmethod
     def get_property_comfort_score(cls, db: Session, property_id: int, customer_type: str) -> float:
         comfort_data = cls.evaluate_property_comfort(db, property_id, customer_type)
         return comfort_data["overall_score"]
 
+    @classmethod
+    def get_properties_comfort_scores(cls, db: Session, property_ids: List[int], customer_type: str) -> Dict[int, float]:
+        evaluations = cls.evaluate_properties_comfort(db, property_ids, customer_type)
+        return {property_id: comfort_data["overall_score"] for property_id, comfort_data in evaluations.items()}
+
+    _score_engine: Optional[ScoreMatrixEngine] = None
+
+    @classmethod
+    def score_engine(cls) -> ScoreMatrixEngine:
+        """Vectorized engine over all PROFILES and SUPPORTED_SENSORS"""
+        if cls._score_engine is None:
+            cls._score_engine = ScoreMatrixEngine(cls.PROFILES, cls.SUPPORTED_SENSORS)
+        return cls._score_engine
+
+    @classmethod
+    def score_portfolio(cls, db: Session, property_ids: List[int]) -> Dict:
+        """
+        Score many properties against every profile in one vectorized pass. Each sensor uses
+        the latest realtime value, falling back to the latest daily average like the scalar path.
+        Returns the engine output plus the property ids and profile names labelling its axes.
+        """
+        property_ids = list(property_ids)
+        engine = cls.score_engine()
+        latest_averages = cls.get_latest_daily_averages(db, property_ids, engine.sensors)
+
+        values = np.full((len(property_ids), len(engine.sensors)), np.nan)
+        for row, property_id in enumerate(property_ids):
+            realtime_readings = cls.get_latest_readings(db, property_id)
+            for column, sensor_type in enumerate(engine.sensors):
+                value = realtime_readings.get(sensor_type, {}).get("value")
+                if value is None:
+                    value = latest_averages.get((property_id, sensor_type), (None, None))[0]
+                if value is not None:
+                    values[row, column] = value
+
+        result = engine.score(values)
+        result["property_ids"] = property_ids
+        result["profiles"] = engine.profile_names
+        return result
@@ -0,0 +1,136 @@
+"""
+Vectorized comfort scoring.
+Scores a (properties × sensors) value matrix against every customer profile in one NumPy pass,
+using the same distance-based rule as the scalar ComfortEvaluator helpers (which wrap this module).
+Missing values and missing bounds are NaN.
+"""
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+STATUS_LABELS = np.array(["Ideal", "Comfortable", "Monitor", "Attention", "No Data"], dtype=object)
+
+
+def as_bound(value: Optional[float]) -> float:
+    return np.nan if value is None else float(value)
+
+
+# Python's round() applied elementwise. np.round scales by 10 and rounds the scaled binary value,
+# which differs from round() for inputs close to a halfway point (e.g. 60.15 is stored just below
+# it: round() gives 60.1, np.round 60.2), so scores would not match the scalar implementation.
+_python_round = np.frompyfunc(lambda value, ndigits: round(float(value), ndigits), 2, 1)
+
+
+def round_like_python(values, ndigits: int = 1) -> np.ndarray:
+    """Round every element exactly as Python's round() does (NaN stays NaN)"""
+    return np.asarray(_python_round(np.asarray(values, dtype=float), ndigits), dtype=float)
+
+
+def scaled_scores(values, mins, maxs) -> np.ndarray:
+    """
+    Distance-based score (0-100, rounded to 0.1) for values against preferred ranges.
+    Arguments broadcast against each other; NaN values or ranges with no bounds score NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    mins = np.asarray(mins, dtype=float)
+    maxs = np.asarray(maxs, dtype=float)
+
+    has_min = ~np.isnan(mins)
+    has_max = ~np.isnan(maxs)
+
+    with np.errstate(invalid="ignore"):
+        below = has_min & (values < mins)
+        above = has_max & (values > maxs)
+        distance = np.where(below, mins - values, np.where(above, values - maxs, 0.0))
+
+        # Width of the range, or 20% of the single bound (at least 1) when there is no proper range
+        reference = np.where(has_max & (maxs != 0), maxs, mins)
+        fallback = np.where(
+            np.isnan(reference) | (reference == 0), 5.0, reference * 0.2
+        )
+        scale = np.where(
+            has_min & has_max & (maxs > mins), maxs - mins, np.maximum(fallback, 1.0)
+        )
+
+        penalty = np.minimum(distance / scale, 1.0)
+        scores = round_like_python(np.maximum(0.0, 100.0 * (1 - penalty)))
+
+    scores = np.where(below | above, scores, 100.0)
+    return np.where(np.isnan(values) | ~(has_min | has_max), np.nan, scores)
+
+
+def status_labels(scores) -> np.ndarray:
+    """Status label for each score (NaN is "No Data")"""
+    scores = np.asarray(scores, dtype=float)
+    with np.errstate(invalid="ignore"):
+        index = np.select(
+            [np.isnan(scores), scores >= 90, scores >= 75, scores >= 60],
+            [4, 0, 1, 2],
+            default=3,
+        )
+    return STATUS_LABELS[index]
+
+
+def weighted_overall(scores, weights):
+    """
+    Weighted average over the last (sensor) axis, ignoring NaN scores and rounded to 0.1 as
+    Python's round() does; 0.0 where no sensor has a score. Sensors are accumulated in order,
+    so the sums are those of a sequential Python loop; comfort_equivalence_check.py compares
+    the results with the original scalar code. Returns the overall scores and total weights.
+    """
+    scores = np.asarray(scores, dtype=float)
+    weights = np.broadcast_to(np.asarray(weights, dtype=float), scores.shape)
+
+    total_weighted_score = np.zeros(scores.shape[:-1])
+    total_weight = np.zeros(scores.shape[:-1])
+    for sensor_index in range(scores.shape[-1]):
+        column = scores[..., sensor_index]
+        present = ~np.isnan(column)
+        total_weighted_score = np.where(
+            present, total_weighted_score + column * weights[..., sensor_index], total_weighted_score
+        )
+        total_weight = np.where(present, total_weight + weights[..., sensor_index], total_weight)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        overall = np.where(total_weight == 0, 0.0, round_like_python(total_weighted_score / total_weight))
+    return overall, total_weight
+
+
+class ScoreMatrixEngine:
+    """
+    Profile ranges and weights held as (profiles × sensors) arrays, so a whole portfolio is
+    scored against every profile at once.
+    """
+
+    def __init__(self, profiles: Dict, sensors: Sequence):
+        self.profile_names: List[str] = list(profiles.keys())
+        self.sensors = list(sensors)
+
+        shape = (len(self.profile_names), len(self.sensors))
+        self.mins = np.full(shape, np.nan)
+        self.maxs = np.full(shape, np.nan)
+        self.weights = np.zeros(shape)
+        for profile_index, profile_name in enumerate(self.profile_names):
+            sensor_prefs = profiles[profile_name]["sensors"]
+            for sensor_index, sensor_type in enumerate(self.sensors):
+                pref = sensor_prefs.get(sensor_type)
+                if pref is None:
+                    continue
+                self.mins[profile_index, sensor_index] = as_bound(pref.get("min"))
+                self.maxs[profile_index, sensor_index] = as_bound(pref.get("max"))
+                self.weights[profile_index, sensor_index] = pref.get("weight", 1.0)
+
+    def score(self, values) -> Dict[str, np.ndarray]:
+        """
+        Score a (properties × sensors) value matrix (NaN for missing) against every profile.
+        Returns "scores" (properties × profiles × sensors), "overall" and "total_weight"
+        (properties × profiles).
+        """
+        values = np.asarray(values, dtype=float)
+        scores = scaled_scores(values[:, np.newaxis, :], self.mins, self.maxs)
+        overall, total_weight = weighted_overall(scores, self.weights)
+        return {"scores": scores, "overall": overall, "total_weight": total_weight}
+
+    def rank(self, values, profile_name: str) -> np.ndarray:
+        """Property row indices ordered by overall score for a profile, best first"""
+        overall = self.score(values)["overall"][:, self.profile_names.index(profile_name)]
+        return np.argsort(-overall, kind="stable")
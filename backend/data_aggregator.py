@@ -1,102 +1,244 @@
 import asyncio
+import os
+import time
 from datetime import datetime, timedelta, date, timezone
+from typing import List, Optional
+from sqlalchemy import delete, func, select
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import RealtimeReading, HistoricalReading, SensorType, Property
-from database import SessionLocal
+from models import RealtimeBucket
+from realtime_partitions import (
+    drop_partition, existing_partition, partition_days, partition_name, partition_row_counts,
+)
+from database import SessionLocal, AsyncSessionLocal
+from rollups import day_bounds, upsert_day_averages
+from rollup_tiers import archive_tier, day_rolled_up, expire_rollups, rollup_day
+from latest_store import latest_store
+from comfort_cache import comfort_cache
+from live_stream import live_hub
+from data_versions import data_versions, REALTIME, HISTORICAL
+from comfort_evaluator import ComfortEvaluator
+from match_counters import record_day
+from metrics import metrics
 
 # GMT+8 timezone
 GMT_PLUS_8 = timezone(timedelta(hours=8))
 
+# Rows per DELETE when clearing a migrated day's buckets; each chunk is its own short transaction
+MIGRATION_DELETE_CHUNK = int(os.environ.get("MIGRATION_DELETE_CHUNK", "5000"))
+
+# Seconds after GMT+8 midnight the daily migration starts, so readings stamped just before
+# midnight reach the database first. Must exceed the longest a device holds a reading back:
+# the Raspberry Pi sender's batching window (BATCH_MAX_AGE_SECONDS, 30s) plus its longest
+# retry backoff (MAX_RETRY_DELAY, 300s); the ingest buffer's own delay is far shorter.
+MIGRATION_GRACE_SECONDS = float(os.environ.get("MIGRATION_GRACE_SECONDS", "900"))
+# Readings stamped with a day already migrated are still accepted for this many days: they
+# recreate the day's partition and the next run merges them into the stored averages, tiers
+# and counters (see migrate_day). Older readings are rejected at ingest.
+LATE_READING_MAX_DAYS = int(os.environ.get("LATE_READING_MAX_DAYS", "7"))
+# Seconds to wait before retrying after a failed migration
+MIGRATION_RETRY_SECONDS = float(os.environ.get("MIGRATION_RETRY_SECONDS", "300"))
+
+MIGRATION_DURATION = metrics.histogram(
+    "aggregator_migration_duration_seconds", "Time to migrate one day to the historical tables"
+)
+MIGRATED_ROWS = metrics.counter(
+    "aggregator_migrated_rows_total", "Rows written or cleared by day migrations", ("kind",)
+)
+LAST_MIGRATED_DAY = metrics.gauge(
+    "aggregator_last_migrated_day_timestamp_seconds", "Unix time of GMT+8 midnight of the last migrated day"
+)
+
+
+def seconds_until_next_midnight(now: Optional[datetime] = None) -> float:
+    """Seconds from now until the next GMT+8 midnight"""
+    now = now or datetime.now(GMT_PLUS_8)
+    next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=GMT_PLUS_8)
+    return (next_midnight - now).total_seconds()
+
+
 class DataAggregator:
-    """Manages aggregation of realtime data to historical hourly averages"""
+    """
+    Manages aggregation of realtime data to historical daily averages.
+    Each day is migrated MIGRATION_GRACE_SECONDS after the GMT+8 midnight that ends it; readings
+    for it arriving later than that are merged in by the next run.
+    """
     
     def __init__(self):
         self.running = False
-        self.last_check_date = None
+        self.next_run_at: Optional[datetime] = None
+        self.last_migrated_date: Optional[date] = None
+        self._stop_requested: Optional[asyncio.Event] = None
         
     async def aggregate_and_migrate(self):
-        """Background task to aggregate hourly data and migrate at end of day"""
-        print(f"Starting data aggregator (GMT+8)...")
+        """
+        Background task: migrate every day still left in realtime storage, then sleep until the
+        next GMT+8 midnight and migrate the day that just ended
+        """
+        print("Starting data aggregator (GMT+8)...")
         self.running = True
-        self.last_check_date = datetime.now(GMT_PLUS_8).date()
+        self._stop_requested = asyncio.Event()
+        # Catch up on days missed while the server was down before waiting for midnight
+        delay = 0.0
         
         while self.running:
-            db = SessionLocal()
+            self.next_run_at = datetime.now(GMT_PLUS_8) + timedelta(seconds=delay)
             try:
-                current_date = datetime.now(GMT_PLUS_8).date()
-                
-                # Check if it's a new day - if so, migrate yesterday's data
-                if current_date != self.last_check_date:
-                    print(f"New day detected! Migrating data from {self.last_check_date} to historical database...")
-                    await self.migrate_previous_day_to_historical(db, self.last_check_date)
-                    self.last_check_date = current_date
-                
-            except Exception as e:
-                print(f"Error in data aggregator: {e}")
-                db.rollback()
-            finally:
-                db.close()
+                await asyncio.wait_for(self._stop_requested.wait(), timeout=delay)
+                break
+            except asyncio.TimeoutError:
+                pass
             
-            # Check every 5 minutes
-            await asyncio.sleep(300)
+            try:
+                await self.migrate_pending_days()
+                delay = seconds_until_next_midnight() + MIGRATION_GRACE_SECONDS
+            except Exception as e:
+                print(f"Error in data aggregator: {e}; retrying in {MIGRATION_RETRY_SECONDS:.0f}s")
+                delay = MIGRATION_RETRY_SECONDS
+    
+    async def migrate_pending_days(self) -> int:
+        """Migrate every un-migrated day before today, oldest first. Returns the number of days."""
+        today = datetime.now(GMT_PLUS_8).date()
+        async with AsyncSessionLocal() as db:
+            days = await db.run_sync(self.pending_days, today)
+        if not days:
+            return 0
+        
+        print(f"Migrating {len(days)} un-migrated day(s) to historical database: {days[0]} to {days[-1]}")
+        started = time.monotonic()
+        for number, day in enumerate(days, start=1):
+            print(f"[{number}/{len(days)}] Migrating {day}...")
+            await self.migrate_previous_day_to_historical(day)
+            self.last_migrated_date = day
+        print(f"Migrated {len(days)} day(s) in {time.monotonic() - started:.1f}s")
+        return len(days)
     
-    async def migrate_previous_day_to_historical(self, db: Session, target_date: date):
+    def pending_days(self, db: Session, today: date) -> List[date]:
+        """Days before today that still have a raw partition or rollup buckets"""
+        start_of_today, _ = day_bounds(today)
+        days = {day for day in partition_days(db) if day < today}
+        bucket_days = db.execute(
+            select(func.date(RealtimeBucket.bucket_start)).where(
+                RealtimeBucket.bucket_start < start_of_today
+            ).distinct()
+        ).scalars()
+        days.update(date.fromisoformat(day) for day in bucket_days if day)
+        return sorted(days)
+    
+    async def migrate_previous_day_to_historical(self, target_date: date):
         """
-        Migrate previous day's realtime data to historical database with daily average
-        and clear the migrated realtime data
+        Run the day migration on the writer connection in a worker thread, off the event loop,
+        then refresh the in-memory views on a pooled reader so the writer is free for ingest
         """
+        await asyncio.to_thread(self._migrate_with_writer, target_date)
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(self.refresh_after_migration, target_date)
+
+    def _migrate_with_writer(self, target_date: date):
+        db = SessionLocal()
         try:
-            properties = db.query(Property).all()
-            
-            # Define the time range for the whole day
-            start_of_day = datetime.combine(target_date, datetime.min.time())
-            end_of_day = start_of_day + timedelta(days=1)
-            
-            for property in properties:
-                for sensor_type in SensorType:
-                    # Calculate average for the WHOLE day (not hourly)
-                    avg_result = db.query(
-                        func.avg(RealtimeReading.value).label('avg_value')
-                    ).filter(
-                        RealtimeReading.property_id == property.id,
-                        RealtimeReading.sensor_type == sensor_type,
-                        RealtimeReading.timestamp >= start_of_day,
-                        RealtimeReading.timestamp < end_of_day
-                    ).first()
-                    
-                    if avg_result and avg_result.avg_value is not None:
-                        # Create historical record with daily average
-                        historical_reading = HistoricalReading(
-                            property_id=property.id,
-                            date=target_date,
-                            sensor_type=sensor_type,
-                            avg_value=round(avg_result.avg_value, 2)
-                        )
-                        db.add(historical_reading)
-            
-            # Commit all historical records
-            db.commit()
-            print(f"Successfully migrated daily averages for {target_date} to historical database")
-            
-            # Now delete the realtime data for the target date
-            deleted_count = db.query(RealtimeReading).filter(
-                RealtimeReading.timestamp >= start_of_day,
-                RealtimeReading.timestamp < end_of_day
-            ).delete()
-            
-            db.commit()
-            print(f"Cleared {deleted_count} realtime readings for {target_date}")
+            self.migrate_day(db, target_date)
+        finally:
+            db.close()
+
+    def migrate_day(self, db: Session, target_date: date):
+        """
+        Migrate a day's realtime data to the historical database as daily averages and clear
+        the migrated realtime data. Safe to rerun: the day's raw partition doubles as the
+        "not yet migrated" marker and is dropped in the transaction that writes the averages,
+        so a rerun after an interruption only finishes clearing the buckets. A reading stamped
+        with an already migrated day recreates its partition; migrating the day again merges
+        those readings into the stored averages, tiers and counters instead of replacing them.
+        Only writes; caches and clients are refreshed afterwards by refresh_after_migration.
+        """
+        started = time.perf_counter()
+        try:
+            partition = existing_partition(db, target_date)
+            if partition is not None:
+                # A day already in the archive tier is being migrated again for readings that
+                # arrived late: only its recreated partition holds samples not yet counted, while
+                # buckets left over from the first migration's chunked delete may still be there
+                archive = archive_tier()
+                source = partition if day_rolled_up(db, target_date, archive) else None
+                # One INSERT ... SELECT ... GROUP BY, merged with the samples already migrated
+                written = upsert_day_averages(db, target_date, archive.name, source)
+                # Fold the new daily averages into the per-profile in-range counters
+                record_day(db, target_date, ComfortEvaluator.PROFILES)
+                # Downsample the day into every rollup tier and expire tier buckets past retention
+                tier_buckets = rollup_day(db, target_date, source)
+                expired = expire_rollups(db, datetime.now(GMT_PLUS_8).date())
+                # Retire the raw readings: the day's partition is dropped whole
+                raw_readings = partition_row_counts(db).get(target_date, 0)
+                drop_partition(db, target_date)
+                db.commit()
+                print(
+                    f"Successfully migrated {written} daily averages for {target_date} to historical database "
+                    f"and dropped realtime partition {partition_name(target_date)}"
+                )
+                print(f"Wrote {tier_buckets} rollup tier buckets for {target_date}, expired {expired}")
+                MIGRATED_ROWS.inc("raw_readings", amount=raw_readings)
+                MIGRATED_ROWS.inc("daily_averages", amount=written)
+                MIGRATED_ROWS.inc("tier_buckets", amount=tier_buckets)
+                MIGRATED_ROWS.inc("expired_tier_buckets", amount=expired)
+            else:
+                print(f"No realtime partition left for {target_date}; daily averages already migrated")
+
+            deleted_count = self.delete_day_buckets(db, target_date)
+            print(f"Cleared {deleted_count} realtime buckets for {target_date}")
+            MIGRATED_ROWS.inc("cleared_realtime_buckets", amount=deleted_count)
+
+            MIGRATION_DURATION.observe(time.perf_counter() - started)
             
         except Exception as e:
             print(f"Error migrating data for {target_date}: {e}")
             db.rollback()
             raise
+
+    def refresh_after_migration(self, db: Session, target_date: date):
+        """
+        Bring the in-memory views up to date with a migrated day and notify clients. Only reads,
+        so it runs on a reader session (via run_sync) once the migration has committed.
+        """
+        # Drop latest values that only existed in the cleared day
+        latest_store.rebuild(db)
+        
+        # Cached comfort results are stale now; pre-compute them for every profile again
+        comfort_cache.clear()
+        warmed = comfort_cache.warm(db)
+        print(f"Warmed {warmed} comfort evaluations after migrating {target_date}")
+
+        # ETags issued before the migration no longer match
+        data_versions.bump_all(HISTORICAL)
+        data_versions.bump_all(REALTIME)
+
+        # Let open streams refresh their daily and historical views
+        live_hub.publish_all({"event": "day_migrated", "date": str(target_date)})
+
+        LAST_MIGRATED_DAY.set(day_bounds(target_date)[0].timestamp())
     
     
+    def delete_day_buckets(self, db: Session, target_date: date) -> int:
+        """
+        Delete a day's rollup buckets in chunks of MIGRATION_DELETE_CHUNK rows, committing
+        after each so ingest writes can take the writer connection in between
+        """
+        start_of_day, end_of_day = day_bounds(target_date)
+        deleted_count = 0
+        while True:
+            chunk = select(RealtimeBucket.id).where(
+                RealtimeBucket.bucket_start >= start_of_day,
+                RealtimeBucket.bucket_start < end_of_day
+            ).limit(MIGRATION_DELETE_CHUNK).scalar_subquery()
+            deleted = db.execute(delete(RealtimeBucket).where(RealtimeBucket.id.in_(chunk))).rowcount
+            db.commit()
+            deleted_count += deleted
+            if deleted < MIGRATION_DELETE_CHUNK:
+                return deleted_count
+    
     def stop(self):
         """Stop the data aggregator"""
         self.running = False
+        if self._stop_requested is not None:
+            self._stop_requested.set()
         print("Stopping data aggregator...")
 
 # Global aggregator instance
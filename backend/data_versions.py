@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Tables whose changes are tracked per property
+REALTIME = "realtime"
+HISTORICAL = "historical"
+
+
+class DataVersions:
+    """
+    Change counters per (table, property), bumped by the code paths that write those tables.
+    Responses derived from them get a strong ETag built from the counters instead of a hash of
+    the body, so an unchanged resource can be answered with 304 before any query runs.
+    Counters live in memory; the process epoch in every tag invalidates tags from earlier runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.epoch = format(int(time.time() * 1000), "x")
+        self._property_versions: Dict[Tuple[str, int], int] = defaultdict(int)
+        # Bumped when every property of a table changes at once (e.g. a day migration)
+        self._table_generations: Dict[str, int] = defaultdict(int)
+        # Number of changes of any property, for responses that cover every property
+        self._table_totals: Dict[str, int] = defaultdict(int)
+
+    def bump(self, table: str, property_ids: Iterable[int]) -> None:
+        with self._lock:
+            for property_id in set(property_ids):
+                self._property_versions[(table, property_id)] += 1
+                self._table_totals[table] += 1
+
+    def bump_all(self, table: str) -> None:
+        with self._lock:
+            self._table_generations[table] += 1
+            self._table_totals[table] += 1
+
+    def version(self, table: str, property_id: Optional[int] = None) -> str:
+        """Version of one property's rows in a table, or of the whole table"""
+        with self._lock:
+            if property_id is None:
+                return f"{self._table_generations[table]}.{self._table_totals[table]}"
+            return f"{self._table_generations[table]}.{self._property_versions[(table, property_id)]}"
+
+    def etag(self, *parts) -> str:
+        """Strong ETag for a response identified by the given versions and parameters"""
+        return '"' + "-".join([self.epoch, *(str(part) for part in parts)]) + '"'
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], etag: str) -> bool:
+        """
+        Whether an If-None-Match header value names the current ETag. "*" is not a match: the
+        conditional GETs answer before looking the resource up, so "*" cannot tell a property
+        that exists from one that would be a 404, and a 304 for the latter would be wrong.
+        """
+        if not if_none_match:
+            return False
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            # If-None-Match uses weak comparison
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == etag:
+                return True
+        return False
+
+
+# Global data version counters
+data_versions = DataVersions()
@@ -1,14 +1,28 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from storage import create_reader_engine, create_writer_engine
+from query_accounting import query_accounting
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sensor_app.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./sensor_app.db")
+# Same database through the aiosqlite driver, for the API and background tasks
+ASYNC_DATABASE_URL = os.environ.get(
+    "ASYNC_DATABASE_URL", SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
 )
+
+# Single-connection writer for ingest, the aggregator, migrations and CLI scripts
+engine = create_writer_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Pooled read-only connections for API reads on the event loop
+async_engine = create_reader_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Per-request query counts and the slow-query log cover both engines
+query_accounting.instrument(engine)
+query_accounting.instrument(async_engine.sync_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -18,3 +32,6 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
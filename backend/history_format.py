@@ -0,0 +1,72 @@
+"""
+Response formats for the history endpoints.
+"rows" (the default) is a list of {"time"/"date", "value"} objects per sensor. "columnar" is one
+shared axis plus one value array per sensor, with null where a sensor has no value at that point
+(and, for series whose points carry a sample "count", a matching count array per sensor).
+"msgpack" is the columnar form encoded as MessagePack. The msgpack package is listed in
+requirements.txt; on an install without it ?format=msgpack is answered with 406 Not Acceptable
+and an Accept header asking for MessagePack gets rows.
+"""
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency
+    msgpack = None
+
+FORMATS = ("rows", "columnar", "msgpack")
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """The format asked for by ?format=, else MessagePack if accepted and available, else rows"""
+    if requested:
+        requested = requested.lower()
+        if requested not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown format '{requested}', expected one of {', '.join(FORMATS)}")
+    elif msgpack is not None and accept and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        requested = "msgpack"
+    else:
+        requested = "rows"
+
+    if requested == "msgpack" and msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack responses need the msgpack package installed")
+    return requested
+
+
+def to_columnar(grouped_data: Dict[str, List[Dict]], axis: str) -> Dict:
+    """
+    Pivot {sensor: [{axis: x, "value": v}]} into {axis: [x...], "sensors": {sensor: [v...]}};
+    points with a "count" also fill {"counts": {sensor: [n...]}}
+    """
+    axis_values = sorted({point[axis] for points in grouped_data.values() for point in points})
+    positions = {value: index for index, value in enumerate(axis_values)}
+    with_counts = any("count" in point for points in grouped_data.values() for point in points)
+
+    sensors = {}
+    counts = {}
+    for sensor_type, points in grouped_data.items():
+        values = [None] * len(axis_values)
+        sensor_counts = [0] * len(axis_values)
+        for point in points:
+            values[positions[point[axis]]] = point["value"]
+            sensor_counts[positions[point[axis]]] = point.get("count", 0)
+        sensors[sensor_type] = values
+        counts[sensor_type] = sensor_counts
+
+    columnar = {axis: axis_values, "sensors": sensors}
+    if with_counts:
+        columnar["counts"] = counts
+    return columnar
+
+
+def render_history(grouped_data: Dict[str, List[Dict]], axis: str, response_format: str, headers=None):
+    """History payload in the negotiated format; headers are copied onto a MessagePack response"""
+    if response_format == "rows":
+        return grouped_data
+    columnar = to_columnar(grouped_data, axis)
+    if response_format == "columnar":
+        return columnar
+    return Response(content=msgpack.packb(columnar), media_type="application/msgpack", headers=dict(headers or {}))
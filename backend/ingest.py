@@ -0,0 +1,47 @@
+from collections import Counter
+from typing import List, Sequence
+from sqlalchemy.orm import Session
+from realtime_partitions import forget_partitions, insert_readings
+from rollups import ReadingTuple, local_time, upsert_buckets
+from latest_store import latest_store
+from comfort_cache import comfort_cache
+from live_stream import live_hub
+from data_versions import data_versions, REALTIME
+from metrics import metrics
+
+INGESTED_READINGS = metrics.counter(
+    "ingest_readings_total", "Realtime readings committed", ("property_id", "sensor_type")
+)
+
+
+def write_readings(db: Session, readings: Sequence[ReadingTuple]) -> List[int]:
+    """
+    Write realtime readings in one transaction: an executemany insert of the raw rows into
+    their day partitions, the matching 10-minute rollup upsert and one commit. Committed
+    readings are then pushed to live stream subscribers. Returns the new row ids in input order.
+    """
+    if not readings:
+        return []
+
+    readings = [
+        (property_id, sensor_type, value, local_time(timestamp))
+        for property_id, sensor_type, value, timestamp in readings
+    ]
+    try:
+        ids = insert_readings(db, readings)
+        upsert_buckets(db, readings)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # A partition created in the rolled back transaction no longer exists
+        forget_partitions()
+        raise
+
+    latest_store.record_many(readings)
+    comfort_cache.invalidate_properties(property_id for property_id, _, _, _ in readings)
+    data_versions.bump(REALTIME, (property_id for property_id, _, _, _ in readings))
+    live_hub.publish_readings(readings)
+    INGESTED_READINGS.inc_many(Counter(
+        (str(property_id), sensor_type.value) for property_id, sensor_type, _, _ in readings
+    ))
+    return ids
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Sequence, Tuple
+from database import SessionLocal
+from ingest import write_readings
+from rollups import ReadingTuple
+
+# "durable": requests wait until their readings are committed (group commit)
+# "acknowledged": requests return as soon as their readings are queued
+INGEST_MODE = os.environ.get("INGEST_MODE", "durable")
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "50000"))
+INGEST_FLUSH_SIZE = int(os.environ.get("INGEST_FLUSH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "0.2"))
+
+
+class IngestQueueFull(Exception):
+    """Raised when a submission would exceed the buffer's capacity"""
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for realtime readings.
+    Producers enqueue validated readings into a bounded in-memory queue; a single writer
+    thread drains it and commits everything pending in one transaction once the flush size
+    is reached or the oldest reading has waited for the flush interval.
+    """
+
+    def __init__(
+        self,
+        mode: str = INGEST_MODE,
+        max_depth: int = INGEST_QUEUE_SIZE,
+        flush_size: int = INGEST_FLUSH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+    ):
+        self.mode = mode
+        self.max_depth = max_depth
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._condition = threading.Condition()
+        self._pending: Deque[Tuple[Sequence[ReadingTuple], Future]] = deque()
+        self._depth = 0
+        self._oldest = 0.0
+        self._closed = False
+        self._thread = None
+        self._stats = {
+            "flushed_readings": 0,
+            "flushed_batches": 0,
+            "failed_readings": 0,
+            "rejected_readings": 0,
+            "last_flush_size": 0,
+            "last_flush_seconds": 0.0,
+        }
+
+    @property
+    def durable(self) -> bool:
+        return self.mode == "durable"
+
+    def start(self):
+        """Start the writer thread"""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+        print(f"Starting ingest writer ({self.mode} mode)...")
+
+    def submit(self, readings: Sequence[ReadingTuple]) -> Future:
+        """
+        Queue readings for the writer. The returned future resolves to the new row ids
+        once the readings are committed.
+        """
+        future: Future = Future()
+        if not readings:
+            future.set_result([])
+            return future
+
+        if self._thread is None and not self._closed:
+            self.start()
+
+        with self._condition:
+            if self._closed:
+                raise IngestQueueFull("Ingest buffer is shutting down")
+            if self._depth + len(readings) > self.max_depth:
+                self._stats["rejected_readings"] += len(readings)
+                raise IngestQueueFull(f"Ingest buffer is full ({self._depth}/{self.max_depth} readings queued)")
+            first = not self._pending
+            if first:
+                self._oldest = time.monotonic()
+            self._pending.append((readings, future))
+            self._depth += len(readings)
+            # Wake the writer to start the flush interval, or to flush a full batch now
+            if first or self._depth >= self.flush_size:
+                self._condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+
+                # Wait for a full batch, the flush interval or shutdown, whichever comes first
+                deadline = self._oldest + self.flush_interval
+                while self._depth < self.flush_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending
+                self._pending = deque()
+                self._depth = 0
+
+            self._flush(batch)
+
+    def _flush(self, batch: Deque[Tuple[Sequence[ReadingTuple], Future]]):
+        readings: List[ReadingTuple] = [reading for entry, _ in batch for reading in entry]
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            ids = write_readings(db, readings)
+        except Exception as e:
+            print(f"Error flushing {len(readings)} buffered readings: {e}")
+            self._stats["failed_readings"] += len(readings)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        offset = 0
+        for entry, future in batch:
+            future.set_result(ids[offset:offset + len(entry)])
+            offset += len(entry)
+
+        self._stats["flushed_readings"] += len(readings)
+        self._stats["flushed_batches"] += 1
+        self._stats["last_flush_size"] = len(readings)
+        self._stats["last_flush_seconds"] = round(time.perf_counter() - started, 6)
+
+    def stop(self, timeout: float = 30.0):
+        """Flush everything still queued and stop the writer thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        print("Stopped ingest writer")
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "mode": self.mode,
+                "queue_depth": self._depth,
+                "queue_capacity": self.max_depth,
+                "pending_requests": len(self._pending),
+                **self._stats,
+            }
+
+
+# Global ingest buffer instance
+ingest_buffer = IngestBuffer()
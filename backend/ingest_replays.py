@@ -0,0 +1,70 @@
+"""
+Replay protection for batch ingestion.
+A device that gives up waiting for a batch (e.g. a 503 after the commit timeout) cannot tell
+whether its readings were committed, so it resends the batch under the same Idempotency-Key.
+Each keyed batch is remembered for INGEST_REPLAY_TTL_SECONDS together with its ingest future:
+a resend waits on that same commit and gets the original result instead of writing the
+readings a second time. A batch whose commit failed is forgotten, so its resend is written anew.
+"""
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# How long a batch key is remembered; must exceed the longest device retry backoff
+INGEST_REPLAY_TTL_SECONDS = float(os.environ.get("INGEST_REPLAY_TTL_SECONDS", "900"))
+# Most batch keys remembered at once (oldest are forgotten first)
+INGEST_REPLAY_MAX_KEYS = int(os.environ.get("INGEST_REPLAY_MAX_KEYS", "1000"))
+
+
+class IngestedBatch(NamedTuple):
+    results: List[Dict[str, Any]]  # Per-item results before ids were assigned
+    accepted_indexes: List[int]  # Positions of the readings handed to the ingest buffer
+    future: Future  # The ingest buffer's commit of those readings
+    expires_at: float
+
+
+class IngestReplays:
+    """Recently ingested batches by idempotency key; used from the event loop only"""
+
+    def __init__(self, ttl: float = INGEST_REPLAY_TTL_SECONDS, max_keys: int = INGEST_REPLAY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._batches: "OrderedDict[str, IngestedBatch]" = OrderedDict()
+        self.replayed = 0
+
+    def get(self, key: str) -> Optional[IngestedBatch]:
+        """The batch ingested under this key, unless it expired or its commit failed"""
+        self._expire()
+        batch = self._batches.get(key)
+        if batch is None:
+            return None
+        if batch.future.done() and (batch.future.cancelled() or batch.future.exception() is not None):
+            del self._batches[key]
+            return None
+        self.replayed += 1
+        return batch
+
+    def put(self, key: str, results: List[Dict[str, Any]], accepted_indexes: List[int], future: Future) -> None:
+        self._batches.pop(key, None)
+        self._batches[key] = IngestedBatch(
+            [dict(item) for item in results], list(accepted_indexes), future, time.monotonic() + self.ttl
+        )
+        while len(self._batches) > self.max_keys:
+            self._batches.popitem(last=False)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._batches:
+            key, batch = next(iter(self._batches.items()))
+            if batch.expires_at > now:
+                break
+            del self._batches[key]
+
+    def stats(self) -> Dict:
+        return {"remembered_batches": len(self._batches), "replayed_batches": self.replayed}
+
+
+# Global replay store for keyed batch ingestion
+ingest_replays = IngestReplays()
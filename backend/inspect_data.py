@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
-from models import Property, RealtimeReading, HistoricalReading, SensorType
+from models import Property, HistoricalReading, SensorType
 from comfort_evaluator import ComfortEvaluator
 
 def inspect_property(db: Session, property_name: str):
@@ -0,0 +1,93 @@
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import Table, select
+from sqlalchemy.orm import Session
+from models import Property, SensorType
+from realtime_partitions import partition_days, partition_table
+from rollups import ReadingTuple, local_time
+
+
+def _newest(table: Table, sensor_type: SensorType, column):
+    """A column of the property's newest reading of a sensor in a partition, correlated to properties"""
+    return select(column).where(
+        table.c.property_id == Property.id,
+        table.c.sensor_type == sensor_type
+    ).order_by(table.c.timestamp.desc()).limit(1).scalar_subquery()
+
+
+class LatestReadingStore:
+    """
+    Process-wide latest value per (property_id, sensor_type).
+    Writers update it as readings are committed and it is rebuilt from the realtime
+    partitions on startup, so the last value of any sensor is a dictionary lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._readings: Dict[Tuple[int, SensorType], Tuple[float, datetime]] = {}
+        self.loaded = False
+
+    def rebuild(self, db: Session) -> int:
+        """
+        Reload the latest reading of every (property, sensor) from the realtime partitions.
+        Each property's newest reading is looked up in the partitions' (property, sensor,
+        timestamp) index, one query per partition and sensor, instead of ranking every reading.
+        """
+        readings: Dict[Tuple[int, SensorType], Tuple[float, datetime]] = {}
+        for day in partition_days(db):
+            table = partition_table(day)
+            for sensor_type in SensorType:
+                rows = db.query(
+                    Property.id.label('property_id'),
+                    _newest(table, sensor_type, table.c.value).label('value'),
+                    _newest(table, sensor_type, table.c.timestamp).label('timestamp')
+                )
+                for row in rows:
+                    key = (row.property_id, sensor_type)
+                    if row.timestamp is not None and (key not in readings or row.timestamp > readings[key][1]):
+                        readings[key] = (row.value, row.timestamp)
+
+        with self._lock:
+            self._readings = readings
+            self.loaded = True
+        return len(readings)
+
+    def ensure_loaded(self, db: Session) -> None:
+        """Load from the database on first use (e.g. CLI scripts that never ran startup)"""
+        if not self.loaded:
+            self.rebuild(db)
+
+    def record(self, property_id: int, sensor_type: SensorType, value: float, timestamp: datetime) -> None:
+        """Record a newly written reading if it is newer than the one held"""
+        self.record_many([(property_id, sensor_type, value, timestamp)])
+
+    def record_many(self, readings: Iterable[ReadingTuple]) -> None:
+        with self._lock:
+            for property_id, sensor_type, value, timestamp in readings:
+                # Stored the way SQLite hands timestamps back: naive GMT+8 wall-clock time
+                timestamp = local_time(timestamp).replace(tzinfo=None)
+                key = (property_id, sensor_type)
+                current = self._readings.get(key)
+                if current is None or timestamp >= current[1]:
+                    self._readings[key] = (value, timestamp)
+
+    def get(self, property_id: int, sensor_type: SensorType) -> Optional[Tuple[float, datetime]]:
+        return self._readings.get((property_id, sensor_type))
+
+    def get_property(self, db: Session, property_id: int) -> Dict[SensorType, Dict]:
+        """Latest value and timestamp for each sensor of a property that has data"""
+        self.ensure_loaded(db)
+        readings: Dict[SensorType, Dict] = {}
+        for sensor_type in SensorType:
+            latest = self._readings.get((property_id, sensor_type))
+            if latest:
+                readings[sensor_type] = {
+                    "value": latest[0],
+                    "timestamp": latest[1],
+                }
+        return readings
+
+
+# Global latest-reading store
+latest_store = LatestReadingStore()
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from rollups import ReadingTuple, local_time
+
+# Events buffered per subscriber before it is considered too slow and dropped
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", "100"))
+# Seconds between keep-alive comments on an idle stream
+STREAM_HEARTBEAT = float(os.environ.get("STREAM_HEARTBEAT", "15.0"))
+
+
+class Subscription:
+    """One client's bounded queue of pending events for a property"""
+
+    def __init__(self, property_id: int, max_events: int):
+        self.property_id = property_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_events)
+        self.dropped = False
+
+
+class LiveStreamHub:
+    """
+    Fan-out of property events to streaming clients.
+    Writers publish from any thread; events are handed to the event loop and copied into
+    each subscriber's bounded queue. A subscriber whose queue is full is dropped (its stream
+    ends and the client reconnects), so one slow client never holds up writers or other clients.
+    """
+
+    def __init__(self, max_events: int = STREAM_QUEUE_SIZE):
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._stats = {"published_events": 0, "delivered_events": 0, "dropped_subscribers": 0}
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Bind the hub to the event loop serving the streams (called on startup)"""
+        self._loop = loop
+
+    def subscribe(self, property_id: int) -> Subscription:
+        subscription = Subscription(property_id, self.max_events)
+        with self._lock:
+            self._subscribers[property_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.property_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.property_id]
+
+    def has_subscribers(self, property_id: int) -> bool:
+        return property_id in self._subscribers
+
+    def publish(self, property_id: int, event: Dict) -> None:
+        """Queue an event for every subscriber of a property; safe to call from any thread"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.has_subscribers(property_id):
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, property_id, event)
+        except RuntimeError:
+            pass  # Loop shut down between the check and the call
+
+    def publish_all(self, event: Dict) -> None:
+        """Queue an event for every subscriber of every property"""
+        with self._lock:
+            property_ids = list(self._subscribers.keys())
+        for property_id in property_ids:
+            self.publish(property_id, event)
+
+    def publish_readings(self, readings: Iterable[ReadingTuple]) -> None:
+        """Publish newly committed readings, one event per property that has subscribers"""
+        by_property: Dict[int, List[Dict]] = defaultdict(list)
+        for property_id, sensor_type, value, timestamp in readings:
+            if not self.has_subscribers(property_id):
+                continue
+            by_property[property_id].append({
+                "sensor_type": sensor_type.value,
+                "value": value,
+                "timestamp": local_time(timestamp).replace(tzinfo=None).isoformat(),
+            })
+
+        for property_id, property_readings in by_property.items():
+            # Latest value per sensor among the new readings
+            latest: Dict[str, Dict] = {}
+            for reading in property_readings:
+                current = latest.get(reading["sensor_type"])
+                if current is None or reading["timestamp"] >= current["timestamp"]:
+                    latest[reading["sensor_type"]] = {
+                        "value": reading["value"],
+                        "timestamp": reading["timestamp"],
+                    }
+            self.publish(property_id, {
+                "event": "readings",
+                "property_id": property_id,
+                "readings": property_readings,
+                "latest": latest,
+            })
+
+    def _dispatch(self, property_id: int, event: Dict) -> None:
+        self._stats["published_events"] += 1
+        with self._lock:
+            subscribers = list(self._subscribers.get(property_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+                self._stats["delivered_events"] += 1
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        """Disconnect a subscriber that stopped keeping up"""
+        self.unsubscribe(subscription)
+        subscription.dropped = True
+        self._stats["dropped_subscribers"] += 1
+        # Make room for the sentinel that ends its stream
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    async def stream(self, property_id: int, initial_event: Optional[Callable[[], Dict]] = None):
+        """
+        Server-Sent Events for a property, with keep-alive comments while idle.
+        The initial event is built after subscribing so nothing committed in between is missed.
+        """
+        subscription = self.subscribe(property_id)
+        try:
+            # Tell EventSource clients how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            if initial_event is not None:
+                yield self.format_event(initial_event())
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield self.format_event(event)
+        finally:
+            self.unsubscribe(subscription)
+
+    @staticmethod
+    def format_event(event: Dict) -> str:
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    def stats(self) -> Dict:
+        with self._lock:
+            subscribers = sum(len(subscribers) for subscribers in self._subscribers.values())
+            properties = len(self._subscribers)
+        return {
+            "subscribers": subscribers,
+            "properties": properties,
+            "queue_size": self.max_events,
+            **self._stats,
+        }
+
+
+# Global live stream hub
+live_hub = LiveStreamHub()
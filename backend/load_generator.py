@@ -0,0 +1,361 @@
+"""
+Synthetic fleet load generator for capacity planning.
+Parses the day/night comfort ranges of listings.csv, clones and jitters them into N synthetic
+properties created in bulk, then drives ingest traffic at the SensorSimulator cadence (optionally
+sped up) either against a running server's batch endpoint or straight into the database.
+Reports generated versus acknowledged readings per second, scheduling lag and request latency.
+
+Usage:
+    python load_generator.py --properties 5000 --seconds 60 --target http --url http://localhost:8000
+    python load_generator.py --properties 1000 --seconds 30 --target db --speedup 10 --json result.json
+
+With --target http the properties are created through the server's database file (DATABASE_URL),
+so run it on the server host or against a shared database. The server's own simulator stops
+simulating a property once it receives its readings over HTTP. With --target db the readings
+bypass any running server on that database: its latest values, comfort scores and ETags are
+kept in memory and stay stale until it is restarted.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import httpx
+except ImportError:  # Only needed for --target http
+    httpx = None
+
+from sqlalchemy import func, insert, select
+
+from database import Base, SessionLocal, engine
+from migrations import run_migrations
+from models import Property
+from ingest import write_readings
+from sensor_simulator import SensorSimulator
+
+DEFAULT_LISTINGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "listings.csv")
+SYNTHETIC_PREFIX = "Synthetic Property"
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_RANGE = re.compile(rf"(<)?\s*{_NUMBER}(?:\s*-\s*{_NUMBER})?")
+
+
+def parse_range(text: str) -> Tuple[float, float]:
+    """'23 - 25 °C' -> (23, 25); '< 50 lux' -> (0, 50)"""
+    match = _RANGE.search(text)
+    if not match:
+        raise ValueError(f"No range in {text!r}")
+    below, low, high = match.groups()
+    if below:
+        return 0.0, float(low)
+    return float(low), float(high or low)
+
+
+def parse_day_night(cell: str) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    """'600 - 800 lux / <10 lux' -> day and night ranges (the same range when there is no '/')"""
+    day, _, night = cell.partition(" / ") if " / " in cell else cell.partition("/")
+    day_range = parse_range(day)
+    return day_range, parse_range(night) if night.strip() else day_range
+
+
+def parse_listings(path: str) -> List[Dict]:
+    """listings.csv rows as SensorSimulator profiles"""
+    profiles = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader)  # Header
+        for row in reader:
+            if len(row) < 6 or not row[0].strip():
+                continue
+            temp_day, temp_night = parse_day_night(row[1])
+            light_day, light_night = parse_day_night(row[3])
+            sound_day, sound_night = parse_day_night(row[5])
+            profiles.append({
+                "temp_day": temp_day, "temp_night": temp_night,
+                "humidity": parse_range(row[2]),
+                "light_day": light_day, "light_night": light_night,
+                # PM2.5 part of "PM2.5 / CO2"
+                "aq": parse_range(row[4].split("/")[0]),
+                "sound_day": sound_day, "sound_night": sound_night,
+            })
+    if not profiles:
+        raise ValueError(f"No listings found in {path}")
+    return profiles
+
+
+# Profile keys scaled together, so a clone keeps its day/night relationship per sensor
+JITTER_GROUPS = (
+    ("temp_day", "temp_night"),
+    ("humidity",),
+    ("light_day", "light_night"),
+    ("aq",),
+    ("sound_day", "sound_night"),
+)
+
+
+def jitter_profiles(base_profiles: Sequence[Dict], count: int, jitter: float, seed: Optional[int] = None) -> List[Dict]:
+    """Clone base profiles round-robin into `count` profiles, scaling each sensor's ranges by 1 ± jitter"""
+    rng = random.Random(seed)
+    profiles = []
+    for index in range(count):
+        base = base_profiles[index % len(base_profiles)]
+        profile = {}
+        for keys in JITTER_GROUPS:
+            factor = 1 + rng.uniform(-jitter, jitter)
+            for key in keys:
+                low, high = base[key]
+                profile[key] = (round(low * factor, 2), round(high * factor, 2))
+        profiles.append(profile)
+    return profiles
+
+
+def create_properties(count: int, base_count: int) -> List[int]:
+    """
+    Create (or reuse) `count` synthetic properties in one bulk insert.
+    Returns their ids in creation order.
+    """
+    db = SessionLocal()
+    try:
+        existing = list(db.scalars(
+            select(Property.id).where(Property.name.like(f"{SYNTHETIC_PREFIX} %")).order_by(Property.id)
+        ))
+        missing = count - len(existing)
+        if missing > 0:
+            next_number = len(existing) + 1
+            db.execute(insert(Property), [
+                {
+                    "name": f"{SYNTHETIC_PREFIX} {number}",
+                    "address": "",
+                    "description": f"Load test clone of listing {(number - 1) % base_count + 1}",
+                    "image_url": "",
+                }
+                for number in range(next_number, next_number + missing)
+            ])
+            db.commit()
+            existing = list(db.scalars(
+                select(Property.id).where(Property.name.like(f"{SYNTHETIC_PREFIX} %")).order_by(Property.id)
+            ))
+        total = db.scalar(select(func.count(Property.id)))
+        print(f"Synthetic properties: {count} used ({max(missing, 0)} created), {total} properties in the database")
+        return existing[:count]
+    finally:
+        db.close()
+
+
+def fleet_simulator(property_ids: List[int], profiles: List[Dict], speedup: float) -> SensorSimulator:
+    """Simulator whose profile for property id N is the jittered clone assigned to it"""
+    by_id: List[Dict] = [profiles[0]] * max(property_ids)
+    for property_id, profile in zip(property_ids, profiles):
+        by_id[property_id - 1] = profile
+    rates = {sensor_type: rate / speedup for sensor_type, rate in SensorSimulator.SAMPLE_RATES.items()}
+    return SensorSimulator(profiles=by_id, sample_rates=rates)
+
+
+class LoadStats:
+    def __init__(self):
+        self.generated = 0
+        self.acknowledged = 0
+        self.rejected = 0
+        self.failed_requests = 0
+        self.latencies: List[float] = []
+        self.max_lag = 0.0
+        self.lags: List[float] = []
+
+    def percentile(self, values: List[float], fraction: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def summary(self, elapsed: float) -> Dict:
+        return {
+            "seconds": round(elapsed, 2),
+            "generated": self.generated,
+            "acknowledged": self.acknowledged,
+            "rejected": self.rejected,
+            "failed_requests": self.failed_requests,
+            "generated_per_second": round(self.generated / elapsed, 1) if elapsed else 0.0,
+            "acknowledged_per_second": round(self.acknowledged / elapsed, 1) if elapsed else 0.0,
+            "latency_p50_ms": _ms(self.percentile(self.latencies, 0.5)),
+            "latency_p95_ms": _ms(self.percentile(self.latencies, 0.95)),
+            "latency_max_ms": _ms(max(self.latencies) if self.latencies else None),
+            "schedule_lag_mean_ms": _ms(statistics.fmean(self.lags) if self.lags else None),
+            "schedule_lag_max_ms": _ms(self.max_lag),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def to_payload(readings) -> List[Dict]:
+    return [
+        {
+            "property_id": property_id,
+            "sensor_type": sensor_type.value,
+            "value": value,
+            "timestamp": timestamp.isoformat(),
+        }
+        for property_id, sensor_type, value, timestamp in readings
+    ]
+
+
+async def send_http(client, batch, stats: LoadStats):
+    started = time.monotonic()
+    try:
+        response = await client.post("/realtime/ingest/batch", json=to_payload(batch))
+        stats.latencies.append(time.monotonic() - started)
+        if response.status_code == 201:
+            result = response.json()
+            stats.acknowledged += result["accepted"]
+            stats.rejected += result["rejected"]
+        else:
+            stats.failed_requests += 1
+            stats.rejected += len(batch)
+    except httpx.HTTPError as e:
+        stats.failed_requests += 1
+        stats.rejected += len(batch)
+        print(f"Request failed: {e!r}")
+
+
+async def send_db(batch, stats: LoadStats):
+    def write():
+        db = SessionLocal()
+        try:
+            return len(write_readings(db, batch))
+        finally:
+            db.close()
+
+    started = time.monotonic()
+    try:
+        written = await asyncio.to_thread(write)
+        stats.acknowledged += written
+        stats.latencies.append(time.monotonic() - started)
+    except Exception as e:
+        stats.failed_requests += 1
+        stats.rejected += len(batch)
+        print(f"Write failed: {e}")
+
+
+async def drive(simulator: SensorSimulator, property_ids: List[int], args) -> Dict:
+    stats = LoadStats()
+    slots = asyncio.Semaphore(args.concurrency)
+    pending = set()
+    client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout) if args.target == "http" else None
+
+    async def dispatch(batch):
+        try:
+            if client is not None:
+                await send_http(client, batch, stats)
+            else:
+                await send_db(batch, stats)
+        finally:
+            slots.release()
+
+    started = time.time()
+    deadline = started + args.seconds
+    next_report = started + args.report_every
+    reported = (started, 0, 0)
+    simulator.set_properties(property_ids, started)
+    try:
+        while time.time() < deadline:
+            now = time.time()
+            due = simulator.next_due()
+            if due is not None and due <= now:
+                # First readings are due as the run starts; lag counts from then
+                lag = now - max(due, started)
+                stats.lags.append(lag)
+                stats.max_lag = max(stats.max_lag, lag)
+            readings = simulator.due_readings(now)
+            stats.generated += len(readings)
+            for offset in range(0, len(readings), args.batch_size):
+                # Back-pressure: wait for a free request slot, which shows up as schedule lag
+                await slots.acquire()
+                task = asyncio.create_task(dispatch(readings[offset:offset + args.batch_size]))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            now = time.time()
+            if now >= next_report:
+                since, generated, acknowledged = reported
+                print(
+                    f"[{now - started:6.1f}s] generated {(stats.generated - generated) / (now - since):8.0f}/s  "
+                    f"acknowledged {(stats.acknowledged - acknowledged) / (now - since):8.0f}/s  "
+                    f"in flight {len(pending):3d}  max lag {stats.max_lag * 1000:7.1f} ms"
+                )
+                reported = (now, stats.generated, stats.acknowledged)
+                next_report = now + args.report_every
+
+            due = simulator.next_due()
+            await asyncio.sleep(0 if due is None else min(max(due - time.time(), 0.0), 0.5))
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        if client is not None:
+            await client.aclose()
+    return stats.summary(time.time() - started)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", default=DEFAULT_LISTINGS, help="listings.csv-style comfort ranges")
+    parser.add_argument("--properties", type=int, default=1000, help="synthetic properties in the fleet")
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative jitter applied to cloned ranges")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--seconds", type=float, default=60.0, help="how long to drive traffic")
+    parser.add_argument("--speedup", type=float, default=1.0, help="divide the SAMPLE_RATES intervals by this")
+    parser.add_argument("--target", choices=("http", "db"), default="http")
+    parser.add_argument("--url", default="http://localhost:8000", help="server for --target http")
+    parser.add_argument("--batch-size", type=int, default=500, help="readings per request or write")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests or writes in flight")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP request timeout in seconds")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    if args.target == "http" and httpx is None:
+        print("--target http needs httpx (pip install httpx)")
+        return 2
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    base_profiles = parse_listings(args.listings)
+    print(f"Parsed {len(base_profiles)} listing profiles from {args.listings}")
+    property_ids = create_properties(args.properties, len(base_profiles))
+    profiles = jitter_profiles(base_profiles, len(property_ids), args.jitter, args.seed)
+    simulator = fleet_simulator(property_ids, profiles, args.speedup)
+
+    expected = len(property_ids) * sum(1 / rate for rate in simulator.sample_rates.values())
+    print(
+        f"Driving {len(property_ids)} properties for {args.seconds:.0f}s into {args.target} "
+        f"(steady state about {expected:.0f} readings/s after the initial burst)"
+    )
+    summary = asyncio.run(drive(simulator, property_ids, args))
+    summary.update({
+        "properties": len(property_ids),
+        "target": args.target,
+        "speedup": args.speedup,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "expected_steady_per_second": round(expected, 1),
+    })
+
+    print(json.dumps(summary, indent=2))
+    if args.target == "db":
+        print("Readings were written straight to the database: restart any server using it to see them.")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if not summary["failed_requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
+from typing import Any, Dict, List, Optional
+from pydantic import ValidationError
 import uvicorn
 import asyncio
 
-from database import engine, get_db, Base
-from models import Property as PropertyModel, CustomerProfile as CustomerProfileModel, SensorReading, SensorType, RealtimeReading, HistoricalReading
+from database import engine, async_engine, get_async_db, Base, AsyncSessionLocal, SessionLocal
+from models import Property as PropertyModel, CustomerProfile as CustomerProfileModel, SensorReading, SensorType, HistoricalReading
 import schemas
-from data_aggregator import aggregator
+from migrations import run_migrations
+from data_aggregator import aggregator, LATE_READING_MAX_DAYS
+from realtime_partitions import partition_days, partition_row_counts
 from sensor_simulator import simulator
 from comfort_evaluator import ComfortEvaluator
+from latest_store import latest_store
+from comfort_cache import comfort_cache
+from match_counters import sync_match_counters
+from ingest_buffer import ingest_buffer, IngestQueueFull
+from ingest_replays import ingest_replays
+from live_stream import live_hub
+from data_versions import data_versions, REALTIME, HISTORICAL
+from history_format import negotiate_format, render_history
+from rollups import day_bucket_averages, local_time, rebuild_day_buckets
+from rollup_tiers import query_rollups
+from metrics import metrics, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from query_accounting import QueryAccountingMiddleware
+from gzip_requests import GzipRequestMiddleware
 from datetime import datetime, timedelta, date, timezone
 from collections import defaultdict
 
 # GMT+8 timezone
 GMT_PLUS_8 = timezone(timedelta(hours=8))
 
-# Create database tables
+# Upper bound on readings accepted by a single batch ingestion request
+MAX_INGEST_BATCH_SIZE = 10000
+
+# How long a durable ingest request waits for its readings to be committed
+INGEST_COMMIT_TIMEOUT = 10.0
+
+# Create database tables and bring existing ones up to the current schema version
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(title="Real Estate Sensor API")
 
@@ -30,67 +55,144 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # Read by the frontend to revalidate with If-None-Match
 )
+# Devices upload batches gzip-compressed
+app.add_middleware(GzipRequestMiddleware)
+# Query count and DB time per request (response headers when QUERY_DEBUG is set)
+app.add_middleware(QueryAccountingMiddleware)
+# Outermost, so the latency histogram covers CORS handling too
+app.add_middleware(RequestMetricsMiddleware)
+
+def initialize_data(db: Session):
+    """Seed sample properties and rebuild the derived in-memory and rollup state"""
+    # Create initial properties if they don't exist
+    existing = db.query(PropertyModel).first()
+    if not existing:
+        # Create sample properties
+        sample_properties = [
+            PropertyModel(
+                name="Sunny Apartment",
+                address="123 Main Street, City",
+                description="Bright and spacious apartment with great natural light",
+                image_url="https://via.placeholder.com/300x200?text=Sunny+Apartment"
+            ),
+            PropertyModel(
+                name="Modern Condo",
+                address="456 Park Avenue, City",
+                description="Contemporary condo with premium finishes and amenities",
+                image_url="https://via.placeholder.com/300x200?text=Modern+Condo"
+            ),
+            PropertyModel(
+                name="Cozy Townhouse",
+                address="789 Oak Road, City",
+                description="Charming townhouse perfect for families",
+                image_url="https://via.placeholder.com/300x200?text=Cozy+Townhouse"
+            ),
+            PropertyModel(
+                name="Luxury Penthouse",
+                address="321 Summit Street, City",
+                description="Exclusive penthouse with panoramic views",
+                image_url="https://via.placeholder.com/300x200?text=Luxury+Penthouse"
+            ),
+        ]
+        for prop in sample_properties:
+            db.add(prop)
+        db.commit()
+
+    # Bring the 10-minute rollups of today and of every day still awaiting migration in line
+    # with raw readings written before this start
+    today = datetime.now(GMT_PLUS_8).date()
+    for day in sorted({today, *partition_days(db)}):
+        rebuild_day_buckets(db, day)
+    db.commit()
+
+    # Load the latest value of every sensor into memory
+    latest_store.rebuild(db)
+
+    # Rebuild annual match counters whose profile ranges or source data changed
+    sync_match_counters(db, ComfortEvaluator.PROFILES)
+    db.commit()
+
+    # Pre-compute comfort evaluations of every property for every profile
+    comfort_cache.warm(db)
 
 # Startup event to initialize database
 @app.on_event("startup")
 async def startup_event():
-    db = next(get_db())
-    try:
-        # Create initial properties if they don't exist
-        existing = db.query(PropertyModel).first()
-        if not existing:
-            # Create sample properties
-            sample_properties = [
-                PropertyModel(
-                    name="Sunny Apartment",
-                    address="123 Main Street, City",
-                    description="Bright and spacious apartment with great natural light",
-                    image_url="https://via.placeholder.com/300x200?text=Sunny+Apartment"
-                ),
-                PropertyModel(
-                    name="Modern Condo",
-                    address="456 Park Avenue, City",
-                    description="Contemporary condo with premium finishes and amenities",
-                    image_url="https://via.placeholder.com/300x200?text=Modern+Condo"
-                ),
-                PropertyModel(
-                    name="Cozy Townhouse",
-                    address="789 Oak Road, City",
-                    description="Charming townhouse perfect for families",
-                    image_url="https://via.placeholder.com/300x200?text=Cozy+Townhouse"
-                ),
-                PropertyModel(
-                    name="Luxury Penthouse",
-                    address="321 Summit Street, City",
-                    description="Exclusive penthouse with panoramic views",
-                    image_url="https://via.placeholder.com/300x200?text=Luxury+Penthouse"
-                ),
-            ]
-            for prop in sample_properties:
-                db.add(prop)
-            db.commit()
-    finally:
-        db.close()
+    # Seeding and rebuilds write, so they run on the writer connection off the event loop
+    def initialize_with_writer():
+        db = SessionLocal()
+        try:
+            initialize_data(db)
+        finally:
+            db.close()
+    await asyncio.to_thread(initialize_with_writer)
+
     # Start data aggregator in background
     asyncio.create_task(aggregator.aggregate_and_migrate())
     # Start sensor simulator in background
     asyncio.create_task(simulator.simulate_sensors())
+    # Start the ingest writer that group-commits buffered readings
+    ingest_buffer.start()
+    # Committed readings are pushed to live streams on this loop
+    live_hub.attach_loop(asyncio.get_running_loop())
+
+# Shutdown event to stop background work and flush buffered readings
+@app.on_event("shutdown")
+async def shutdown_event():
+    simulator.stop()
+    aggregator.stop()
+    await asyncio.to_thread(ingest_buffer.stop)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Real Estate Sensor API", "version": "1.0.0"}
 
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Conditional GET: a 304 response if the client's If-None-Match already matches the ETag,
+    otherwise None after tagging the response so the client can revalidate next time.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if data_versions.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def today_gmt8() -> str:
+    return datetime.now(GMT_PLUS_8).date().isoformat()
+
+def too_late(timestamp: datetime) -> bool:
+    """Whether a GMT+8 reading timestamp is older than the aggregator still merges into migrated days"""
+    return timestamp.date() < datetime.now(GMT_PLUS_8).date() - timedelta(days=LATE_READING_MAX_DAYS)
+
+LATE_READING_ERROR = f"Reading is more than {LATE_READING_MAX_DAYS} days old"
+
 @app.get("/properties", response_model=List[schemas.PropertyWithComfort])
-def get_properties(
-    customer_type: str = ComfortEvaluator.DEFAULT_PROFILE, db: Session = Depends(get_db)
+async def get_properties(
+    request: Request,
+    response: Response,
+    customer_type: str = ComfortEvaluator.DEFAULT_PROFILE,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all properties with comfort scores for the selected customer type"""
-    properties = db.query(PropertyModel).all()
+    etag = data_versions.etag(
+        data_versions.version(REALTIME),
+        data_versions.version(HISTORICAL),
+        ComfortEvaluator.normalize_profile(customer_type),
+        today_gmt8(),
+    )
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    properties = (await db.scalars(select(PropertyModel))).all()
+    comfort_scores = await db.run_sync(comfort_cache.get_scores, [prop.id for prop in properties], customer_type)
     result = []
     
     for prop in properties:
-        comfort_score = ComfortEvaluator.get_property_comfort_score(db, prop.id, customer_type)
+        comfort_score = comfort_scores[prop.id]
         
         # Determine comfort level
         if comfort_score >= 85:
@@ -119,32 +221,44 @@ def get_properties(
     return result
 
 @app.get("/properties/{property_id}", response_model=schemas.PropertyDetail)
-def get_property(property_id: int, db: Session = Depends(get_db)):
+async def get_property(property_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific property"""
-    property = db.query(PropertyModel).filter(PropertyModel.id == property_id).first()
+    property = await db.get(PropertyModel, property_id)
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
     return property
 
 @app.get("/customer-profiles", response_model=List[schemas.CustomerProfile])
-def get_customer_profiles(db: Session = Depends(get_db)):
+async def get_customer_profiles(db: AsyncSession = Depends(get_async_db)):
     """Get all customer profiles"""
-    profiles = db.query(CustomerProfileModel).all()
+    profiles = (await db.scalars(select(CustomerProfileModel))).all()
     return profiles
 
 @app.get("/properties/{property_id}/comfort", response_model=schemas.PropertyComfort)
-def get_property_comfort(
+async def get_property_comfort(
     property_id: int, 
+    request: Request,
+    response: Response,
     customer_type: str = ComfortEvaluator.DEFAULT_PROFILE,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get comfort evaluation for a specific property"""
-    property = db.query(PropertyModel).filter(PropertyModel.id == property_id).first()
+    etag = data_versions.etag(
+        data_versions.version(REALTIME, property_id),
+        data_versions.version(HISTORICAL, property_id),
+        ComfortEvaluator.normalize_profile(customer_type),
+        today_gmt8(),
+    )
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    property = await db.get(PropertyModel, property_id)
     
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
     
-    comfort_data = ComfortEvaluator.evaluate_property_comfort(db, property_id, customer_type)
+    comfort_data = await db.run_sync(comfort_cache.get, property_id, customer_type)
     
     return {
         "property_id": property_id,
@@ -155,135 +269,291 @@ def get_property_comfort(
         "insights": comfort_data["insights"]
     }
 
+def submit_readings(readings):
+    """Hand readings to the write-behind ingest buffer; 503 if it is full"""
+    try:
+        return ingest_buffer.submit(readings)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def wait_for_commit(response: Response, future) -> List[int]:
+    """
+    In durable mode wait for the group commit of submitted readings and return the new ids;
+    in acknowledged mode return straight away with 202 Accepted and no ids.
+    """
+    if not ingest_buffer.durable:
+        response.status_code = 202
+        return []
+
+    try:
+        # Shielded so a timeout does not cancel the writer's future
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), INGEST_COMMIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Timed out waiting for readings to be committed")
+
+async def buffered_write(response: Response, readings) -> List[int]:
+    """Hand readings to the write-behind ingest buffer and wait for them as wait_for_commit does"""
+    return await wait_for_commit(response, submit_readings(readings))
+
+def batch_result(results: List[Dict[str, Any]], accepted_indexes: List[int], reading_ids: List[int]) -> Dict:
+    """Batch response from per-item results and the ids of the accepted readings"""
+    results = [dict(item) for item in results]
+    for position, index in enumerate(accepted_indexes):
+        results[index]["accepted"] = True
+        results[index]["id"] = reading_ids[position] if reading_ids else None
+    return {
+        "accepted": len(accepted_indexes),
+        "rejected": len(results) - len(accepted_indexes),
+        "results": results,
+    }
+
 @app.post("/realtime/ingest", status_code=201)
-def ingest_realtime_reading(
+async def ingest_realtime_reading(
     payload: schemas.RealtimeReadingCreate,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Ingest a single real-time sensor reading from external sources (e.g., Raspberry Pi).
     This endpoint is designed to receive sensor data from property 11 (Raspberry Pi).
     """
     # Ensure property exists
-    property_obj = db.query(PropertyModel).filter(
-        PropertyModel.id == payload.property_id
-    ).first()
+    property_obj = await db.get(PropertyModel, payload.property_id)
     if not property_obj:
         raise HTTPException(status_code=404, detail="Property not found")
 
-    # Use provided timestamp or server "now" in GMT+8
-    ts = payload.timestamp if payload.timestamp else datetime.now(GMT_PLUS_8)
+    # Use provided timestamp (normalized to GMT+8) or server "now" in GMT+8
+    ts = local_time(payload.timestamp)
+    if too_late(ts):
+        raise HTTPException(status_code=422, detail=LATE_READING_ERROR)
 
-    reading = RealtimeReading(
-        property_id=payload.property_id,
-        sensor_type=payload.sensor_type,
-        value=payload.value,
-        timestamp=ts,
-    )
-    db.add(reading)
-    db.commit()
-    db.refresh(reading)
+    reading_ids = await buffered_write(response, [(payload.property_id, payload.sensor_type, payload.value, ts)])
 
     # Notify simulator that real data was received for this property
     simulator.record_real_ingestion(payload.property_id)
 
     return {
-        "id": reading.id,
-        "property_id": reading.property_id,
-        "sensor_type": reading.sensor_type.value,
-        "value": reading.value,
-        "timestamp": reading.timestamp.isoformat(),
+        "id": reading_ids[0] if reading_ids else None,
+        "property_id": payload.property_id,
+        "sensor_type": payload.sensor_type.value,
+        "value": payload.value,
+        "timestamp": ts.replace(tzinfo=None).isoformat(),
     }
 
+@app.post("/realtime/ingest/batch", status_code=201, response_model=schemas.RealtimeBatchResult)
+async def ingest_realtime_batch(
+    response: Response,
+    payload: List[Dict[str, Any]] = Body(...),
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Ingest an array of real-time sensor readings, possibly for several properties and sensor types.
+    Property ids are validated once per batch, all accepted readings are committed together
+    by the ingest writer and each item is reported as accepted or rejected.
+    The body may be sent gzip-compressed with Content-Encoding: gzip. A batch resent with the
+    Idempotency-Key of an earlier one (e.g. after a 503) returns that batch's result instead of
+    storing its readings again.
+    """
+    if idempotency_key is not None:
+        replay = ingest_replays.get(idempotency_key)
+        if replay is not None:
+            reading_ids = await wait_for_commit(response, replay.future)
+            return batch_result(replay.results, replay.accepted_indexes, reading_ids)
+
+    if len(payload) > MAX_INGEST_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {MAX_INGEST_BATCH_SIZE} readings"
+        )
+
+    results = [{"index": index, "accepted": False} for index in range(len(payload))]
+    candidates = []
+    for index, item in enumerate(payload):
+        try:
+            candidates.append((index, schemas.RealtimeReadingCreate.model_validate(item)))
+        except ValidationError as e:
+            results[index]["error"] = "; ".join(error["msg"] for error in e.errors())
+
+    # Ensure properties exist (one lookup for the whole batch)
+    requested_ids = {reading.property_id for _, reading in candidates}
+    known_ids = set(
+        await db.scalars(select(PropertyModel.id).where(PropertyModel.id.in_(requested_ids)))
+    ) if requested_ids else set()
+
+    accepted = []
+    for index, reading in candidates:
+        if reading.property_id not in known_ids:
+            results[index]["error"] = "Property not found"
+            continue
+        ts = local_time(reading.timestamp)
+        if too_late(ts):
+            results[index]["error"] = LATE_READING_ERROR
+            continue
+        accepted.append((index, reading, ts))
+
+    future = submit_readings([
+        (reading.property_id, reading.sensor_type, reading.value, ts)
+        for _, reading, ts in accepted
+    ])
+    accepted_indexes = [index for index, _, _ in accepted]
+    if idempotency_key is not None:
+        # Remembered before waiting, so a resend after a commit timeout waits on this commit
+        ingest_replays.put(idempotency_key, results, accepted_indexes, future)
+    reading_ids = await wait_for_commit(response, future)
+
+    # Notify simulator that real data was received for these properties
+    for property_id in {reading.property_id for _, reading, _ in accepted}:
+        simulator.record_real_ingestion(property_id)
+
+    return batch_result(results, accepted_indexes, reading_ids)
+
+@app.get("/realtime/ingest/stats")
+async def get_ingest_stats():
+    """Queue depth and flush statistics of the write-behind ingest buffer"""
+    return ingest_buffer.stats()
+
+DB_POOL_CONNECTIONS = metrics.gauge(
+    "db_pool_connections", "Connections of each database engine pool by state", ("pool", "state")
+)
+REALTIME_PARTITION_ROWS = metrics.gauge(
+    "realtime_partition_rows", "Raw readings in each day's realtime partition", ("day",)
+)
+DATABASE_BYTES = metrics.gauge("sqlite_database_bytes", "Size of the main database file")
+
+def collect_pool_metrics():
+    for name, pool in (("writer", engine.pool), ("reader", async_engine.pool)):
+        checked_out = pool.checkedout()
+        DB_POOL_CONNECTIONS.set(checked_out, name, "checked_out")
+        DB_POOL_CONNECTIONS.set(pool.checkedin(), name, "idle")
+        DB_POOL_CONNECTIONS.set(max(pool.overflow(), 0), name, "overflow")
+        DB_POOL_CONNECTIONS.set(pool.size(), name, "size")
+
+def collect_storage_metrics(db: Session):
+    """Table sizes that need a query; run on a reader connection when /metrics is scraped"""
+    REALTIME_PARTITION_ROWS.replace({(str(day),): rows for day, rows in partition_row_counts(db).items()})
+    page_count = db.execute(text("PRAGMA page_count")).scalar()
+    page_size = db.execute(text("PRAGMA page_size")).scalar()
+    DATABASE_BYTES.set(page_count * page_size)
+
+metrics.add_collector(collect_pool_metrics)
+metrics.expose_stats("ingest_buffer", "Write-behind ingest buffer", ingest_buffer.stats)
+metrics.expose_stats("ingest_replays", "Keyed batch replay protection", ingest_replays.stats)
+metrics.expose_stats("live_stream", "Live stream hub", live_hub.stats)
+metrics.expose_stats("simulator", "Sensor simulator", simulator.stats)
+
+@app.get("/metrics")
+async def get_metrics(db: AsyncSession = Depends(get_async_db)):
+    """Process metrics in the Prometheus text exposition format"""
+    await db.run_sync(collect_storage_metrics)
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/properties/{property_id}/latest")
-def get_latest_readings(
+async def get_latest_readings(
     property_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get the latest reading for each sensor type in a property from realtime DB"""
-    property = db.query(PropertyModel).filter(PropertyModel.id == property_id).first()
+    """Get the latest reading for each sensor type in a property from the in-memory latest store"""
+    cached = not_modified(request, response, data_versions.etag(data_versions.version(REALTIME, property_id)))
+    if cached:
+        return cached
+
+    property = await db.get(PropertyModel, property_id)
     
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
     
     latest_readings = {}
     
-    for sensor_type in SensorType:
-        reading = db.query(RealtimeReading).filter(
-            RealtimeReading.property_id == property_id,
-            RealtimeReading.sensor_type == sensor_type
-        ).order_by(RealtimeReading.timestamp.desc()).first()
-        
-        if reading:
-            latest_readings[sensor_type.value] = {
-                "value": reading.value,
-                "timestamp": reading.timestamp.isoformat()
-            }
+    for sensor_type, reading in (await db.run_sync(latest_store.get_property, property_id)).items():
+        latest_readings[sensor_type.value] = {
+            "value": reading["value"],
+            "timestamp": reading["timestamp"].isoformat()
+        }
     
     return latest_readings
 
+@app.get("/properties/{property_id}/stream")
+async def stream_property(property_id: int):
+    """
+    Server-Sent Events stream of a property's new readings.
+    Starts with a "latest" event holding the current value of each sensor, then sends a
+    "readings" event whenever readings are committed and "day_migrated" after the daily rollover.
+    """
+    # Short-lived session: a request-scoped one would stay checked out for the whole stream
+    async with AsyncSessionLocal() as db:
+        property = await db.get(PropertyModel, property_id)
+        if not property:
+            raise HTTPException(status_code=404, detail="Property not found")
+        await db.run_sync(latest_store.ensure_loaded)
+
+    def latest_event():
+        latest = {}
+        for sensor_type in SensorType:
+            reading = latest_store.get(property_id, sensor_type)
+            if reading:
+                latest[sensor_type.value] = {
+                    "value": reading[0],
+                    "timestamp": reading[1].isoformat()
+                }
+        return {"event": "latest", "property_id": property_id, "latest": latest}
+
+    return StreamingResponse(
+        live_hub.stream(property_id, latest_event),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/realtime/stream/stats")
+async def get_stream_stats():
+    """Subscriber and delivery statistics of the live stream hub"""
+    return live_hub.stats()
+
 @app.get("/properties/{property_id}/history/24hour")
-def get_24hour_history(
+async def get_24hour_history(
     property_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    response_format: Optional[str] = Query(None, alias="format"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get 24-hour data with 10-minute intervals (144 data points) from current day's realtime data"""
-    property = db.query(PropertyModel).filter(PropertyModel.id == property_id).first()
+    """
+    Get 24-hour data with 10-minute intervals (144 data points) from current day's realtime data.
+    ?format=columnar returns one time axis with a value array per sensor (?format=msgpack the same as MessagePack).
+    """
+    response_format = negotiate_format(response_format, request.headers.get("accept"))
+    etag = data_versions.etag(data_versions.version(REALTIME, property_id), today_gmt8(), response_format)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    property = await db.get(PropertyModel, property_id)
     
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
     
     # Get 10-minute interval averages for current day from realtime readings (GMT+8)
     current_date = datetime.now(GMT_PLUS_8).date()
-    start_of_day = datetime.combine(current_date, datetime.min.time(), tzinfo=GMT_PLUS_8)
-    
-    grouped_data = {}
-    
-    for sensor_type in SensorType:
-        interval_data = []
-        
-        # Create 144 data points (24 hours × 6 ten-minute intervals per hour)
-        for interval_index in range(144):
-            # Calculate time for this 10-minute interval
-            start_time = start_of_day + timedelta(minutes=interval_index * 10)
-            end_time = start_time + timedelta(minutes=10)
-            
-            # Calculate hour for x-axis (0-23, with decimals for positioning)
-            hour_decimal = interval_index / 6.0
-            
-            # Get average for this 10-minute interval
-            avg_result = db.query(
-                func.avg(RealtimeReading.value).label('avg_value')
-            ).filter(
-                RealtimeReading.property_id == property_id,
-                RealtimeReading.sensor_type == sensor_type,
-                RealtimeReading.timestamp >= start_time,
-                RealtimeReading.timestamp < end_time
-            ).first()
-            
-            if avg_result and avg_result.avg_value is not None:
-                interval_data.append({
-                    "time": hour_decimal,
-                    "value": round(avg_result.avg_value, 2)
-                })
-            else:
-                # No data for this interval yet - still include it with null value
-                interval_data.append({
-                    "time": hour_decimal,
-                    "value": None
-                })
-        
-        grouped_data[sensor_type.value] = interval_data
-    
-    return grouped_data
+    return render_history(await db.run_sync(day_bucket_averages, property_id, current_date), "time", response_format, response.headers)
 
 @app.get("/properties/{property_id}/history/monthly")
-def get_monthly_history(
+async def get_monthly_history(
     property_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    response_format: Optional[str] = Query(None, alias="format"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get monthly trend (last 30 days) with daily averages from historical data"""
-    property = db.query(PropertyModel).filter(PropertyModel.id == property_id).first()
+    response_format = negotiate_format(response_format, request.headers.get("accept"))
+    etag = data_versions.etag(data_versions.version(HISTORICAL, property_id), today_gmt8(), response_format)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    property = await db.get(PropertyModel, property_id)
     
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
@@ -291,14 +561,14 @@ def get_monthly_history(
     # Get readings from the last 30 days from historical database (GMT+8)
     since_date = datetime.now(GMT_PLUS_8).date() - timedelta(days=30)
     
-    readings = db.query(
+    readings = (await db.execute(select(
         HistoricalReading.date,
         HistoricalReading.sensor_type,
         HistoricalReading.avg_value
-    ).filter(
+    ).where(
         HistoricalReading.property_id == property_id,
         HistoricalReading.date >= since_date
-    ).order_by(HistoricalReading.date.asc()).all()
+    ).order_by(HistoricalReading.date.asc()))).all()
     
     # Group by sensor type
     grouped_data = defaultdict(list)
@@ -308,15 +578,24 @@ def get_monthly_history(
             "value": reading.avg_value
         })
     
-    return grouped_data
+    return render_history(grouped_data, "date", response_format, response.headers)
 
 @app.get("/properties/{property_id}/history/yearly")
-def get_yearly_history(
+async def get_yearly_history(
     property_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    response_format: Optional[str] = Query(None, alias="format"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get yearly trend (last 365 days) with daily averages from historical data"""
-    property = db.query(PropertyModel).filter(PropertyModel.id == property_id).first()
+    response_format = negotiate_format(response_format, request.headers.get("accept"))
+    etag = data_versions.etag(data_versions.version(HISTORICAL, property_id), today_gmt8(), response_format)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    property = await db.get(PropertyModel, property_id)
     
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
@@ -324,14 +603,14 @@ def get_yearly_history(
     # Get readings from the last 365 days from historical database (GMT+8)
     since_date = datetime.now(GMT_PLUS_8).date() - timedelta(days=365)
     
-    readings = db.query(
+    readings = (await db.execute(select(
         HistoricalReading.date,
         HistoricalReading.sensor_type,
         HistoricalReading.avg_value
-    ).filter(
+    ).where(
         HistoricalReading.property_id == property_id,
         HistoricalReading.date >= since_date
-    ).order_by(HistoricalReading.date.asc()).all()
+    ).order_by(HistoricalReading.date.asc()))).all()
     
     # Group by sensor type
     grouped_data = defaultdict(list)
@@ -341,7 +620,39 @@ def get_yearly_history(
             "value": reading.avg_value
         })
     
-    return grouped_data
+    return render_history(grouped_data, "date", response_format, response.headers)
+
+@app.get("/properties/{property_id}/history/range")
+async def get_range_history(
+    property_id: int,
+    request: Request,
+    response: Response,
+    start: datetime,
+    end: Optional[datetime] = None,
+    resolution: int = Query(60, ge=1, description="Desired bucket width in minutes"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Count, average, min, max and standard deviation per bucket over any range, read from the
+    coarsest rollup tier that covers `start` at the requested resolution (the chosen tier is
+    returned too). Naive timestamps are GMT+8; `end` defaults to now.
+    """
+    end = end or datetime.now(GMT_PLUS_8)
+    if local_time(end) <= local_time(start):
+        raise HTTPException(status_code=400, detail="end must be after start")
+    etag = data_versions.etag(
+        data_versions.version(REALTIME, property_id), data_versions.version(HISTORICAL, property_id),
+        local_time(start).isoformat(), local_time(end).isoformat(), resolution, today_gmt8()
+    )
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    property = await db.get(PropertyModel, property_id)
+    if not property:
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    return await db.run_sync(query_rollups, property_id, start, end, resolution)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,238 @@
+"""
+Precomputed in-range counters behind the annual percentage match.
+For every (profile, property, sensor) the `historical_match_counts` table holds one row per
+date with the number of daily averages inside the profile's preferred range and running totals.
+The match rate over any window is then the difference of two cumulative values instead of a
+pass over a year of historical rows.
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from models import HistoricalMatchCount, HistoricalReading, MatchCounterState, SensorType
+
+# SQLite caps bound parameters per statement; property id lists are queried in chunks
+PROPERTY_ID_CHUNK = 900
+
+
+def _in_range_sql(preferred_min: Optional[float], preferred_max: Optional[float]) -> str:
+    """SQL expression that is 1 when h.avg_value lies in the preferred range"""
+    conditions = ["h.avg_value IS NOT NULL"]
+    if preferred_min is not None:
+        conditions.append(f"h.avg_value >= {float(preferred_min)!r}")
+    if preferred_max is not None:
+        conditions.append(f"h.avg_value <= {float(preferred_max)!r}")
+    return f"CASE WHEN {' AND '.join(conditions)} THEN 1 ELSE 0 END"
+
+
+def rebuild_profile_sensor(db: Session, profile: str, sensor_type: SensorType, pref: Dict[str, float]) -> None:
+    """Recompute every counter row of one (profile, sensor) from historical readings in one statement"""
+    params = {"profile": profile, "sensor_type": sensor_type.name}
+    db.execute(
+        text("DELETE FROM historical_match_counts WHERE profile = :profile AND sensor_type = :sensor_type"),
+        params,
+    )
+    db.execute(
+        text(
+            f"""
+            INSERT INTO historical_match_counts
+                (profile, property_id, sensor_type, date, matched, tracked, cumulative_matched, cumulative_tracked)
+            SELECT :profile, property_id, sensor_type, date, matched, tracked,
+                   SUM(matched) OVER running, SUM(tracked) OVER running
+            FROM (
+                SELECT h.property_id, h.sensor_type, h.date,
+                       SUM({_in_range_sql(pref.get("min"), pref.get("max"))}) AS matched,
+                       COUNT(*) AS tracked
+                FROM historical_readings h
+                WHERE h.sensor_type = :sensor_type
+                GROUP BY h.property_id, h.sensor_type, h.date
+            )
+            WINDOW running AS (PARTITION BY property_id ORDER BY date ROWS UNBOUNDED PRECEDING)
+            """
+        ),
+        params,
+    )
+
+
+def record_day(db: Session, target_date: date, profiles: Dict) -> None:
+    """
+    Fold one day of historical averages into the counters of every profile.
+    Days are normally appended after the latest one. A day recorded again (late readings moved
+    its averages) or inserted before existing counters shifts the running totals of the later
+    days by the change in its own counts, which is applied to them with one UPDATE. The same
+    change is added to the source row count kept in the counter state.
+    """
+    for profile, profile_data in profiles.items():
+        for sensor_type, pref in profile_data["sensors"].items():
+            params = {"profile": profile, "sensor_type": sensor_type.name, "date": target_date}
+            day_counts = text(
+                "SELECT property_id, matched, tracked FROM historical_match_counts "
+                "WHERE profile = :profile AND sensor_type = :sensor_type AND date = :date"
+            )
+            previous_counts = {row.property_id: (row.matched, row.tracked) for row in db.execute(day_counts, params)}
+
+            db.execute(
+                text(
+                    f"""
+                    INSERT INTO historical_match_counts
+                        (profile, property_id, sensor_type, date, matched, tracked, cumulative_matched, cumulative_tracked)
+                    SELECT :profile, day.property_id, day.sensor_type, day.date, day.matched, day.tracked,
+                           COALESCE(previous.cumulative_matched, 0) + day.matched,
+                           COALESCE(previous.cumulative_tracked, 0) + day.tracked
+                    FROM (
+                        SELECT h.property_id, h.sensor_type, h.date,
+                               SUM({_in_range_sql(pref.get("min"), pref.get("max"))}) AS matched,
+                               COUNT(*) AS tracked
+                        FROM historical_readings h
+                        WHERE h.sensor_type = :sensor_type AND h.date = :date
+                        GROUP BY h.property_id, h.sensor_type, h.date
+                    ) AS day
+                    LEFT JOIN historical_match_counts AS previous
+                        ON previous.id = (
+                            SELECT c.id FROM historical_match_counts c
+                            WHERE c.profile = :profile AND c.property_id = day.property_id
+                              AND c.sensor_type = day.sensor_type AND c.date < day.date
+                            ORDER BY c.date DESC LIMIT 1
+                        )
+                    WHERE true
+                    ON CONFLICT (profile, property_id, sensor_type, date) DO UPDATE SET
+                        matched = excluded.matched,
+                        tracked = excluded.tracked,
+                        cumulative_matched = excluded.cumulative_matched,
+                        cumulative_tracked = excluded.cumulative_tracked
+                    """
+                ),
+                params,
+            )
+
+            shifts = []
+            added_rows = 0
+            for row in db.execute(day_counts, params):
+                matched, tracked = previous_counts.get(row.property_id, (0, 0))
+                added_rows += row.tracked - tracked
+                if row.matched != matched or row.tracked != tracked:
+                    shifts.append({
+                        **params,
+                        "property_id": row.property_id,
+                        "matched": row.matched - matched,
+                        "tracked": row.tracked - tracked,
+                    })
+            if shifts:
+                db.execute(
+                    text(
+                        "UPDATE historical_match_counts SET "
+                        "cumulative_matched = cumulative_matched + :matched, "
+                        "cumulative_tracked = cumulative_tracked + :tracked "
+                        "WHERE profile = :profile AND sensor_type = :sensor_type "
+                        "AND property_id = :property_id AND date > :date"
+                    ),
+                    shifts,
+                )
+            if added_rows:
+                db.execute(
+                    text(
+                        "UPDATE match_counter_state SET source_rows = source_rows + :added_rows "
+                        "WHERE profile = :profile AND sensor_type = :sensor_type"
+                    ),
+                    {**params, "added_rows": added_rows},
+                )
+
+
+def _source_rows(db: Session) -> Dict[SensorType, int]:
+    """Historical rows per sensor type"""
+    rows = db.query(HistoricalReading.sensor_type, func.count(HistoricalReading.id)).group_by(HistoricalReading.sensor_type)
+    return {sensor_type: count for sensor_type, count in rows}
+
+
+def _save_state(db: Session, profiles: Dict, source_rows: Dict[SensorType, int]) -> None:
+    for profile, profile_data in profiles.items():
+        for sensor_type, pref in profile_data["sensors"].items():
+            db.merge(MatchCounterState(
+                profile=profile,
+                sensor_type=sensor_type,
+                preferred_min=pref.get("min"),
+                preferred_max=pref.get("max"),
+                source_rows=source_rows.get(sensor_type, 0),
+            ))
+
+
+def sync_match_counters(db: Session, profiles: Dict) -> int:
+    """
+    Rebuild the counters of every (profile, sensor) whose preferred range changed or whose
+    historical data was written around the aggregator (e.g. by the bulk loaders).
+    Returns the number of (profile, sensor) pairs rebuilt; the caller commits.
+    """
+    states = {(state.profile, state.sensor_type): state for state in db.query(MatchCounterState).all()}
+    source_rows = _source_rows(db)
+    rebuilt = 0
+
+    for profile, profile_data in profiles.items():
+        for sensor_type, pref in profile_data["sensors"].items():
+            state = states.get((profile, sensor_type))
+            if (
+                state is not None
+                and state.preferred_min == pref.get("min")
+                and state.preferred_max == pref.get("max")
+                and state.source_rows == source_rows.get(sensor_type, 0)
+            ):
+                continue
+            rebuild_profile_sensor(db, profile, sensor_type, pref)
+            rebuilt += 1
+
+    # Drop counters of profiles that no longer exist
+    db.query(HistoricalMatchCount).filter(
+        HistoricalMatchCount.profile.notin_(list(profiles.keys()))
+    ).delete(synchronize_session=False)
+    db.query(MatchCounterState).filter(
+        MatchCounterState.profile.notin_(list(profiles.keys()))
+    ).delete(synchronize_session=False)
+
+    if rebuilt:
+        _save_state(db, profiles, source_rows)
+    return rebuilt
+
+
+def _cumulative_at(
+    db: Session, profile: str, property_ids: List[int], before: Optional[date] = None
+) -> Dict[Tuple[int, SensorType], Tuple[int, int]]:
+    """Running totals of the latest counter row per (property, sensor), optionally before a date"""
+    totals: Dict[Tuple[int, SensorType], Tuple[int, int]] = {}
+    for offset in range(0, len(property_ids), PROPERTY_ID_CHUNK):
+        chunk = property_ids[offset:offset + PROPERTY_ID_CHUNK]
+        # SQLite returns the other columns from the row holding MAX(date)
+        query = db.query(
+            HistoricalMatchCount.property_id,
+            HistoricalMatchCount.sensor_type,
+            func.max(HistoricalMatchCount.date),
+            HistoricalMatchCount.cumulative_matched,
+            HistoricalMatchCount.cumulative_tracked,
+        ).filter(
+            HistoricalMatchCount.profile == profile,
+            HistoricalMatchCount.property_id.in_(chunk),
+        )
+        if before is not None:
+            query = query.filter(HistoricalMatchCount.date < before)
+        for row in query.group_by(HistoricalMatchCount.property_id, HistoricalMatchCount.sensor_type):
+            totals[(row.property_id, row.sensor_type)] = (row.cumulative_matched, row.cumulative_tracked)
+    return totals
+
+
+def match_rates(
+    db: Session, profile: str, property_ids: List[int], since_date: date
+) -> Dict[Tuple[int, SensorType], Tuple[Optional[float], int]]:
+    """
+    (percentage_match, days_tracked) per (property, sensor) for daily averages dated on or
+    after `since_date`, with the same rounding as ComfortEvaluator.compute_percentage_match.
+    """
+    latest = _cumulative_at(db, profile, property_ids)
+    boundary = _cumulative_at(db, profile, property_ids, before=since_date)
+
+    rates: Dict[Tuple[int, SensorType], Tuple[Optional[float], int]] = {}
+    for key, (matched, tracked) in latest.items():
+        matched_before, tracked_before = boundary.get(key, (0, 0))
+        total_days = tracked - tracked_before
+        matches = matched - matched_before
+        if total_days <= 0:
+            continue
+        rates[key] = (round((matches / total_days) * 100, 1), total_days)
+    return rates
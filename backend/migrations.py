@@ -0,0 +1,124 @@
+"""
+Versioned schema migrations for the SQLite database.
+`Base.metadata.create_all` only creates missing tables, so changes to existing tables
+(indexes, constraints, new columns) are applied here. The schema version is tracked
+with SQLite's `PRAGMA user_version`; each migration runs once, in order. A step is either
+an SQL statement or a callable taking the connection, for data moves SQL alone cannot express.
+
+Run directly to upgrade the database:
+    python migrations.py
+"""
+from typing import Callable, List, Tuple, Union
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from realtime_partitions import move_legacy_readings
+
+Step = Union[str, Callable[[Connection], None]]
+
+
+def index_legacy_realtime_readings(conn: Connection) -> None:
+    """Version 1 index on the single realtime table; databases created after version 2 never have it"""
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'realtime_readings'")
+    ).first()
+    if exists:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_realtime_readings_property_sensor_timestamp "
+            "ON realtime_readings (property_id, sensor_type, timestamp, value)"
+        ))
+
+
+def add_column(table: str, column: str, definition: str) -> Callable[[Connection], None]:
+    """Step adding a column unless `create_all` already created the table with it"""
+    def step(conn: Connection) -> None:
+        columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    return step
+
+
+# (version, description, steps)
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (
+        1,
+        "Composite time-series indexes on realtime, rollup and historical readings",
+        [
+            index_legacy_realtime_readings,
+            "CREATE INDEX IF NOT EXISTS ix_realtime_buckets_bucket_start "
+            "ON realtime_buckets (bucket_start)",
+            "CREATE INDEX IF NOT EXISTS ix_historical_readings_property_sensor_date "
+            "ON historical_readings (property_id, sensor_type, date, avg_value)",
+            "CREATE INDEX IF NOT EXISTS ix_historical_readings_property_date "
+            "ON historical_readings (property_id, date, sensor_type, avg_value)",
+            "ANALYZE",
+        ],
+    ),
+    (
+        2,
+        "Move realtime readings into per-day partition tables",
+        [
+            move_legacy_readings,
+            "ANALYZE",
+        ],
+    ),
+    (
+        3,
+        "One historical average per (property, sensor, date)",
+        [
+            # Reruns of the old day migration inserted the same averages again; keep the first
+            "DELETE FROM historical_readings WHERE id NOT IN ("
+            "SELECT MIN(id) FROM historical_readings GROUP BY property_id, sensor_type, date)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_historical_readings_key "
+            "ON historical_readings (property_id, sensor_type, date)",
+        ],
+    ),
+    (
+        4,
+        "Sum of squares on 10-minute buckets for the rollup tiers",
+        [
+            # Filled in for days still in realtime storage by the startup bucket rebuild
+            add_column("realtime_buckets", "sum_sq", "FLOAT"),
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(engine: Engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def run_migrations(engine: Engine) -> int:
+    """Apply every migration newer than the database's schema version. Returns the new version."""
+    current_version = get_schema_version(engine)
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current_version:
+            continue
+        print(f"Applying migration {version}: {description}")
+        with engine.begin() as conn:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            # PRAGMA does not accept bound parameters
+            conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+        current_version = version
+
+    return current_version
+
+
+if __name__ == "__main__":
+    from database import engine, Base
+    import models  # noqa: F401  (registers the tables)
+
+    Base.metadata.create_all(bind=engine)
+    before = get_schema_version(engine)
+    after = run_migrations(engine)
+    if after == before:
+        print(f"Database schema is up to date (version {after})")
+    else:
+        print(f"Database schema upgraded from version {before} to {after}")
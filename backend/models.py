@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -22,8 +22,9 @@ class Property(Base):
     image_url = Column(String)
     
     sensor_readings = relationship("SensorReading", back_populates="property", cascade="all, delete-orphan")
-    realtime_readings = relationship("RealtimeReading", back_populates="property", cascade="all, delete-orphan")
     historical_readings = relationship("HistoricalReading", back_populates="property", cascade="all, delete-orphan")
+    realtime_buckets = relationship("RealtimeBucket", back_populates="property", cascade="all, delete-orphan")
+    rollup_buckets = relationship("RollupBucket", back_populates="property", cascade="all, delete-orphan")
 
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
@@ -36,21 +37,63 @@ class SensorReading(Base):
     
     property = relationship("Property", back_populates="sensor_readings")
 
-class RealtimeReading(Base):
-    """Stores current day's sensor readings with high frequency (<10min sample rate)"""
-    __tablename__ = "realtime_readings"
+# Raw realtime readings live in per-day partition tables, see realtime_partitions.py
+
+class RealtimeBucket(Base):
+    """Stores 10-minute rollups of realtime readings, maintained as readings are written"""
+    __tablename__ = "realtime_buckets"
+    __table_args__ = (
+        UniqueConstraint("property_id", "sensor_type", "bucket_start", name="uq_realtime_buckets_key"),
+        Index("ix_realtime_buckets_bucket_start", "bucket_start"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     property_id = Column(Integer, ForeignKey("properties.id"))
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     sensor_type = Column(SQLEnum(SensorType))
-    value = Column(Float)
+    bucket_start = Column(DateTime)  # Start of the 10-minute interval (GMT+8)
+    sample_count = Column(Integer, default=0)
+    sum_value = Column(Float, default=0.0)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    sum_sq = Column(Float, default=0.0)  # Sum of squared values, for the standard deviation
+    
+    property = relationship("Property", back_populates="realtime_buckets")
+
+class RollupBucket(Base):
+    """
+    Downsampled statistics of migrated days, one row per tier bucket (see rollup_tiers.py),
+    e.g. 10-minute buckets for 30 days, hourly for a year and daily forever
+    """
+    __tablename__ = "rollup_buckets"
+    __table_args__ = (
+        UniqueConstraint("tier", "property_id", "sensor_type", "bucket_start", name="uq_rollup_buckets_key"),
+        # Retention deletes per tier
+        Index("ix_rollup_buckets_tier_bucket_start", "tier", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    tier = Column(String)  # Tier name from ROLLUP_TIERS
+    property_id = Column(Integer, ForeignKey("properties.id"))
+    sensor_type = Column(SQLEnum(SensorType))
+    bucket_start = Column(DateTime)  # Start of the tier interval (GMT+8)
+    sample_count = Column(Integer, default=0)
+    sum_value = Column(Float, default=0.0)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    sum_sq = Column(Float, default=0.0)
     
-    property = relationship("Property", back_populates="realtime_readings")
+    property = relationship("Property", back_populates="rollup_buckets")
 
 class HistoricalReading(Base):
     """Stores historical daily averages for past days"""
     __tablename__ = "historical_readings"
+    __table_args__ = (
+        # Per-sensor daily series (comfort evaluation) and per-property date ranges (history charts)
+        Index("ix_historical_readings_property_sensor_date", "property_id", "sensor_type", "date", "avg_value"),
+        Index("ix_historical_readings_property_date", "property_id", "date", "sensor_type", "avg_value"),
+        # One daily average per sensor; the day migration upserts against it
+        Index("uq_historical_readings_key", "property_id", "sensor_type", "date", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     property_id = Column(Integer, ForeignKey("properties.id"))
@@ -60,6 +103,36 @@ class HistoricalReading(Base):
     
     property = relationship("Property", back_populates="historical_readings")
 
+class HistoricalMatchCount(Base):
+    """
+    Daily in-range counts of historical averages per customer profile, with running totals,
+    so the annual percentage match is a difference of two cumulative values
+    """
+    __tablename__ = "historical_match_counts"
+    __table_args__ = (
+        UniqueConstraint("profile", "property_id", "sensor_type", "date", name="uq_historical_match_counts_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile = Column(String)  # Normalized ComfortEvaluator profile name
+    property_id = Column(Integer, ForeignKey("properties.id"))
+    sensor_type = Column(SQLEnum(SensorType))
+    date = Column(Date)
+    matched = Column(Integer, default=0)  # Daily averages on this date within the profile's range
+    tracked = Column(Integer, default=0)  # Daily averages on this date
+    cumulative_matched = Column(Integer, default=0)
+    cumulative_tracked = Column(Integer, default=0)
+
+class MatchCounterState(Base):
+    """Profile ranges and number of the sensor's historical rows the match counters were last built from"""
+    __tablename__ = "match_counter_state"
+
+    profile = Column(String, primary_key=True)
+    sensor_type = Column(SQLEnum(SensorType), primary_key=True)
+    preferred_min = Column(Float)
+    preferred_max = Column(Float)
+    source_rows = Column(Integer, default=0)
+
 class CustomerProfile(Base):
     __tablename__ = "customer_profiles"
 
@@ -4,6 +4,7 @@ from typing import List, Tuple
 from database import SessionLocal
 from models import Property
 from comfort_evaluator import ComfortEvaluator
+from match_counters import sync_match_counters
 
 
 @contextmanager
@@ -17,11 +18,8 @@ def get_session():
 
 def get_top_properties(session, profile: str, limit: int = 3) -> List[Tuple[str, float]]:
     properties = session.query(Property).all()
-    scored: List[Tuple[str, float]] = []
-
-    for prop in properties:
-        score = ComfortEvaluator.get_property_comfort_score(session, prop.id, profile)
-        scored.append((prop.name, score))
+    scores = ComfortEvaluator.get_properties_comfort_scores(session, [prop.id for prop in properties], profile)
+    scored: List[Tuple[str, float]] = [(prop.name, scores[prop.id]) for prop in properties]
 
     scored.sort(key=lambda item: item[1], reverse=True)
     return scored[:limit]
@@ -36,6 +34,8 @@ def main() -> None:
     ]
 
     with get_session() as session:
+        sync_match_counters(session, ComfortEvaluator.PROFILES)
+        session.commit()
         for profile in profile_names:
             top = get_top_properties(session, profile)
             print(f"\nProfile: {profile}")
@@ -0,0 +1,160 @@
+"""
+Per-request SQL query accounting and slow-query log.
+Cursor-execute hooks on the database engines add every statement's count and duration to the
+stats of the request being served (tracked in a context variable, so it follows the request
+into run_sync and worker threads). In debug mode the totals are returned as X-Query-Count and
+X-Query-Time-Ms response headers. Any statement slower than SLOW_QUERY_MS is printed with its
+parameters and EXPLAIN QUERY PLAN, whether or not it ran inside a request.
+
+`count_queries` and `assert_query_budget` let checks pin how many queries a code path or an
+endpoint may issue, so N+1 loops show up as a failed budget instead of a slow page.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Add X-Query-Count / X-Query-Time-Ms headers to every response
+QUERY_DEBUG = os.environ.get("QUERY_DEBUG", "0").lower() in ("1", "true", "yes")
+# Statements taking at least this many milliseconds are logged with their plan (0 logs all, negative disables)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+# Longest parameter list printed with a slow statement
+SLOW_QUERY_PARAMS_CHARS = 500
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+QUERY_TIME_HEADER = "X-Query-Time-Ms"
+
+_current: ContextVar[Optional[Dict]] = ContextVar("query_stats", default=None)
+
+
+def new_stats() -> Dict:
+    return {"queries": 0, "seconds": 0.0}
+
+
+class QueryAccounting:
+    """Engine hooks and settings shared by the middleware and the budget helpers"""
+
+    def __init__(self, debug_headers: bool = QUERY_DEBUG, slow_query_ms: float = SLOW_QUERY_MS):
+        self.debug_headers = debug_headers
+        self.slow_query_ms = slow_query_ms
+
+    def instrument(self, engine: Engine) -> None:
+        """Attach the cursor hooks to a sync engine (for an async engine pass its sync_engine)"""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["query_started"].pop()
+            stats = _current.get()
+            if stats is not None:
+                stats["queries"] += 1
+                stats["seconds"] += elapsed
+            if 0 <= self.slow_query_ms <= elapsed * 1000:
+                self.log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+    @staticmethod
+    def log_slow_query(conn, statement: str, parameters, executemany: bool, elapsed: float) -> None:
+        params = repr(parameters)
+        if len(params) > SLOW_QUERY_PARAMS_CHARS:
+            params = params[:SLOW_QUERY_PARAMS_CHARS] + "..."
+        print(f"Slow query ({elapsed * 1000:.1f} ms): {' '.join(statement.split())}")
+        print(f"  parameters: {'executemany ' if executemany else ''}{params}")
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+            return
+        # Plan through the raw DBAPI connection, so the EXPLAIN is neither counted nor logged itself
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                for row in cursor.fetchall():
+                    print(f"  plan: {row[-1]}")
+            finally:
+                cursor.close()
+        except Exception as e:
+            print(f"  plan unavailable: {e}")
+
+    def headers(self, stats: Dict) -> Dict[str, str]:
+        return {
+            QUERY_COUNT_HEADER: str(stats["queries"]),
+            QUERY_TIME_HEADER: f"{stats['seconds'] * 1000:.3f}",
+        }
+
+
+# Global query accounting instance
+query_accounting = QueryAccounting()
+
+
+class QueryAccountingMiddleware:
+    """Plain ASGI middleware giving each HTTP request its own query stats"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = new_stats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and query_accounting.debug_headers:
+                message = dict(message)
+                message["headers"] = [
+                    *message.get("headers", []),
+                    *((name.lower().encode(), value.encode()) for name, value in query_accounting.headers(stats).items()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+
+@contextmanager
+def count_queries() -> Iterator[Dict]:
+    """Count the queries issued in this context (and tasks or threads started from it)"""
+    stats = new_stats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, label: str = "block") -> Iterator[Dict]:
+    """Fail with AssertionError if the block issues more than max_queries queries"""
+    with count_queries() as stats:
+        yield stats
+    if stats["queries"] > max_queries:
+        raise AssertionError(f"{label} issued {stats['queries']} queries, budget is {max_queries}")
+
+
+def assert_query_budget(client, path: str, max_queries: int, method: str = "GET", **kwargs):
+    """
+    Request an endpoint through a test client (e.g. FastAPI's TestClient) and fail with
+    AssertionError if it issued more than max_queries queries. Debug headers are switched on for
+    the request, since the app runs in the client's own thread. Returns the response.
+    """
+    previous = query_accounting.debug_headers
+    query_accounting.debug_headers = True
+    try:
+        response = client.request(method, path, **kwargs)
+    finally:
+        query_accounting.debug_headers = previous
+    queries = int(response.headers[QUERY_COUNT_HEADER])
+    if queries > max_queries:
+        raise AssertionError(
+            f"{method} {path} issued {queries} queries "
+            f"({response.headers[QUERY_TIME_HEADER]} ms), budget is {max_queries}"
+        )
+    return response
@@ -0,0 +1,207 @@
+"""
+Query-plan regression check.
+Builds a throwaway database at the current schema version, exercises the query paths in
+main.py, comfort_evaluator.py and data_aggregator.py, and runs EXPLAIN QUERY PLAN on every
+statement they issue. Each API request must also stay within its query budget, so N+1 loops
+fail the check. Exits non-zero if any statement falls back to a full table scan (including a
+walk over a whole index) or any request exceeds its budget.
+
+Usage:
+    python query_plan_check.py
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Point the app at a temporary database before anything opens the real one
+_tmp_dir = tempfile.mkdtemp(prefix="query_plan_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'plan_check.db')}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, text  # noqa: E402
+
+from database import engine, async_engine, SessionLocal  # noqa: E402
+from models import Property, HistoricalReading, SensorType  # noqa: E402
+import main  # noqa: E402  (creates the tables and runs migrations)
+from comfort_evaluator import ComfortEvaluator  # noqa: E402
+from data_aggregator import aggregator  # noqa: E402
+from ingest import write_readings  # noqa: E402
+from latest_store import latest_store  # noqa: E402
+from query_accounting import assert_query_budget  # noqa: E402
+from rollups import GMT_PLUS_8, rebuild_day_buckets  # noqa: E402
+
+# Tables that are listed in full on purpose (sqlite_sequence holds one row per realtime partition)
+FULL_SCAN_ALLOWED = {"properties", "customer_profiles", "sqlite_sequence"}
+
+
+def seed(db):
+    """A few properties with a year of history and some realtime readings"""
+    today = datetime.now(GMT_PLUS_8).date()
+    for property_id in (1, 2, 3):
+        db.add(Property(id=property_id, name=f"Property {property_id}", address="", description="", image_url=""))
+    db.commit()
+
+    db.add_all(
+        HistoricalReading(property_id=property_id, date=today - timedelta(days=day), sensor_type=sensor_type, avg_value=20.0)
+        for property_id in (1, 2, 3)
+        for day in range(1, 366)
+        for sensor_type in SensorType
+    )
+    db.commit()
+
+    now = datetime.now(GMT_PLUS_8)
+    write_readings(db, [
+        (property_id, sensor_type, 20.0, now - timedelta(minutes=minute, days=day))
+        for property_id in (1, 2, 3)
+        for sensor_type in SensorType
+        for minute in range(0, 120, 5)
+        for day in (0, 1)
+    ])
+    # The 10-minute buckets the API reads; rebuilding them is a whole-partition pass by design
+    rebuild_day_buckets(db, today)
+    db.commit()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def exercise(db) -> int:
+    """Run every query path that the API and background tasks use. Returns the number of blown query budgets."""
+    today = datetime.now(GMT_PLUS_8).date()
+    latest_store.rebuild(db)
+
+    client = TestClient(main.app)
+    over_budget = 0
+
+    def request(path, budget, **kwargs):
+        nonlocal over_budget
+        try:
+            assert_query_budget(client, path, budget, **kwargs).raise_for_status()
+        except AssertionError as e:
+            over_budget += 1
+            print(f"OVER  {e}")
+
+    # (path, most queries the request may issue); none may grow with the number of properties or rows
+    for path, budget in (
+        ("/properties", 4),
+        ("/properties/1", 1),
+        ("/customer-profiles", 1),
+        ("/properties/1/comfort", 1),
+        ("/properties/1/latest", 1),
+        ("/properties/1/history/24hour", 2),
+        ("/properties/1/history/monthly", 2),
+        ("/properties/1/history/yearly", 2),
+        ("/metrics", 3),
+    ):
+        request(path, budget)
+    ComfortEvaluator.evaluate_property_comfort(db, 2, "Elderly Residents")
+    # Hand the single writer connection back before the aggregator takes it
+    db.rollback()
+    asyncio.run(aggregator.migrate_previous_day_to_historical(today - timedelta(days=1)))
+    # Rollup tier queries, now that the migration has filled the tiers
+    for resolution in (10, 60, 1440):
+        request(
+            "/properties/1/history/range", 3,
+            params={"start": f"{today - timedelta(days=2)}T00:00:00", "resolution": resolution},
+        )
+    return over_budget
+
+
+def capture_statements():
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany and parameters and isinstance(parameters[0], (tuple, list, dict)):
+            parameters = parameters[0]
+        if isinstance(parameters, list):
+            parameters = tuple(parameters)
+        statements.setdefault(statement, parameters)
+
+    # Routes and background tasks run on the async engine, CLI paths on the blocking one
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", record)
+    return statements
+
+
+# "FROM table alias", "JOIN table AS alias": plan lines name aliased tables by their alias
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+# An index constraint in a plan line, e.g. "(property_id=? AND bucket_start>?)"
+INDEX_CONSTRAINT = re.compile(r"\(.*[=<>].*\)")
+
+
+def table_aliases(statement, tables):
+    """Map of the aliases a statement gives to stored tables"""
+    return {alias: table for table, alias in TABLE_ALIAS.findall(statement) if table in tables}
+
+
+def full_scans(plan_rows, tables, aliases=None):
+    """
+    Plan lines that read a whole stored table: a SCAN without an index, or one that walks an
+    entire (covering) index, which is the same number of rows. SEARCH lines are constrained by
+    an index by definition; subquery scans are fine.
+    """
+    aliases = aliases or {}
+    scans = []
+    for row in plan_rows:
+        detail = row[-1]
+        if not detail.startswith("SCAN "):
+            continue
+        if " USING " in detail and INDEX_CONSTRAINT.search(detail.split(" USING ", 1)[1]):
+            continue
+        name = detail.split()[1]
+        table = aliases.get(name, name)
+        if table not in tables or table in FULL_SCAN_ALLOWED:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def main_check() -> int:
+    db = SessionLocal()
+    try:
+        seed(db)
+        statements = capture_statements()
+        over_budget = exercise(db)
+    finally:
+        db.close()
+
+    failures = 0
+    with engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        tables = {
+            row[0] for row in raw.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        for statement, parameters in statements.items():
+            verb = statement.lstrip().split()[0].upper()
+            if verb not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+                continue
+            if verb == "INSERT" and " SELECT " not in statement.upper():
+                continue  # Plain VALUES inserts have no read plan
+            summary = " ".join(statement.split())[:110]
+            try:
+                plan = raw.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            except sqlite3.OperationalError as e:
+                # Day partitions retired by the migration are gone by now
+                if "no such table" not in str(e):
+                    raise
+                print(f"skip  {summary} ({e})")
+                continue
+            scans = full_scans(plan, tables, table_aliases(statement, tables))
+            if scans:
+                failures += 1
+                print(f"FAIL  {summary}")
+                for detail in scans:
+                    print(f"      {detail}")
+            else:
+                print(f"ok    {summary}")
+
+    print(f"\n{len(statements)} statements checked, {failures} with full table scans")
+    print(f"{over_budget} requests over their query budget")
+    return 1 if failures or over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
@@ -6,6 +6,8 @@ import os
 from datetime import datetime, date
 from database import SessionLocal
 from models import HistoricalReading, SensorType
+from comfort_evaluator import ComfortEvaluator
+from match_counters import sync_match_counters
 
 def quick_load():
     """Fast load of synthetic data - stores ONE daily average per sensor per property"""
@@ -67,6 +69,10 @@ def quick_load():
             db.bulk_save_objects(batch)
             db.commit()
         
+        # Rebuild the annual match counters from the freshly loaded averages
+        sync_match_counters(db, ComfortEvaluator.PROFILES)
+        db.commit()
+        
         count = db.query(HistoricalReading).count()
         print(f"\n✓ Loaded {count:,} historical records")
         print(f"   (365 days × 10 properties × 5 sensors = {365*10*5:,} expected)")
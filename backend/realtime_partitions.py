@@ -0,0 +1,189 @@
+"""
+Day-partitioned realtime storage.
+Raw readings live in one table per GMT+8 day (`realtime_readings_YYYYMMDD`), created on first
+write. Everything that reads or writes raw readings goes through this module, and retiring a
+migrated day is a DROP TABLE instead of a row-by-row DELETE.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import (
+    Column, DateTime, Enum as SQLEnum, Float, Index, Integer, MetaData, Table, insert, text,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import SensorType
+
+PARTITION_PREFIX = "realtime_readings_"
+# Ids of a day's partition start at day.toordinal() * ID_BLOCK, so they stay unique and
+# increasing across partitions
+ID_BLOCK = 10 ** 10
+
+partition_metadata = MetaData()
+_lock = threading.Lock()
+# Partitions this process has already created (or found) since the last drop or rollback
+_known_partitions: Set[str] = set()
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[date]:
+    """The day a partition table holds, or None if the name is not a partition"""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def partition_table(day: date) -> Table:
+    """Table definition of a day's partition (whether or not it exists yet)"""
+    name = partition_name(day)
+    with _lock:
+        table = partition_metadata.tables.get(name)
+        if table is None:
+            table = Table(
+                name,
+                partition_metadata,
+                Column("id", Integer, primary_key=True),
+                Column("property_id", Integer, nullable=False),
+                Column("timestamp", DateTime, nullable=False),
+                Column("sensor_type", SQLEnum(SensorType), nullable=False),
+                Column("value", Float),
+                # Covers per-sensor lookups ordered by time, including the value itself
+                Index(f"ix_{name}_property_sensor_timestamp", "property_id", "sensor_type", "timestamp", "value"),
+                sqlite_autoincrement=True,
+            )
+    return table
+
+
+def ensure_partition(connection: Connection, day: date) -> Table:
+    """Create a day's partition and seed its id sequence if it does not exist yet"""
+    table = partition_table(day)
+    if table.name in _known_partitions:
+        return table
+    table.create(connection, checkfirst=True)
+    connection.execute(
+        text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+        ),
+        {"name": table.name, "seq": day.toordinal() * ID_BLOCK},
+    )
+    with _lock:
+        _known_partitions.add(table.name)
+    return table
+
+
+def forget_partitions() -> None:
+    """Drop the created-partition cache, e.g. after a rolled back transaction"""
+    with _lock:
+        _known_partitions.clear()
+
+
+def partition_days(db: Session) -> List[date]:
+    """Days that currently have a realtime partition, oldest first"""
+    rows = db.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB :pattern"),
+        {"pattern": f"{PARTITION_PREFIX}[0-9]*"},
+    )
+    days = [partition_day(row.name) for row in rows]
+    return sorted(day for day in days if day is not None)
+
+
+def existing_partition(db: Session, day: date) -> Optional[Table]:
+    """A day's partition table if it exists"""
+    return partition_table(day) if day in partition_days(db) else None
+
+
+def partition_row_counts(db: Session) -> Dict[date, int]:
+    """
+    Rows inserted into each existing partition, read from the id sequences instead of counting:
+    partitions are append-only, so the sequence's distance from the day's seed is the row count
+    """
+    try:
+        rows = db.execute(
+            text("SELECT name, seq FROM sqlite_sequence WHERE name GLOB :pattern"),
+            {"pattern": f"{PARTITION_PREFIX}[0-9]*"},
+        ).all()
+    except OperationalError as e:
+        # sqlite_sequence only exists once the first partition has been created
+        if "no such table" not in str(e):
+            raise
+        return {}
+    counts = {}
+    for row in rows:
+        day = partition_day(row.name)
+        if day is not None:
+            counts[day] = max(row.seq - day.toordinal() * ID_BLOCK, 0)
+    return counts
+
+
+def insert_readings(db: Session, readings: Sequence[Tuple[int, SensorType, float, datetime]]) -> List[int]:
+    """
+    Insert (property_id, sensor_type, value, timestamp) readings into their days' partitions with
+    one executemany per day. Timestamps must already be GMT+8. Returns the new row ids in input order.
+    """
+    by_day: Dict[date, List[Tuple[int, Dict]]] = defaultdict(list)
+    for position, (property_id, sensor_type, value, timestamp) in enumerate(readings):
+        by_day[timestamp.date()].append((position, {
+            "property_id": property_id,
+            "sensor_type": sensor_type,
+            "value": value,
+            "timestamp": timestamp,
+        }))
+
+    ids: List[int] = [0] * len(readings)
+    connection = db.connection()
+    for day, rows in by_day.items():
+        table = ensure_partition(connection, day)
+        result = db.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            [row for _, row in rows],
+        )
+        for (position, _), new_id in zip(rows, result.scalars()):
+            ids[position] = new_id
+    return ids
+
+
+def drop_partition(db: Session, day: date) -> bool:
+    """Retire a day's raw readings in constant time. Returns whether a partition existed."""
+    if day not in partition_days(db):
+        return False
+    name = partition_name(day)
+    db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+    db.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": name})
+    with _lock:
+        _known_partitions.discard(name)
+    return True
+
+
+def move_legacy_readings(connection: Connection) -> None:
+    """Schema migration: move rows of the old single realtime_readings table into day partitions"""
+    legacy = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'realtime_readings'")
+    ).first()
+    if not legacy:
+        return
+
+    days = connection.execute(
+        text("SELECT DISTINCT date(timestamp) AS day FROM realtime_readings WHERE timestamp IS NOT NULL")
+    ).all()
+    for row in days:
+        day = date.fromisoformat(row.day)
+        table = ensure_partition(connection, day)
+        connection.execute(
+            text(
+                f'INSERT INTO "{table.name}" (property_id, timestamp, sensor_type, value) '
+                "SELECT property_id, timestamp, sensor_type, value FROM realtime_readings "
+                "WHERE date(timestamp) = :day AND property_id IS NOT NULL AND sensor_type IS NOT NULL "
+                "ORDER BY timestamp"
+            ),
+            {"day": row.day},
+        )
+    connection.execute(text("DROP TABLE realtime_readings"))
@@ -0,0 +1,252 @@
+"""
+Multi-resolution rollup tiers.
+When a day is migrated its 10-minute buckets are downsampled into every configured tier of the
+`rollup_buckets` table (by default 10-minute kept 30 days, hourly kept a year and daily kept
+forever). Each bucket holds count, sum, min, max and sum of squares, so averages, extremes and
+standard deviations survive the loss of the raw readings. Queries go through `query_rollups`,
+which reads the coarsest tier that still satisfies the requested range and resolution.
+
+Tiers come from ROLLUP_TIERS as comma-separated name:minutes:retention_days entries
+(retention 0 keeps a tier forever), e.g. "10min:10:30,hourly:60:365,daily:1440:0".
+"""
+import math
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from sqlalchemy import DateTime, Table, bindparam, func, select, text, union_all
+from sqlalchemy.orm import Session
+from models import RealtimeBucket, RollupBucket, SensorType
+from rollups import BUCKET_MINUTES, GMT_PLUS_8, day_bounds, local_time
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class RollupTier(NamedTuple):
+    name: str
+    minutes: int
+    retention_days: Optional[int]  # None keeps the tier forever
+
+
+def parse_tiers(spec: str) -> List[RollupTier]:
+    """Parse a ROLLUP_TIERS value into tiers ordered from finest to coarsest"""
+    tiers = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, minutes, retention_days = entry.split(":")
+        minutes, retention_days = int(minutes), int(retention_days)
+        # Tier buckets are built from whole 10-minute buckets and never straddle midnight
+        if minutes % BUCKET_MINUTES or MINUTES_PER_DAY % minutes:
+            raise ValueError(
+                f"Rollup tier {name!r}: {minutes} minutes must be a multiple of {BUCKET_MINUTES} dividing a day"
+            )
+        tiers.append(RollupTier(name, minutes, retention_days or None))
+    if not tiers:
+        raise ValueError("ROLLUP_TIERS defines no tiers")
+    return sorted(tiers, key=lambda tier: tier.minutes)
+
+
+ROLLUP_TIERS = parse_tiers(os.environ.get("ROLLUP_TIERS", "10min:10:30,hourly:60:365,daily:1440:0"))
+
+
+def tier_start_sql(minutes: int, column: str = "bucket_start") -> str:
+    """SQL expression flooring a timestamp column to a tier bucket, in SQLAlchemy's storage format"""
+    minute_of_day = (
+        f"(CAST(strftime('%H', {column}) AS INTEGER) * 60 + CAST(strftime('%M', {column}) AS INTEGER))"
+    )
+    return f"strftime('%Y-%m-%d %H:%M:00.000000', {column}, '-' || ({minute_of_day} % {int(minutes)}) || ' minutes')"
+
+
+def rollup_day(
+    db: Session, target_date: date, partition: Optional[Table] = None, tiers: Sequence[RollupTier] = ROLLUP_TIERS
+) -> int:
+    """
+    Downsample a day into every tier with one INSERT ... SELECT per tier, reading the day's
+    10-minute buckets or, when `partition` is given, the raw readings in that partition.
+    New statistics are added to tier buckets already stored, so readings that arrive after their
+    day was migrated are merged in; the caller must pass each reading exactly once (the day's
+    partition is dropped in the same transaction). Returns the number of tier buckets written;
+    the caller commits.
+    """
+    start_of_day, end_of_day = day_bounds(target_date)
+    written = 0
+    for tier in tiers:
+        if partition is None:
+            source = f"""
+                SELECT property_id, sensor_type, {tier_start_sql(tier.minutes)} AS tier_start,
+                       SUM(sample_count), SUM(sum_value), MIN(min_value), MAX(max_value), SUM(sum_sq)
+                FROM realtime_buckets
+                WHERE bucket_start >= :start AND bucket_start < :end AND sample_count > 0
+                GROUP BY property_id, sensor_type, tier_start
+            """
+        else:
+            source = f"""
+                SELECT property_id, sensor_type, {tier_start_sql(tier.minutes, "timestamp")} AS tier_start,
+                       COUNT(value), SUM(value), MIN(value), MAX(value), SUM(value * value)
+                FROM "{partition.name}"
+                WHERE timestamp >= :start AND timestamp < :end AND value IS NOT NULL
+                GROUP BY property_id, sensor_type, tier_start
+            """
+        result = db.execute(
+            text(
+                f"""
+                INSERT INTO rollup_buckets
+                    (tier, property_id, sensor_type, bucket_start, sample_count, sum_value, min_value, max_value, sum_sq)
+                SELECT :tier, * FROM ({source})
+                WHERE true
+                ON CONFLICT (tier, property_id, sensor_type, bucket_start) DO UPDATE SET
+                    sample_count = sample_count + excluded.sample_count,
+                    sum_value = sum_value + excluded.sum_value,
+                    min_value = MIN(min_value, excluded.min_value),
+                    max_value = MAX(max_value, excluded.max_value),
+                    sum_sq = sum_sq + excluded.sum_sq
+                """
+            ).bindparams(bindparam("start", type_=DateTime), bindparam("end", type_=DateTime)),
+            {"tier": tier.name, "start": start_of_day, "end": end_of_day},
+        )
+        written += result.rowcount
+    return written
+
+
+def expire_rollups(db: Session, today: date, tiers: Sequence[RollupTier] = ROLLUP_TIERS) -> int:
+    """Delete tier buckets older than their tier's retention. Returns the number deleted; the caller commits."""
+    deleted = 0
+    for tier in tiers:
+        if tier.retention_days is None:
+            continue
+        cutoff, _ = day_bounds(today - timedelta(days=tier.retention_days))
+        deleted += db.query(RollupBucket).filter(
+            RollupBucket.tier == tier.name,
+            RollupBucket.bucket_start < cutoff
+        ).delete(synchronize_session=False)
+    return deleted
+
+
+def archive_tier(tiers: Sequence[RollupTier] = ROLLUP_TIERS) -> RollupTier:
+    """Longest-kept tier (the coarsest of those kept forever), which holds each migrated day's sample counts"""
+    return max(tiers, key=lambda tier: (tier.retention_days is None, tier.retention_days or 0, tier.minutes))
+
+
+def day_rolled_up(db: Session, target_date: date, tier: RollupTier) -> bool:
+    """Whether a day already has buckets in a tier, i.e. was migrated before"""
+    start_of_day, end_of_day = day_bounds(target_date)
+    return db.query(RollupBucket.id).filter(
+        RollupBucket.tier == tier.name,
+        RollupBucket.bucket_start >= start_of_day,
+        RollupBucket.bucket_start < end_of_day
+    ).first() is not None
+
+
+def select_tier(
+    start: datetime, resolution_minutes: int, today: Optional[date] = None, tiers: Sequence[RollupTier] = ROLLUP_TIERS
+) -> RollupTier:
+    """
+    Coarsest tier that still holds data back to `start` and is at least as fine as the requested
+    resolution. If every tier holding the range is coarser, the finest of those is used.
+    """
+    today = today or datetime.now(GMT_PLUS_8).date()
+    start_day = local_time(start).date()
+    covering = [
+        tier for tier in tiers
+        if tier.retention_days is None or start_day >= today - timedelta(days=tier.retention_days)
+    ]
+    if not covering:
+        # Only reachable when every tier expires; fall back to the longest-lived one
+        return max(tiers, key=lambda tier: tier.retention_days)
+    fine_enough = [tier for tier in covering if tier.minutes <= resolution_minutes]
+    return fine_enough[-1] if fine_enough else covering[0]
+
+
+def _floor(timestamp: datetime, minutes: int) -> datetime:
+    minute_of_day = timestamp.hour * 60 + timestamp.minute
+    return timestamp.replace(second=0, microsecond=0) - timedelta(minutes=minute_of_day % minutes)
+
+
+def query_rollups(
+    db: Session, property_id: int, start: datetime, end: datetime, resolution_minutes: int
+) -> Dict:
+    """
+    Statistics per sensor and tier bucket over [start, end) at the coarsest tier satisfying the
+    resolution. Days not migrated yet are read from the 10-minute realtime buckets and folded
+    into the same tier buckets; a day's realtime buckets are ignored once it is in the tiers.
+    """
+    start, end = local_time(start), local_time(end)
+    tier = select_tier(start, resolution_minutes)
+    # Tier buckets are reported whole, so the range is widened to their boundaries
+    range_start = _floor(start, tier.minutes)
+
+    totals: Dict[tuple, List[float]] = {}
+
+    def add(sensor_type, bucket_start, count, total, low, high, squares):
+        if not count:
+            return
+        key = (sensor_type, bucket_start)
+        current = totals.get(key)
+        if current is None:
+            totals[key] = [count, total, low, high, squares]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], low)
+            current[3] = max(current[3], high)
+            current[4] = None if current[4] is None or squares is None else current[4] + squares
+
+    stored = select(
+        RollupBucket.sensor_type,
+        RollupBucket.bucket_start,
+        RollupBucket.sample_count,
+        RollupBucket.sum_value,
+        RollupBucket.min_value,
+        RollupBucket.max_value,
+        RollupBucket.sum_sq
+    ).where(
+        RollupBucket.tier == tier.name,
+        RollupBucket.property_id == property_id,
+        RollupBucket.bucket_start >= range_start,
+        RollupBucket.bucket_start < end
+    )
+    # Realtime buckets of a sensor's day that is already in the archive tier are skipped: they
+    # were counted by its migration (and not deleted yet) or hold late readings that the day's
+    # next migration adds to the tiers
+    migrated = select(RollupBucket.id).where(
+        RollupBucket.tier == archive_tier().name,
+        RollupBucket.property_id == RealtimeBucket.property_id,
+        RollupBucket.sensor_type == RealtimeBucket.sensor_type,
+        RollupBucket.bucket_start >= func.date(RealtimeBucket.bucket_start),
+        RollupBucket.bucket_start < func.date(RealtimeBucket.bucket_start, "+1 day")
+    ).exists()
+    recent = select(
+        RealtimeBucket.sensor_type,
+        RealtimeBucket.bucket_start,
+        RealtimeBucket.sample_count,
+        RealtimeBucket.sum_value,
+        RealtimeBucket.min_value,
+        RealtimeBucket.max_value,
+        RealtimeBucket.sum_sq
+    ).where(
+        RealtimeBucket.property_id == property_id,
+        RealtimeBucket.bucket_start >= range_start,
+        RealtimeBucket.bucket_start < end,
+        ~migrated
+    )
+    # One statement, so a migration committing in between cannot make both halves count a day
+    for row in db.execute(union_all(stored, recent)):
+        add(
+            row.sensor_type, _floor(row.bucket_start, tier.minutes),
+            row.sample_count, row.sum_value, row.min_value, row.max_value, row.sum_sq
+        )
+
+    grouped_data = {sensor_type.value: [] for sensor_type in SensorType}
+    for (sensor_type, bucket_start), (count, total, low, high, squares) in sorted(
+        totals.items(), key=lambda item: item[0][1]
+    ):
+        mean = total / count
+        stddev = None if squares is None else math.sqrt(max(squares / count - mean * mean, 0.0))
+        grouped_data[sensor_type.value].append({
+            "time": bucket_start.isoformat(),
+            "value": round(mean, 2),
+            "count": count,
+            "min": round(low, 2),
+            "max": round(high, 2),
+            "stddev": None if stddev is None else round(stddev, 2),
+        })
+
+    return {"tier": tier.name, "minutes": tier.minutes, "data": grouped_data}
@@ -0,0 +1,236 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta, date, timezone
+from sqlalchemy.orm import Session
+from sqlalchemy import Date, DateTime, Integer, Table, bindparam, cast, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import RealtimeBucket, SensorType
+from realtime_partitions import existing_partition
+
+# GMT+8 timezone
+GMT_PLUS_8 = timezone(timedelta(hours=8))
+
+# 24 hours × 6 ten-minute intervals per hour
+BUCKET_MINUTES = 10
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+
+# (property_id, sensor_type, value, timestamp)
+ReadingTuple = Tuple[int, SensorType, float, datetime]
+
+
+def local_time(timestamp: Optional[datetime] = None) -> datetime:
+    """Return the timestamp in GMT+8; naive timestamps are taken to already be GMT+8 wall-clock time"""
+    if timestamp is None:
+        return datetime.now(GMT_PLUS_8)
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=GMT_PLUS_8)
+    return timestamp.astimezone(GMT_PLUS_8)
+
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """Floor a timestamp to the start of its 10-minute interval"""
+    return timestamp.replace(
+        minute=timestamp.minute - timestamp.minute % BUCKET_MINUTES, second=0, microsecond=0
+    )
+
+
+def bucket_index(timestamp: datetime) -> int:
+    """10-minute bucket index (0-143) of a timestamp within its day"""
+    return (timestamp.hour * 60 + timestamp.minute) // BUCKET_MINUTES
+
+
+def bucket_index_expr(timestamp_column):
+    """SQL expression mapping a stored timestamp to its 10-minute bucket index (0-143) within the day"""
+    minutes = (
+        cast(func.strftime('%H', timestamp_column), Integer) * 60
+        + cast(func.strftime('%M', timestamp_column), Integer)
+    )
+    return minutes // BUCKET_MINUTES
+
+
+def day_bounds(target_date: date):
+    """Start and end of a GMT+8 day"""
+    start_of_day = datetime.combine(target_date, datetime.min.time(), tzinfo=GMT_PLUS_8)
+    return start_of_day, start_of_day + timedelta(days=1)
+
+
+def empty_day_series() -> List[Dict]:
+    """144 data points for a day, all without a value yet"""
+    return [{"time": index / 6.0, "value": None, "count": 0} for index in range(BUCKETS_PER_DAY)]
+
+
+def upsert_buckets(db: Session, readings: Iterable[ReadingTuple]) -> None:
+    """
+    Fold readings into their 10-minute buckets. Readings are pre-aggregated per bucket
+    and merged with a single upsert; the caller commits together with the raw rows.
+    """
+    pending: Dict[Tuple[int, SensorType, datetime], Dict] = {}
+    for property_id, sensor_type, value, timestamp in readings:
+        key = (property_id, sensor_type, bucket_start(local_time(timestamp)))
+        bucket = pending.get(key)
+        if bucket is None:
+            pending[key] = {
+                "property_id": property_id,
+                "sensor_type": sensor_type,
+                "bucket_start": key[2],
+                "sample_count": 1,
+                "sum_value": value,
+                "min_value": value,
+                "max_value": value,
+                "sum_sq": value * value,
+            }
+        else:
+            bucket["sample_count"] += 1
+            bucket["sum_value"] += value
+            bucket["min_value"] = min(bucket["min_value"], value)
+            bucket["max_value"] = max(bucket["max_value"], value)
+            bucket["sum_sq"] += value * value
+
+    if not pending:
+        return
+
+    stmt = sqlite_insert(RealtimeBucket)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["property_id", "sensor_type", "bucket_start"],
+        set_={
+            "sample_count": RealtimeBucket.sample_count + stmt.excluded.sample_count,
+            "sum_value": RealtimeBucket.sum_value + stmt.excluded.sum_value,
+            "min_value": func.min(RealtimeBucket.min_value, stmt.excluded.min_value),
+            "max_value": func.max(RealtimeBucket.max_value, stmt.excluded.max_value),
+            "sum_sq": RealtimeBucket.sum_sq + stmt.excluded.sum_sq,
+        },
+    )
+    db.execute(stmt, list(pending.values()))
+
+
+def rebuild_day_buckets(db: Session, target_date: date) -> int:
+    """
+    Recompute a day's buckets from its raw realtime partition in a single GROUP BY.
+    Used at startup so readings written before the rollup existed are covered.
+    """
+    start_of_day, end_of_day = day_bounds(target_date)
+    partition = existing_partition(db, target_date)
+
+    rows = []
+    if partition is not None:
+        index = bucket_index_expr(partition.c.timestamp).label('bucket_index')
+        rows = db.query(
+            partition.c.property_id,
+            partition.c.sensor_type,
+            index,
+            func.count(partition.c.value).label('sample_count'),
+            func.sum(partition.c.value).label('sum_value'),
+            func.min(partition.c.value).label('min_value'),
+            func.max(partition.c.value).label('max_value'),
+            func.sum(partition.c.value * partition.c.value).label('sum_sq')
+        ).group_by(
+            partition.c.property_id,
+            partition.c.sensor_type,
+            index
+        ).all()
+
+    db.query(RealtimeBucket).filter(
+        RealtimeBucket.bucket_start >= start_of_day,
+        RealtimeBucket.bucket_start < end_of_day
+    ).delete(synchronize_session=False)
+
+    buckets = [
+        {
+            "property_id": row.property_id,
+            "sensor_type": row.sensor_type,
+            "bucket_start": start_of_day + timedelta(minutes=row.bucket_index * BUCKET_MINUTES),
+            "sample_count": row.sample_count,
+            "sum_value": row.sum_value,
+            "min_value": row.min_value,
+            "max_value": row.max_value,
+            "sum_sq": row.sum_sq,
+        }
+        for row in rows
+        if row.sample_count and 0 <= row.bucket_index < BUCKETS_PER_DAY
+    ]
+    if buckets:
+        db.execute(sqlite_insert(RealtimeBucket), buckets)
+    return len(buckets)
+
+
+def day_bucket_averages(db: Session, property_id: int, target_date: date) -> Dict[str, List[Dict]]:
+    """
+    Get 10-minute interval averages for every sensor of a property on the given day.
+    Reads at most 144 rollup rows per sensor; intervals without data are kept with a null value.
+    Each point also carries its sample count, so clients can fold live readings into the averages.
+    """
+    start_of_day, end_of_day = day_bounds(target_date)
+
+    rows = db.query(
+        RealtimeBucket.sensor_type,
+        RealtimeBucket.bucket_start,
+        RealtimeBucket.sample_count,
+        RealtimeBucket.sum_value
+    ).filter(
+        RealtimeBucket.property_id == property_id,
+        RealtimeBucket.bucket_start >= start_of_day,
+        RealtimeBucket.bucket_start < end_of_day
+    ).all()
+
+    grouped_data = {sensor_type.value: empty_day_series() for sensor_type in SensorType}
+    for row in rows:
+        if not row.sample_count:
+            continue
+        point = grouped_data[row.sensor_type.value][bucket_index(row.bucket_start)]
+        point["value"] = round(row.sum_value / row.sample_count, 2)
+        point["count"] = row.sample_count
+
+    return grouped_data
+
+
+def upsert_day_averages(db: Session, target_date: date, counts_tier: str, partition: Optional[Table] = None) -> int:
+    """
+    Write a day's average per (property, sensor) into historical readings with one
+    INSERT ... SELECT ... GROUP BY over its 10-minute buckets or, when `partition` is given, over
+    the raw readings in that partition.
+    The new samples are merged with those already folded into the `counts_tier` rollup tier for
+    the day, so readings that arrive after their day was migrated adjust the stored average
+    instead of replacing it. Call before the day is rolled up into that tier. Stored averages
+    without sample counts in the tier (e.g. bulk-loaded days) are left unchanged, whichever source
+    is read. Returns the number of rows written; the caller commits.
+    """
+    start_of_day, end_of_day = day_bounds(target_date)
+    if partition is None:
+        source = """
+            SELECT property_id, sensor_type, SUM(sample_count) AS samples, SUM(sum_value) AS total
+            FROM realtime_buckets
+            WHERE bucket_start >= :start AND bucket_start < :end AND sample_count > 0
+            GROUP BY property_id, sensor_type
+        """
+    else:
+        source = f"""
+            SELECT property_id, sensor_type, COUNT(value) AS samples, SUM(value) AS total
+            FROM "{partition.name}"
+            WHERE value IS NOT NULL
+            GROUP BY property_id, sensor_type
+        """
+
+    result = db.execute(
+        text(
+            f"""
+            INSERT INTO historical_readings (property_id, date, sensor_type, avg_value)
+            SELECT new.property_id, :date, new.sensor_type,
+                   ROUND((COALESCE(prior.total, 0) + new.total) / (COALESCE(prior.samples, 0) + new.samples), 2)
+            FROM ({source}) AS new
+            LEFT JOIN (
+                SELECT property_id, sensor_type, SUM(sample_count) AS samples, SUM(sum_value) AS total
+                FROM rollup_buckets
+                WHERE tier = :tier AND bucket_start >= :start AND bucket_start < :end
+                GROUP BY property_id, sensor_type
+            ) AS prior ON prior.property_id = new.property_id AND prior.sensor_type = new.sensor_type
+            WHERE prior.samples IS NOT NULL OR NOT EXISTS (
+                SELECT 1 FROM historical_readings h
+                WHERE h.property_id = new.property_id AND h.sensor_type = new.sensor_type AND h.date = :date
+            )
+            ON CONFLICT (property_id, sensor_type, date) DO UPDATE SET avg_value = excluded.avg_value
+            """
+        ).bindparams(
+            bindparam("date", type_=Date), bindparam("start", type_=DateTime), bindparam("end", type_=DateTime)
+        ),
+        {"date": target_date, "tier": counts_tier, "start": start_of_day, "end": end_of_day},
+    )
+    return result.rowcount
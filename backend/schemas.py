@@ -87,3 +87,14 @@ class RealtimeReadingCreate(BaseModel):
     value: float
     timestamp: Optional[datetime] = None  # If not provided, backend uses current time
 
+
+class RealtimeIngestItemResult(BaseModel):
+    index: int  # Position of the reading in the submitted batch
+    accepted: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class RealtimeBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[RealtimeIngestItemResult]
@@ -1,13 +1,32 @@
 import asyncio
-import random
-from datetime import datetime, time, timezone, timedelta
-from sqlalchemy.orm import Session
-from models import RealtimeReading, SensorType, Property
-from database import SessionLocal
+import heapq
+import itertools
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from models import SensorType, Property
+from database import AsyncSessionLocal
+from ingest_buffer import ingest_buffer, IngestQueueFull
+from metrics import metrics
 
 # GMT+8 timezone
 GMT_PLUS_8 = timezone(timedelta(hours=8))
 
+# Seconds between reloads of the property list
+SIMULATOR_PROPERTY_REFRESH = float(os.environ.get("SIMULATOR_PROPERTY_REFRESH", "30"))
+# Properties with real readings within this many seconds are not simulated
+REAL_DATA_GRACE_SECONDS = 60
+
+TICK_DURATION = metrics.histogram(
+    "simulator_tick_duration_seconds", "Time to generate and queue one tick of simulated readings"
+)
+TICK_LAG = metrics.histogram(
+    "simulator_tick_lag_seconds", "How late the simulator loop wakes up behind the next due readings"
+)
+
 class SensorSimulator:
     """Simulates realistic sensor readings for all properties with different sample rates"""
     
@@ -113,10 +132,45 @@ class SensorSimulator:
         },
     ]
     
-    def __init__(self):
+    # Profile keys holding the (min, max) day and night ranges of each sensor
+    PROFILE_RANGES = {
+        SensorType.TEMPERATURE: ("temp_day", "temp_night"),
+        SensorType.HUMIDITY: ("humidity", "humidity"),
+        SensorType.LIGHT: ("light_day", "light_night"),
+        SensorType.SOUND: ("sound_day", "sound_night"),
+        SensorType.AIR_QUALITY: ("aq", "aq"),
+    }
+    
+    def __init__(self, profiles: Optional[List[Dict]] = None, sample_rates: Optional[Dict[SensorType, float]] = None):
+        """
+        `profiles` replaces PROPERTY_PROFILES (property id N uses profile N - 1, cycling) and
+        `sample_rates` replaces SAMPLE_RATES, e.g. for the load generator's synthetic fleets
+        """
         self.running = False
-        self.last_readings = {}  # Store last reading time for each property and sensor type
         self.last_real_ingestion = {} # Store timestamp of last real ingestion per property
+        self.sensors: List[SensorType] = list(SensorType)
+        self.profiles = profiles or self.PROPERTY_PROFILES
+        # Seconds between readings of each sensor
+        self.sample_rates: Dict[SensorType, float] = dict(sample_rates or self.SAMPLE_RATES)
+        self._rates = np.array([self.sample_rates[sensor_type] for sensor_type in self.sensors], dtype=float)
+        # Range bounds indexed by [is_night, profile, sensor]; properties past the last profile cycle through them
+        self._low, self._high = self._profile_arrays()
+        self._rng = np.random.default_rng()
+        # Heap of (due_time, sequence, sensor_index, property_ids): each cohort is every property
+        # whose reading of one sensor falls due at the same time
+        self._schedule: List[Tuple[float, int, int, np.ndarray]] = []
+        self._sequence = itertools.count()
+        self._property_ids = np.empty(0, dtype=np.int64)
+        self._stats = {"ticks": 0, "readings": 0, "dropped_readings": 0, "max_lag_seconds": 0.0}
+
+    def _profile_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        shape = (2, len(self.profiles), len(self.sensors))
+        low, high = np.empty(shape), np.empty(shape)
+        for profile_index, profile in enumerate(self.profiles):
+            for sensor_index, sensor_type in enumerate(self.sensors):
+                for night, key in enumerate(self.PROFILE_RANGES[sensor_type]):
+                    low[night, profile_index, sensor_index], high[night, profile_index, sensor_index] = profile[key]
+        return low, high
 
     def record_real_ingestion(self, property_id: int):
         """Record that a real reading was received for this property"""
@@ -127,92 +181,135 @@ class SensorSimulator:
         current_hour = datetime.now(GMT_PLUS_8).hour
         return 6 <= current_hour < 18
     
-    def generate_reading(self, property_id: int, sensor_type: SensorType) -> float:
-        """Generate a realistic sensor reading using normal distribution"""
-        profile = self.PROPERTY_PROFILES[property_id - 1]
-        is_day = self.is_day_time()
-        
-        # Get ranges based on sensor type and time of day
-        if sensor_type == SensorType.TEMPERATURE:
-            min_val, max_val = profile["temp_day"] if is_day else profile["temp_night"]
-        elif sensor_type == SensorType.HUMIDITY:
-            min_val, max_val = profile["humidity"]
-        elif sensor_type == SensorType.LIGHT:
-            min_val, max_val = profile["light_day"] if is_day else profile["light_night"]
-        elif sensor_type == SensorType.SOUND:
-            min_val, max_val = profile["sound_day"] if is_day else profile["sound_night"]
-        elif sensor_type == SensorType.AIR_QUALITY:
-            min_val, max_val = profile["aq"]
-        else:
-            return 0.0
-        
-        # Generate value using normal distribution
-        # Mean is the center of the range, std is range/6 (covers 99.7% within range)
-        mean = (min_val + max_val) / 2
-        std = (max_val - min_val) / 6
-        
-        # Generate normal distribution value
-        value = random.gauss(mean, std)
-        
-        # Ensure value stays within bounds
-        value = max(min_val, min(max_val, value))
-        
-        return round(value, 2)
-    
+    def generate_values(self, property_ids: np.ndarray, sensor_indexes: np.ndarray, is_day: bool) -> np.ndarray:
+        """
+        Realistic readings for many (property, sensor) pairs in one normal draw.
+        Mean is the center of the profile range, std is range/6 (covers 99.7% within range),
+        and values are clipped to the range.
+        """
+        profile_indexes = (property_ids - 1) % len(self.profiles)
+        night = 0 if is_day else 1
+        low = self._low[night, profile_indexes, sensor_indexes]
+        high = self._high[night, profile_indexes, sensor_indexes]
+        values = self._rng.normal((low + high) / 2, (high - low) / 6)
+        return np.round(np.clip(values, low, high), 2)
+
+    def schedule(self, property_ids: np.ndarray, now: float) -> None:
+        """
+        Schedule every sensor of the given properties. Each sensor reads right away, and later
+        readings are spread over its sample interval in whole seconds, so slow sensors of a
+        large fleet do not all fall due at once.
+        """
+        for sensor_index, rate in enumerate(self._rates):
+            offsets = self._rng.integers(0, max(int(np.ceil(rate)), 1), size=len(property_ids))
+            for offset in np.unique(offsets):
+                # Due one interval before its phase: read now, next at now + offset
+                heapq.heappush(self._schedule, (
+                    now + float(offset) - rate, next(self._sequence), sensor_index, property_ids[offsets == offset]
+                ))
+
+    def set_properties(self, property_ids: List[int], now: float) -> None:
+        """Follow the current property list: schedule new properties and drop removed ones"""
+        current = np.array(sorted(property_ids), dtype=np.int64)
+        if np.array_equal(current, self._property_ids):
+            return
+        removed = np.setdiff1d(self._property_ids, current)
+        if len(removed):
+            self._schedule = [
+                (due, sequence, sensor_index, ids[~np.isin(ids, removed)])
+                for due, sequence, sensor_index, ids in self._schedule
+            ]
+            self._schedule = [entry for entry in self._schedule if len(entry[3])]
+            heapq.heapify(self._schedule)
+        added = np.setdiff1d(current, self._property_ids)
+        if len(added):
+            self.schedule(added, now)
+        self._property_ids = current
+
+    def due_readings(self, now: float) -> List[Tuple[int, SensorType, float, datetime]]:
+        """Pop every cohort due by `now`, reschedule it and generate its readings in one draw"""
+        property_batches, sensor_batches = [], []
+        while self._schedule and self._schedule[0][0] <= now:
+            due, _, sensor_index, property_ids = heapq.heappop(self._schedule)
+            rate = self._rates[sensor_index]
+            # Keep to the wall-clock grid; intervals missed while behind are skipped, not replayed
+            next_due = due + rate
+            if next_due <= now:
+                next_due += rate * np.ceil((now - next_due) / rate + 1e-9)
+            heapq.heappush(self._schedule, (next_due, next(self._sequence), sensor_index, property_ids))
+            property_batches.append(property_ids)
+            sensor_batches.append(np.full(len(property_ids), sensor_index))
+        if not property_batches:
+            return []
+
+        property_ids = np.concatenate(property_batches)
+        sensor_indexes = np.concatenate(sensor_batches)
+        # Properties with recent real data are left to their real sensors
+        real = [pid for pid, last in self.last_real_ingestion.items() if now - last < REAL_DATA_GRACE_SECONDS]
+        if real:
+            keep = ~np.isin(property_ids, real)
+            property_ids, sensor_indexes = property_ids[keep], sensor_indexes[keep]
+
+        values = self.generate_values(property_ids, sensor_indexes, self.is_day_time())
+        timestamp = datetime.now(GMT_PLUS_8)
+        sensors = self.sensors
+        return [
+            (property_id, sensors[sensor_index], value, timestamp)
+            for property_id, sensor_index, value in zip(property_ids.tolist(), sensor_indexes.tolist(), values.tolist())
+        ]
+
+    def next_due(self) -> Optional[float]:
+        return self._schedule[0][0] if self._schedule else None
+
     async def simulate_sensors(self):
-        """Background task to continuously generate sensor readings with different sample rates"""
+        """Background task generating sensor readings of every property at each sensor's sample rate"""
         print(f"Starting sensor simulation with variable sample rates (GMT+8)...")
         self.running = True
-        
-        # Initialize last reading times per property and sensor type
-        # Set to 0 to force immediate generation on first run
-        for property_id in range(1, 12):
-            self.last_readings[property_id] = {}
-            for sensor_type in SensorType:
-                self.last_readings[property_id][sensor_type] = 0
+        refreshed_at = 0.0
+        wake_at: Optional[float] = None
         
         while self.running:
-            db = SessionLocal()
             try:
-                current_time = datetime.now().timestamp()
-                properties = db.query(Property).all()
-                
-                for property in properties:
-                    # Check if we have received real data recently (within last 60 seconds)
-                    last_real = self.last_real_ingestion.get(property.id, 0)
-                    if current_time - last_real < 60:
-                        continue # Skip simulation for this property, prefer real data
-
-                    for sensor_type in SensorType:
-                        # Check if it's time to generate a reading for this property's sensor
-                        time_since_last = current_time - self.last_readings[property.id][sensor_type]
-                        sample_rate = self.SAMPLE_RATES[sensor_type]
-                        
-                        if time_since_last >= sample_rate:
-                            value = self.generate_reading(property.id, sensor_type)
-                            
-                            # Use GMT+8 timezone
-                            reading = RealtimeReading(
-                                property_id=property.id,
-                                sensor_type=sensor_type,
-                                value=value,
-                                timestamp=datetime.now(GMT_PLUS_8)
-                            )
-                            db.add(reading)
-                            
-                            # Update last reading time for this specific property and sensor
-                            self.last_readings[property.id][sensor_type] = current_time
-                
-                db.commit()
+                now = time.time()
+                if wake_at is not None:
+                    # How far the loop wakes up behind the next due reading
+                    lag = max(now - wake_at, 0.0)
+                    self._stats["max_lag_seconds"] = max(self._stats["max_lag_seconds"], lag)
+                    TICK_LAG.observe(lag)
+                if now - refreshed_at >= SIMULATOR_PROPERTY_REFRESH:
+                    async with AsyncSessionLocal() as db:
+                        property_ids = (await db.scalars(select(Property.id))).all()
+                    self.set_properties(property_ids, now)
+                    refreshed_at = now
+
+                tick_started = time.perf_counter()
+                generated = self.due_readings(now)
+                if generated:
+                    self._stats["ticks"] += 1
+                    self._stats["readings"] += len(generated)
+                    # Queue this tick's readings for the ingest writer (one Core executemany per flush)
+                    try:
+                        ingest_buffer.submit(generated)
+                    except IngestQueueFull as e:
+                        self._stats["dropped_readings"] += len(generated)
+                        print(f"Dropping {len(generated)} simulated readings: {e}")
+                    TICK_DURATION.observe(time.perf_counter() - tick_started)
                 
             except Exception as e:
                 print(f"Error in sensor simulation: {e}")
-                db.rollback()
-            finally:
-                db.close()
             
-            # Sleep for the smallest sample rate (1 second for sound)
-            await asyncio.sleep(1)
+            # Sleep until the next cohort falls due (at most a second, to notice new properties and stop)
+            next_due = self.next_due()
+            delay = 1.0 if next_due is None else min(max(next_due - time.time(), 0.0), 1.0)
+            wake_at = next_due if next_due is not None and next_due - time.time() <= 1.0 else None
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self._stats,
+            "properties": len(self._property_ids),
+            "scheduled_cohorts": len(self._schedule),
+        }
     
     def stop(self):
         """Stop the sensor simulation"""
@@ -221,4 +318,3 @@ class SensorSimulator:
 
 # Global simulator instance
 simulator = SensorSimulator()
-
@@ -4,8 +4,9 @@ Run this once to set up the new database structure
 """
 import os
 from database import engine, Base, SessionLocal
-from models import Property, CustomerProfile, SensorReading, RealtimeReading, HistoricalReading
+from models import Property, CustomerProfile, SensorReading, HistoricalReading
 from seed_data import seed_database
+from migrations import run_migrations
 
 def setup_database():
     """Set up database with new schema"""
@@ -17,7 +18,8 @@ def setup_database():
     # Create all tables (will create new tables if they don't exist)
     print("\n1. Creating/updating database tables...")
     Base.metadata.create_all(bind=engine)
-    print("   ✓ Tables created/updated")
+    schema_version = run_migrations(engine)
+    print(f"   ✓ Tables created/updated (schema version {schema_version})")
     
     # Seed initial data
     print("\n2. Seeding initial data...")
@@ -0,0 +1,98 @@
+"""
+SQLite storage configuration.
+Every connection gets its pragmas from an engine "connect" event. Writes go through one
+blocking writer engine holding a single connection, so in-process writers queue for it instead
+of fighting over the database lock. API reads use a pool of read-only async connections that,
+with WAL journaling, never wait for the writer.
+All settings come from the environment.
+"""
+import os
+from typing import Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+# NORMAL is durable across application crashes in WAL mode; FULL also survives power loss
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+# Negative values are KiB: 64 MiB page cache per connection
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Milliseconds a connection retries on a locked database before failing
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", "10000"))
+READ_POOL_SIZE = int(os.environ.get("READ_POOL_SIZE", "8"))
+READ_POOL_OVERFLOW = int(os.environ.get("READ_POOL_OVERFLOW", "8"))
+# Seconds a writer waits for the single write connection (a day migration can hold it a while)
+WRITER_POOL_TIMEOUT = float(os.environ.get("WRITER_POOL_TIMEOUT", "120"))
+
+
+def connection_pragmas(read_only: bool = False) -> Dict[str, object]:
+    pragmas = {
+        "busy_timeout": SQLITE_BUSY_TIMEOUT,
+        "synchronous": SQLITE_SYNCHRONOUS,
+        "cache_size": SQLITE_CACHE_SIZE,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "temp_store": "MEMORY",
+    }
+    if read_only:
+        pragmas["query_only"] = "ON"
+    else:
+        # The journal mode is stored in the database file; the writer sets it for everyone
+        pragmas = {"journal_mode": SQLITE_JOURNAL_MODE, **pragmas}
+    return pragmas
+
+
+def configure_connections(engine: Engine, read_only: bool = False) -> None:
+    """Apply the pragmas to every new DBAPI connection of a (sync or async-backing) engine"""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = connection_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+def create_writer_engine(url: str) -> Engine:
+    """Blocking engine with exactly one connection, shared by every writer in the process"""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=WRITER_POOL_TIMEOUT,
+    )
+    configure_connections(engine)
+    return engine
+
+
+def create_reader_engine(url: str) -> AsyncEngine:
+    """Pooled async engine whose connections refuse to write"""
+    # aiosqlite defaults to opening a connection per checkout; keep a pool of them instead
+    engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_POOL_OVERFLOW,
+    )
+    configure_connections(engine.sync_engine, read_only=True)
+    return engine
+
+
+def storage_settings() -> Dict[str, object]:
+    return {
+        "journal_mode": SQLITE_JOURNAL_MODE,
+        "synchronous": SQLITE_SYNCHRONOUS,
+        "cache_size": SQLITE_CACHE_SIZE,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "busy_timeout_ms": SQLITE_BUSY_TIMEOUT,
+        "read_pool_size": READ_POOL_SIZE,
+        "read_pool_overflow": READ_POOL_OVERFLOW,
+        "writer_pool_timeout": WRITER_POOL_TIMEOUT,
+    }
@@ -0,0 +1,147 @@
+"""
+Concurrency check for the storage configuration.
+Runs sustained writes through the writer engine (ingest batches plus periodic rollup rebuilds)
+while async readers query the same database through the read-only pool, and fails if any
+statement hits "database is locked".
+
+Usage:
+    python storage_check.py [--seconds 10] [--readers 16] [--journal-mode WAL]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--seconds", type=float, default=10.0, help="how long to keep writing")
+parser.add_argument("--readers", type=int, default=16, help="concurrent async readers")
+parser.add_argument("--properties", type=int, default=20)
+parser.add_argument("--journal-mode", default=None, help="override SQLITE_JOURNAL_MODE (e.g. DELETE to compare)")
+args = parser.parse_args()
+
+# Configure storage before anything creates the engines
+_tmp_dir = tempfile.mkdtemp(prefix="storage_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'storage_check.db')}"
+if args.journal_mode:
+    os.environ["SQLITE_JOURNAL_MODE"] = args.journal_mode
+
+import asyncio  # noqa: E402
+from datetime import datetime  # noqa: E402
+from sqlalchemy import func, select, text  # noqa: E402
+
+from database import Base, engine, AsyncSessionLocal, SessionLocal  # noqa: E402
+from models import Property, RealtimeBucket, SensorType  # noqa: E402
+from ingest import write_readings  # noqa: E402
+from rollups import GMT_PLUS_8, day_bucket_averages, rebuild_day_buckets  # noqa: E402
+from storage import storage_settings  # noqa: E402
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {"writes": 0, "rebuilds": 0, "reads": 0, "locked": 0, "errors": 0}
+
+    def add(self, name: str, amount: int = 1):
+        with self.lock:
+            self.values[name] += amount
+
+
+counters = Counters()
+
+
+def record_error(e: Exception):
+    if "database is locked" in str(e):
+        counters.add("locked")
+    else:
+        counters.add("errors")
+        print(f"Unexpected error: {e}")
+
+
+def ingest_writer(stop: threading.Event):
+    """Small batches in quick succession, like the ingest buffer under load"""
+    while not stop.wait(0.01):
+        db = SessionLocal()
+        try:
+            batch = [
+                (random.randint(1, args.properties), random.choice(list(SensorType)), random.uniform(0, 100), datetime.now(GMT_PLUS_8))
+                for _ in range(200)
+            ]
+            write_readings(db, batch)
+            counters.add("writes", len(batch))
+        except Exception as e:
+            record_error(e)
+        finally:
+            db.close()
+
+
+def rollup_writer(stop: threading.Event):
+    """Heavier transactions now and then, like the day migration"""
+    while not stop.wait(0.5):
+        db = SessionLocal()
+        try:
+            rebuild_day_buckets(db, datetime.now(GMT_PLUS_8).date())
+            db.commit()
+            counters.add("rebuilds")
+        except Exception as e:
+            db.rollback()
+            record_error(e)
+        finally:
+            db.close()
+
+
+async def reader(deadline: float):
+    today = datetime.now(GMT_PLUS_8).date()
+    while time.monotonic() < deadline:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(day_bucket_averages, random.randint(1, args.properties), today)
+                await db.scalar(select(func.count(RealtimeBucket.id)))
+            counters.add("reads")
+        except Exception as e:
+            record_error(e)
+        await asyncio.sleep(0)
+
+
+async def run_readers():
+    deadline = time.monotonic() + args.seconds
+    await asyncio.gather(*(reader(deadline) for _ in range(args.readers)))
+
+
+def main() -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all(Property(id=i, name=f"Property {i}", address="", description="", image_url="") for i in range(1, args.properties + 1))
+    db.commit()
+    db.close()
+
+    with engine.connect() as conn:
+        journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+    print(f"Storage settings: {storage_settings()} (database journal_mode={journal_mode})")
+
+    stop = threading.Event()
+    writers = [threading.Thread(target=ingest_writer, args=(stop,)), threading.Thread(target=rollup_writer, args=(stop,))]
+    for writer in writers:
+        writer.start()
+    started = time.monotonic()
+    try:
+        asyncio.run(run_readers())
+    finally:
+        stop.set()
+        for writer in writers:
+            writer.join()
+    elapsed = time.monotonic() - started
+
+    values = counters.values
+    print(
+        f"{elapsed:.1f}s: {values['writes']} readings written ({values['writes'] / elapsed:.0f}/s), "
+        f"{values['rebuilds']} rollup rebuilds, {values['reads']} reads ({values['reads'] / elapsed:.0f}/s)"
+    )
+    print(f"'database is locked' errors: {values['locked']}, other errors: {values['errors']}")
+    return 1 if values["locked"] or values["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
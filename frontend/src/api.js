@@ -26,11 +26,18 @@ export const getCustomerProfiles = async () => {
   return response.data;
 };
 
-export const getPropertyComfort = async (propertyId, customerType = 'Working Adult') => {
+// Comfort analysis and its ETag. Given the ETag of the analysis already shown, data is null
+// when it is unchanged (the server answers 304 without recomputing anything).
+export const getPropertyComfort = async (propertyId, customerType = 'Working Adult', etag = null) => {
   const response = await api.get(`/properties/${propertyId}/comfort`, {
-    params: { customer_type: customerType }
+    params: { customer_type: customerType },
+    headers: etag ? { 'If-None-Match': etag } : {},
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
   });
-  return response.data;
+  return {
+    data: response.status === 304 ? null : response.data,
+    etag: response.headers.etag || etag,
+  };
 };
 
 export const getLatestReadings = async (propertyId) => {
@@ -39,19 +46,82 @@ export const getLatestReadings = async (propertyId) => {
 };
 
 export const get24HourHistory = async (propertyId) => {
-  const response = await api.get(`/properties/${propertyId}/history/24hour`);
+  const response = await api.get(`/properties/${propertyId}/history/24hour`, {
+    params: { format: 'columnar' }
+  });
   return response.data;
 };
 
 export const getMonthlyHistory = async (propertyId) => {
-  const response = await api.get(`/properties/${propertyId}/history/monthly`);
+  const response = await api.get(`/properties/${propertyId}/history/monthly`, {
+    params: { format: 'columnar' }
+  });
   return response.data;
 };
 
 export const getYearlyHistory = async (propertyId) => {
-  const response = await api.get(`/properties/${propertyId}/history/yearly`);
+  const response = await api.get(`/properties/${propertyId}/history/yearly`, {
+    params: { format: 'columnar' }
+  });
   return response.data;
 };
 
+// Live updates for a property over Server-Sent Events. Every component subscribed to a property
+// shares one EventSource, opened by the first subscriber and closed when the last one leaves.
+// Calls onEvent(type, data) for "latest", "readings" and "day_migrated" events, and with
+// "reconnected" when the stream comes back after a drop (events in between were missed).
+// A late subscriber gets the latest values seen so far as a "latest" event. Returns a function
+// that unsubscribes.
+const STREAM_EVENTS = ['latest', 'readings', 'day_migrated'];
+const propertyStreams = new Map();
+
+const openPropertyStream = (propertyId) => {
+  const stream = {
+    source: new EventSource(`${API_BASE_URL}/properties/${propertyId}/stream`),
+    listeners: new Set(),
+    latest: null,
+    opened: false,
+  };
+  const dispatch = (type, data) => stream.listeners.forEach((listener) => listener(type, data));
+
+  stream.source.addEventListener('open', () => {
+    if (stream.opened) dispatch('reconnected', { property_id: propertyId });
+    stream.opened = true;
+  });
+  STREAM_EVENTS.forEach((type) => {
+    stream.source.addEventListener(type, (event) => {
+      const data = JSON.parse(event.data);
+      if (type === 'latest') {
+        stream.latest = { ...data.latest };
+      } else if (type === 'readings') {
+        stream.latest = { ...stream.latest };
+        Object.entries(data.latest).forEach(([sensorType, reading]) => {
+          const current = stream.latest[sensorType];
+          if (!current || reading.timestamp >= current.timestamp) stream.latest[sensorType] = reading;
+        });
+      }
+      dispatch(type, data);
+    });
+  });
+  propertyStreams.set(propertyId, stream);
+  return stream;
+};
+
+export const subscribePropertyStream = (propertyId, onEvent) => {
+  const stream = propertyStreams.get(propertyId) || openPropertyStream(propertyId);
+  stream.listeners.add(onEvent);
+  if (stream.latest) {
+    onEvent('latest', { event: 'latest', property_id: propertyId, latest: { ...stream.latest } });
+  }
+
+  return () => {
+    stream.listeners.delete(onEvent);
+    if (stream.listeners.size === 0) {
+      stream.source.close();
+      propertyStreams.delete(propertyId);
+    }
+  };
+};
+
 export default api;
 
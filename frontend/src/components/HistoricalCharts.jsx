@@ -1,15 +1,39 @@
 import React, { useState, useEffect } from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
-import { get24HourHistory, getMonthlyHistory, getYearlyHistory } from '../api';
+import { get24HourHistory, getMonthlyHistory, getYearlyHistory, subscribePropertyStream } from '../api';
+
+// Today's date in GMT+8, the timezone of the backend's day boundaries and reading timestamps
+const todayGmt8 = () => new Date(Date.now() + 8 * 3600 * 1000).toISOString().slice(0, 10);
+
+// Fold pushed readings into the 24-hour columnar payload: each reading updates the running
+// average of its 10-minute interval using the interval's sample count
+const applyReadings = (data, readings, day) => {
+  if (!data.sensors || !data.counts) return data;
+  const sensors = { ...data.sensors };
+  const counts = { ...data.counts };
+  readings.forEach(({ sensor_type: sensorType, value, timestamp }) => {
+    if (value === null || value === undefined || !sensors[sensorType] || timestamp.slice(0, 10) !== day) return;
+    const index = Math.floor((Number(timestamp.slice(11, 13)) * 60 + Number(timestamp.slice(14, 16))) / 10);
+    if (sensors[sensorType] === data.sensors[sensorType]) {
+      sensors[sensorType] = [...sensors[sensorType]];
+      counts[sensorType] = [...counts[sensorType]];
+    }
+    const count = counts[sensorType][index] || 0;
+    const average = sensors[sensorType][index] ?? 0;
+    counts[sensorType][index] = count + 1;
+    sensors[sensorType][index] = Math.round(((average * count + value) / (count + 1)) * 100) / 100;
+  });
+  return { ...data, sensors, counts };
+};
 
 const HistoricalCharts = ({ propertyId }) => {
   const [chartView, setChartView] = useState('24hour'); // '24hour', 'monthly', 'yearly'
   const [chartData, setChartData] = useState({});
   const [loading, setLoading] = useState(true);
 
-  const loadData = async () => {
+  const loadData = async (showLoading = true) => {
     try {
-      setLoading(true);
+      if (showLoading) setLoading(true);
       let historyData;
       
       if (chartView === '24hour') {
@@ -24,15 +48,34 @@ const HistoricalCharts = ({ propertyId }) => {
     } catch (err) {
       console.error('Failed to load chart data:', err);
     } finally {
-      setLoading(false);
+      if (showLoading) setLoading(false);
     }
   };
 
   useEffect(() => {
+    let chartDay = todayGmt8();
     loadData();
-    // Refresh every 5 seconds for real-time updates
-    const interval = setInterval(loadData, 5000);
-    return () => clearInterval(interval);
+    // New readings are folded into today's chart as they arrive; daily averages only change when
+    // a day is migrated, and a reconnected stream may have missed readings, so those refetch
+    const closeStream = subscribePropertyStream(propertyId, (type, data) => {
+      if (type === 'day_migrated' || type === 'reconnected') {
+        chartDay = todayGmt8();
+        loadData(false);
+      } else if (type === 'readings' && chartView === '24hour') {
+        const newestDay = data.readings.reduce((day, reading) => {
+          const readingDay = reading.timestamp.slice(0, 10);
+          return readingDay > day ? readingDay : day;
+        }, chartDay);
+        if (newestDay > chartDay) {
+          // The first readings of a new day start a new chart
+          chartDay = newestDay;
+          loadData(false);
+          return;
+        }
+        setChartData((current) => applyReadings(current, data.readings, chartDay));
+      }
+    });
+    return closeStream;
   }, [propertyId, chartView]);
 
   const sensorColors = {
@@ -52,23 +95,24 @@ const HistoricalCharts = ({ propertyId }) => {
   };
 
   const formatChartData = (sensorType) => {
-    if (!chartData[sensorType] || chartData[sensorType].length === 0) {
+    // Columnar payload: one shared axis plus a value array per sensor
+    const values = chartData.sensors && chartData.sensors[sensorType];
+    if (!values || values.length === 0) {
       return [];
     }
 
     if (chartView === '24hour') {
       // For 24-hour view, use decimal time values (10-minute intervals)
       // time comes as decimal (0, 0.166, 0.333, ..., 23.833)
-      return chartData[sensorType].map(item => ({
-        time: item.time,
-        value: item.value
+      return chartData.time.map((time, index) => ({
+        time,
+        value: values[index]
       }));
     } else {
-      // For monthly/yearly views, use date
-      return chartData[sensorType].map(item => ({
-        time: item.date,
-        value: item.value
-      }));
+      // For monthly/yearly views, use date (skipping days this sensor has no average for)
+      return chartData.date
+        .map((date, index) => ({ time: date, value: values[index] }))
+        .filter(item => item.value !== null);
     }
   };
 
@@ -1,27 +1,71 @@
 import React, { useState, useEffect } from 'react';
-import { getPropertyComfort } from '../api';
+import { getPropertyComfort, subscribePropertyStream } from '../api';
+
+// Shortest interval between comfort refetches triggered by streamed readings
+const COMFORT_REFRESH_MS = 2000;
 
 const PropertyComfort = ({ propertyId, propertyName, customerType }) => {
   const [comfort, setComfort] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    let active = true;
+    let etag = null;
+    let refreshTimer = null;
+
     const loadComfort = async (showLoading = true) => {
       try {
         if (showLoading) setLoading(true);
-        const data = await getPropertyComfort(propertyId, customerType);
-        setComfort(data);
+        const result = await getPropertyComfort(propertyId, customerType, showLoading ? null : etag);
+        if (!active) return;
+        etag = result.etag;
+        if (result.data) setComfort(result.data);
       } catch (err) {
         console.error('Failed to load comfort data:', err);
       } finally {
-        if (showLoading) setLoading(false);
+        if (showLoading && active) setLoading(false);
       }
     };
 
+    // New readings change the overall score and each sensor's score, status and insight, which
+    // the server computes: refetch at most once per COMFORT_REFRESH_MS, revalidating with the ETag
+    const scheduleRefresh = () => {
+      if (refreshTimer) return;
+      refreshTimer = setTimeout(() => {
+        refreshTimer = null;
+        loadComfort(false);
+      }, COMFORT_REFRESH_MS);
+    };
+
+    // Show pushed values as the sensors' current readings right away (keeping any newer one already shown)
+    const applyLatest = (latest) => {
+      setComfort((current) => {
+        if (!current) return current;
+        const sensors = current.sensors.map((sensor) => {
+          const reading = latest[sensor.sensor_type];
+          if (!reading || (sensor.current_value_timestamp && reading.timestamp < sensor.current_value_timestamp)) {
+            return sensor;
+          }
+          return { ...sensor, current_value: reading.value, current_value_timestamp: reading.timestamp };
+        });
+        return { ...current, sensors };
+      });
+    };
+
     loadComfort(true);
-    // Refresh comfort data every 5 seconds
-    const interval = setInterval(() => loadComfort(false), 5000);
-    return () => clearInterval(interval);
+    const closeStream = subscribePropertyStream(propertyId, (type, data) => {
+      if (type === 'day_migrated' || type === 'reconnected') {
+        loadComfort(false);
+      } else if (data.latest) {
+        applyLatest(data.latest);
+        scheduleRefresh();
+      }
+    });
+    return () => {
+      active = false;
+      clearTimeout(refreshTimer);
+      closeStream();
+    };
   }, [propertyId, customerType]);
 
   if (loading) {
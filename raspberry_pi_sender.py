@@ -2,6 +2,10 @@
 """
 Raspberry Pi Sensor Data Sender
 This script reads real sensor data from a Raspberry Pi and sends it to the backend API.
+Readings are stamped on the device when sampled and collected in a local batch. A background
+thread uploads the batch as one gzip-compressed POST over a keep-alive session once it is big
+or old enough, so a slow or unreachable backend never delays sampling. Unsent readings are kept
+(up to MAX_BUFFERED_READINGS) and retried with backoff.
 
 Hardware requirements:
 - Raspberry Pi (any model with GPIO)
@@ -15,11 +19,16 @@ Install required packages:
 """
 
 import time
+import gzip
+import json
 import random
+import threading
+import uuid
 import requests
 import logging
-from datetime import datetime
-from typing import Dict, Callable
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Callable, List, Optional
 from smbus2 import SMBus, i2c_msg #
 # =============================================================================
 # CONFIGURATION - Update these values for your setup
@@ -29,6 +38,8 @@ from smbus2 import SMBus, i2c_msg #
 # If using ngrok: "https://your-ngrok-id.ngrok.io/realtime/ingest"
 # If using local network: "http://192.168.1.x:8000/realtime/ingest"
 BACKEND_URL = "http://172.20.10.3:8000/realtime/ingest"
+# Batches go to the batch endpoint next to it
+BATCH_URL = BACKEND_URL.rstrip("/") + "/batch"
 
 # Property ID for this Raspberry Pi (should be 11)
 PROPERTY_ID = 11
@@ -51,6 +62,17 @@ ENABLED_SENSORS = {
     "LIGHT": True,
 }
 
+# Upload once this many readings are waiting...
+BATCH_MAX_READINGS = 200
+# ...or once the oldest waiting reading is this many seconds old
+BATCH_MAX_AGE_SECONDS = 30
+# Readings kept while the backend is unreachable; the oldest are dropped beyond this
+MAX_BUFFERED_READINGS = 50000
+# Seconds an upload may take; only the upload thread waits for it
+REQUEST_TIMEOUT = 10
+# Retry delay after a failed upload doubles up to this many seconds
+MAX_RETRY_DELAY = 300
+
 # =============================================================================
 # LOGGING CONFIGURATION
 # =============================================================================
@@ -211,28 +233,138 @@ def read_light() -> float:
 # DATA SENDER
 # =============================================================================
 
-def send_reading(sensor_type: str, value: float) -> bool:
-    """Send a sensor reading to the backend API."""
-    payload = {
-        "property_id": PROPERTY_ID,
-        "sensor_type": sensor_type,
-        "value": value
-    }
-    
-    try:
-        response = requests.post(BACKEND_URL, json=payload, timeout=10)
-        response.raise_for_status()
-        
-        result = response.json()
-        logger.info(f"✓ Sent {sensor_type}: {value} (ID: {result['id']})")
+class BatchUploader:
+    """
+    Collects readings in memory and uploads them from a background thread.
+    A batch is sent as soon as BATCH_MAX_READINGS readings are waiting or the oldest has waited
+    BATCH_MAX_AGE_SECONDS. A failed batch is retried unchanged with exponential backoff under
+    the same Idempotency-Key, so a batch the backend committed after timing out is not stored twice.
+    """
+
+    def __init__(self, url: str = BATCH_URL):
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        self._pending: Deque[Dict] = deque()
+        self._condition = threading.Condition()
+        self._oldest: Optional[float] = None
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="batch-uploader", daemon=True)
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, sensor_type: str, value: float):
+        """Queue a reading stamped with the device's current time; never blocks on the network"""
+        reading = {
+            "property_id": PROPERTY_ID,
+            "sensor_type": sensor_type,
+            "value": value,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._condition:
+            if len(self._pending) >= MAX_BUFFERED_READINGS:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(reading)
+            if self._oldest is None:
+                # Wake the uploader so it starts timing the batch's age
+                self._oldest = time.monotonic()
+                self._condition.notify()
+            elif len(self._pending) >= BATCH_MAX_READINGS:
+                self._condition.notify()
+
+    def stop(self, timeout: float = REQUEST_TIMEOUT):
+        """Upload whatever is still waiting and stop the thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _next_batch(self) -> List[Dict]:
+        """Wait until a batch is due (or stopping) and take it off the queue"""
+        with self._condition:
+            while not self._stopping:
+                if len(self._pending) >= BATCH_MAX_READINGS:
+                    break
+                if self._oldest is not None:
+                    wait = self._oldest + BATCH_MAX_AGE_SECONDS - time.monotonic()
+                    if wait <= 0:
+                        break
+                else:
+                    wait = None
+                self._condition.wait(wait)
+            batch = [self._pending.popleft() for _ in range(min(BATCH_MAX_READINGS, len(self._pending)))]
+            self._oldest = time.monotonic() if self._pending else None
+            return batch
+
+    def _upload(self, batch: List[Dict], batch_key: str) -> bool:
+        """POST one gzip-compressed batch. Returns False if it should be retried."""
+        body = gzip.compress(json.dumps(batch, separators=(",", ":")).encode())
+        try:
+            response = self.session.post(
+                self.url, data=body, headers={"Idempotency-Key": batch_key}, timeout=REQUEST_TIMEOUT
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"✗ Failed to send {len(batch)} readings: {e}")
+            return False
+
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            logger.error(f"✗ Backend busy ({response.status_code}) for {len(batch)} readings")
+            return False
+        if response.status_code >= 400:
+            # Retrying would be rejected the same way
+            logger.error(f"✗ Backend rejected {len(batch)} readings ({response.status_code}): {response.text[:200]}")
+            return True
+
+        try:
+            result = response.json()
+            accepted, rejected, items = result["accepted"], result["rejected"], result["results"]
+        except (ValueError, KeyError, TypeError) as e:
+            # Not the batch endpoint's answer (e.g. a proxy page); the resend is safe under the same key
+            logger.error(f"✗ Unexpected response ({response.status_code}) for {len(batch)} readings: {e!r}")
+            return False
+
+        self.sent += accepted
+        logger.info(
+            f"✓ Sent {accepted} readings in {len(body)} bytes "
+            f"({rejected} rejected, {len(self._pending)} waiting)"
+        )
+        for item in items:
+            if not item["accepted"]:
+                logger.warning(f"Reading {batch[item['index']]} rejected: {item.get('error')}")
         return True
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Failed to send {sensor_type} reading: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"✗ Unexpected error sending {sensor_type}: {e}")
-        return False
+
+    def _run(self):
+        retry_delay = 1.0
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                continue
+            # Every attempt at this batch carries the same key
+            batch_key = uuid.uuid4().hex
+            while True:
+                try:
+                    uploaded = self._upload(batch, batch_key)
+                except Exception as e:
+                    logger.exception(f"✗ Unexpected error sending {len(batch)} readings: {e}")
+                    uploaded = False
+                if uploaded:
+                    retry_delay = 1.0
+                    break
+                if self._stopping:
+                    self.dropped += len(batch)
+                    return
+                logger.warning(
+                    f"Will retry {len(batch)} readings in {retry_delay:.0f}s ({len(self._pending)} more waiting)"
+                )
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopping, retry_delay)
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
 
 
 # =============================================================================
@@ -240,18 +372,14 @@ def send_reading(sensor_type: str, value: float) -> bool:
 # =============================================================================
 
 def main():
-    """Main loop to continuously read sensors and send data."""
+    """Main loop to continuously read sensors and queue their readings for upload."""
     logger.info("=" * 70)
     logger.info("Raspberry Pi Sensor Data Sender - Starting")
-    logger.info(f"Backend URL: {BACKEND_URL}")
+    logger.info(f"Backend URL: {BATCH_URL}")
     logger.info(f"Property ID: {PROPERTY_ID}")
+    logger.info(f"Batches: up to {BATCH_MAX_READINGS} readings or {BATCH_MAX_AGE_SECONDS}s, gzip-compressed")
     logger.info("=" * 70)
     
-    # Track last sent time for each sensor
-    last_sent: Dict[str, float] = {
-        sensor: 0 for sensor in SAMPLE_RATES.keys()
-    }
-    
     # Map sensor types to their reading functions
     read_functions: Dict[str, Callable[[], float]] = {
         "TEMPERATURE": read_temperature,
@@ -266,36 +394,41 @@ def main():
         if enabled:
             logger.info(f"  - {sensor} (sample rate: {SAMPLE_RATES[sensor]}s)")
     
+    if not any(ENABLED_SENSORS.values()):
+        logger.error("No sensors enabled in ENABLED_SENSORS; nothing to send")
+        return
+    
     logger.info("\nStarting data collection loop...\n")
     
+    uploader = BatchUploader()
+    uploader.start()
+    
+    # Next sample time of each sensor on the monotonic clock; advancing by the sample rate
+    # (instead of from "now") keeps each sensor on its cadence without drift
+    started = time.monotonic()
+    next_due: Dict[str, float] = {
+        sensor: started for sensor, enabled in ENABLED_SENSORS.items() if enabled
+    }
+    
     try:
         while True:
-            current_time = time.time()
+            current_time = time.monotonic()
             
-            for sensor_type, sample_rate in SAMPLE_RATES.items():
-                # Skip if sensor is disabled
-                if not ENABLED_SENSORS.get(sensor_type, False):
+            for sensor_type, due in next_due.items():
+                if current_time < due:
                     continue
                 
-                # Check if it's time to send this sensor's reading
-                time_since_last = current_time - last_sent[sensor_type]
+                try:
+                    uploader.add(sensor_type, read_functions[sensor_type]())
+                except Exception as e:
+                    logger.error(f"Error reading {sensor_type} sensor: {e}")
                 
-                if time_since_last >= sample_rate:
-                    try:
-                        # Read sensor value
-                        value = read_functions[sensor_type]()
-                        
-                        # Send to backend
-                        if send_reading(sensor_type, value):
-                            last_sent[sensor_type] = current_time
-                        else:
-                            logger.warning(f"Will retry {sensor_type} on next cycle")
-                            
-                    except Exception as e:
-                        logger.error(f"Error reading {sensor_type} sensor: {e}")
+                # Skip samples missed while a slow sensor read held the loop
+                rate = SAMPLE_RATES[sensor_type]
+                next_due[sensor_type] = due + rate * max(1, int((current_time - due) // rate) + 1)
             
-            # Sleep for the smallest interval (sound sensor at 1 second)
-            time.sleep(1)
+            # Sleep until the next sensor is due
+            time.sleep(max(0.0, min(next_due.values()) - time.monotonic()))
             
     except KeyboardInterrupt:
         logger.info("\n" + "=" * 70)
@@ -303,6 +436,9 @@ def main():
         logger.info("=" * 70)
     except Exception as e:
         logger.critical(f"Critical error in main loop: {e}", exc_info=True)
+    finally:
+        uploader.stop()
+        logger.info(f"Uploaded {uploader.sent} readings, dropped {uploader.dropped}")
 
 
 if __name__ == "__main__":